@@ -1,23 +1,29 @@
 
 from langchain_community.chat_models import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_experimental.llms.ollama_functions import OllamaFunctions
+# from langchain_experimental.llms.ollama_functions import OllamaFunctions
 # from langchain_fireworks import ChatFireworks
 # from langchain_openai import ChatOpenAI
 
 from langchain_core.pydantic_v1 import BaseModel, Field
 from typing import List, Optional
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langgraph.constants import END
 from langgraph.graph import StateGraph
 
+from quome_agentic_benchmarks.registry import AGENTS
 from quome_agentic_benchmarks.tasks.base import TaskData
-from quome_agentic_benchmarks.tools import create_api_template
-from quome_agentic_benchmarks.utils.coding import extract_code_from_llm_output, CodeInput, \
+from quome_agentic_benchmarks.utils.coding import extract_files_from_llm_output, code_files, CodeInput, \
     AllowedDockerFiles
+from quome_agentic_benchmarks.utils.llm_batch import batched
+from quome_agentic_benchmarks.utils.llm_cache import get_llm_cache
 
-_SUPPORTED_MODELS = {"llama3", "codellama"}
+# Files the app needs, with the languages of an unnamed code block that can stand in for them
+REQUIRED_FILES = {"main.py": ("python", "py"), "requirements.txt": ("txt", "text")}
+
+# Supported models, provider and task types are only declared in registry.py,
+# so unsupported pairs are skipped without importing this module
+_PLUGIN = AGENTS.get("example_ollama_agent")
+PROVIDER = _PLUGIN.provider  # Used to limit concurrent runs per provider
 
 PLAN_PROMPT = """You are an expert backend coder tasked with creating a working fast API in Python\
 Write a development plan including the endpoints needed to accomplish the user's request. \
@@ -53,12 +59,15 @@ class AgentState(TaskData):
 
 
 def agent(llm, tools, checkpointer=None):
-    if llm not in _SUPPORTED_MODELS:
-        print(f"{llm} is not supported for openai_coder_v1")
+    if not _PLUGIN.supports(llm):
+        print(f"{llm} is not supported for example_ollama_agent")
         return None
 
     #model = OllamaFunctions(model=llm, format="json", temperature=0)
-    model = ChatOllama(model=llm, temperature=0)
+    # Responses are cached on disk, see utils/llm_cache.py
+    model = ChatOllama(model=llm, temperature=0, cache=get_llm_cache())
+    # Plans only depend on the row's task, with QUOME_LLM_BATCH=on concurrent rows are batched (utils/llm_batch.py)
+    planner_model = batched(model)
 
     # TODO - Figure out tool use...
     # if tools:
@@ -79,7 +88,7 @@ def agent(llm, tools, checkpointer=None):
         # If you need to get a single promt from a list of message prompts, can use:
         # prompt = ChatPromptTemplate.from_messages(messages)
 
-        response = model.invoke(messages)
+        response = planner_model.invoke(messages)
         return {"plan": response.content}
 
     def coder_node(state: AgentState):
@@ -101,16 +110,18 @@ def agent(llm, tools, checkpointer=None):
         }
 
     def finalize_code_node(state: AgentState):
-        main_py = extract_code_from_llm_output("main.py", state["code"])
-        requirements_txt = extract_code_from_llm_output("requirements.txt", state["code"])
-        run_command = extract_code_from_llm_output("run command", state["code"])
+        extracted = extract_files_from_llm_output(state["code"])
+        run_command = extracted.labelled("run command")
+        if run_command:
+            # Not a file, keep it out of the unnamed blocks standing in for main.py / requirements.txt
+            extracted.blocks.remove(run_command)
+        files = code_files(extracted, REQUIRED_FILES)
+        for diagnostic in extracted.diagnostics:
+            print(f"finalize_code: {diagnostic}")
         task_output = CodeInput(
-            files={
-                "main.py": main_py,
-                "requirements.txt": requirements_txt,
-            },
+            files=files,
             dockerfile=AllowedDockerFiles.python,
-            run_command=run_command if run_command else "fastapi run main.py"
+            run_command=run_command.content.strip() if run_command and run_command.content.strip() else "fastapi run main.py"
         )
 
         return {
@@ -138,6 +149,8 @@ def agent(llm, tools, checkpointer=None):
 
 # https://github.com/langchain-ai/langgraph/blob/main/examples/storm/storm.ipynb
 if __name__ == '__main__':
+    from quome_agentic_benchmarks.tools import create_api_template
+
     a = agent("llama3", [create_api_template])
     resp = a.invoke({"task": "Create an API for a calendar"})
     print(resp)
@@ -1,17 +1,21 @@
 #from ._temp_langchain_overrides.ollama_functions import OllamaFunctions
 # https://github.com/langchain-ai/langgraph/blob/main/examples/reflection/reflection.ipynb
-from typing import List, Optional
+import operator
+from typing import List, Optional, Annotated
 
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph import StateGraph, END
 
+from quome_agentic_benchmarks.agents.utils import add_node_dependencies
+from quome_agentic_benchmarks.knowledge.index import get_doc_index, research_content
+from quome_agentic_benchmarks.registry import AGENTS
 from quome_agentic_benchmarks.tasks.base import TaskData
-from quome_agentic_benchmarks.tools import create_api_template
-from quome_agentic_benchmarks.utils.coding import extract_code_from_llm_output, CodeInput, \
+from quome_agentic_benchmarks.utils.coding import extract_files_from_llm_output, code_files, CodeInput, \
     AllowedDockerFiles
+from quome_agentic_benchmarks.utils.llm_batch import batched
+from quome_agentic_benchmarks.utils.llm_cache import get_llm_cache
 
 # model = ChatOllama(model="llama3")  # Doesn't work with structured output... See OllamaFunctions instead
 # model = OllamaFunctions(model="llama3", format="json", temperature=0)  # Temp 0 = less creative, more deterministic
@@ -26,7 +30,8 @@ class AgentState(TaskData):
     plan: str
     draft: str
     critique: str
-    content: List[str]
+    # Research results, appended by each research node (also lets planner and research_plan run in parallel)
+    content: Annotated[List[str], operator.add]
     # Settings
     revision_number: int
     max_revisions: int
@@ -70,18 +75,30 @@ from langchain_core.pydantic_v1 import BaseModel
 class Queries(BaseModel):
     queries: List[str]
 
-_SUPPORTED_MODELS = {"gpt-3.5-turbo"}
+# Files the app needs, with the languages of an unnamed code block that can stand in for them
+REQUIRED_FILES = {"main.py": ("python", "py"), "requirements.txt": ("txt", "text")}
+
+# Supported models, provider and task types are only declared in registry.py,
+# so unsupported pairs are skipped without importing this module
+_PLUGIN = AGENTS.get("openai_coder_v1")
+PROVIDER = _PLUGIN.provider  # Used to limit concurrent runs per provider
 
 
 def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
 
-    if llm not in _SUPPORTED_MODELS:
+    if not _PLUGIN.supports(llm):
         print(f"{llm} is not supported for openai_coder_v1")
         return None
 
-    model = ChatOpenAI(model=llm, temperature=0)
+    # Responses are cached on disk, see utils/llm_cache.py
+    model = ChatOpenAI(model=llm, temperature=0, cache=get_llm_cache())
     if tools:
         model.bind_tools(tools)
+    # The planner and research queries only depend on the row's task, with QUOME_LLM_BATCH=on concurrent rows
+    # send them as one batch (see utils/llm_batch.py)
+    planner_model = batched(model)
+    research_model = batched(model.with_structured_output(Queries))
+    doc_index = get_doc_index()  # Local docs for research, see knowledge/index.py
 
     def input_node(state: TaskData):
         return {
@@ -100,24 +117,17 @@ def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
             SystemMessage(content=PLAN_PROMPT),
             HumanMessage(content=state['task'])
         ]
-        response = model.invoke(messages)
+        response = planner_model.invoke(messages)
         return {"plan": response.content}
 
     def research_plan_node(state: AgentState):
-        queries = model.with_structured_output(Queries).invoke([
+        queries = research_model.invoke([
             SystemMessage(content=RESEARCH_PLAN_PROMPT),
             HumanMessage(content=state['task'])
         ])
-        content = state['content'] or []
-        # TODO - Implement search feature for research
-        # Could use API search docs, could also simply use google search or duck duck go? Custom?
-        # Tavily seems interesting here, but payed service. The question -> Answer search seems useful
-
-        # for q in queries.queries:
-        #     response = tavily.search(query=q, max_results=2)
-        #     for r in response['results']:
-        #         content.append(r['content'])
-        return {"content": content}
+        # New results only, they're added to state['content']
+        # Tavily could add web results here, but is a paid service. The question -> Answer search seems useful
+        return {"content": research_content(doc_index, queries.queries, exclude=state.get('content') or [])}
 
     def generation_node(state: AgentState):
         content = "\n\n".join(state['content'] or [])
@@ -145,13 +155,13 @@ def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
         }
 
     def finalize_code_node(state: AgentState):
-        main_py = extract_code_from_llm_output("main.py", state["draft"])
-        requirements_txt = extract_code_from_llm_output("requirements.txt", state["draft"])
+        # Every file in the draft, not only main.py and requirements.txt
+        extracted = extract_files_from_llm_output(state["draft"])
+        files = code_files(extracted, REQUIRED_FILES)
+        for diagnostic in extracted.diagnostics:
+            print(f"finalize_code: {diagnostic}")
         task_output = CodeInput(
-            files={
-                "main.py": main_py,
-                "requirements.txt": requirements_txt
-            },
+            files=files,
             dockerfile=AllowedDockerFiles.python,
             run_command="fastapi run main.py"
         )
@@ -173,12 +183,7 @@ def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
             SystemMessage(content=RESEARCH_CRITIQUE_PROMPT),
             HumanMessage(content=state['critique'])
         ])
-        content = state['content'] or []
-        # for q in queries.queries:
-        #     response = tavily.search(query=q, max_results=2)
-        #     for r in response['results']:
-        #         content.append(r['content'])
-        return {"content": content}
+        return {"content": research_content(doc_index, queries.queries, exclude=state.get('content') or [])}
 
     def should_continue(state):
         if state["revision_number"] > state["max_revisions"]:
@@ -202,11 +207,13 @@ def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
         {"reflect": "reflect", "finalize_code": "finalize_code"}
     )
 
-    builder.add_edge("input", "planner")
-    builder.add_edge("planner", "research_plan")
-    builder.add_edge("research_plan", "generate")
-
-    builder.add_edge("reflect", "research_critique")
+    # The plan and research queries only need the task, so they run in parallel and generate waits for both
+    add_node_dependencies(builder, {
+        "planner": ["input"],
+        "research_plan": ["input"],
+        "generate": ["planner", "research_plan"],
+        "research_critique": ["reflect"],
+    })
     builder.add_edge("research_critique", "generate")
     builder.add_edge("finalize_code", END)
 
@@ -217,6 +224,8 @@ def agent(llm, tools, checkpointer=None) -> Optional[Runnable]:
 
 
 if __name__ == "__main__":
+    from quome_agentic_benchmarks.tools import create_api_template
+
     # Example
     tools = [create_api_template]
     graph = agent(None, tools)
@@ -0,0 +1,41 @@
+from typing import Dict, Iterable
+
+from langgraph.graph import StateGraph
+
+
+def add_node_dependencies(builder: StateGraph, dependencies: Dict[str, Iterable[str]]):
+    """
+    Adds the edges so each node runs once every node it depends on has finished.
+    Nodes with the same dependencies run in parallel (same graph step), a node depending on several
+    branches waits for all of them. Parallel nodes have to update different state keys, or keys with a reducer.
+    LangGraph only allows several edges out of a node when the state has a key with a reducer
+    (e.g. content: Annotated[List[str], operator.add]).
+
+    >>> import operator
+    >>> from typing import Annotated, List, TypedDict
+    >>> class State(TypedDict):
+    ...     task: str
+    ...     plan: str
+    ...     queries: Annotated[List[str], operator.add]
+    ...     draft: str
+    >>> builder = StateGraph(State)
+    >>> builder.add_node("planner", lambda state: {"plan": f"plan for {state['task']}"})
+    >>> builder.add_node("research", lambda state: {"queries": [f"how to build a {state['task']}"]})
+    >>> builder.add_node("generate", lambda state: {"draft": f"{state['plan']} + {state['queries']}"})
+    >>> builder.add_node("input", lambda state: {"task": state['task']})
+    >>> builder.set_entry_point("input")
+    >>> builder.set_finish_point("generate")
+    >>> add_node_dependencies(builder, {
+    ...     "planner": ["input"],
+    ...     "research": ["input"],
+    ...     "generate": ["planner", "research"],
+    ... })
+    >>> builder.compile().invoke({"task": "todo app"})["draft"]
+    "plan for todo app + ['how to build a todo app']"
+    """
+    for node, depends_on in dependencies.items():
+        depends_on = list(depends_on)
+        if len(depends_on) == 1:
+            builder.add_edge(depends_on[0], node)
+        elif depends_on:
+            builder.add_edge(depends_on, node)
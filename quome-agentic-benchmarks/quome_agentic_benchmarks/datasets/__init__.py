@@ -1,12 +1,8 @@
-from quome_agentic_benchmarks.datasets.coding import prompt_to_api_test
+from quome_agentic_benchmarks.registry import DATASETS
 
-dataset_lookup = {
-    "prompt_to_api_v1": prompt_to_api_test,
-}
-
-valid_datasets = dataset_lookup.keys()
+# Datasets are listed in registry.py, datasets/coding.py (and the evaluators it uses) is imported on first use
+valid_datasets = DATASETS.names()
 
 
 def get_dataset(dataset_name):
-    return dataset_lookup[dataset_name]
-
+    return DATASETS.get(dataset_name).load()
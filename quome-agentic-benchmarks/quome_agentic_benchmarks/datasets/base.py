@@ -1,8 +1,9 @@
 import dataclasses
-from typing import List, Tuple, Callable, Any
+from typing import List, Tuple, Callable, Any, Union, Optional, Iterable
 
 from tabulate import tabulate
 
+from quome_agentic_benchmarks.datasets.files import FileRows, rows_content_hash
 from quome_agentic_benchmarks.utils.benchmark import EvaluationMetadata
 
 
@@ -16,19 +17,45 @@ class Dataset:
     description: str
     """Description of the dataset for a data science practitioner."""
 
-    rows: List[Tuple[Any, Any]]
-    """List of training examples. Typically (Prompt,EvaluationData)"""
+    rows: Union[List[Tuple[Any, Any]], FileRows]
+    """Training examples, typically (Prompt,EvaluationData). A list, or FileRows streamed from a JSONL / Parquet file"""
 
     # EvaluationMetadata, result, expected_result_data
     evaluate: Callable[[EvaluationMetadata, Any, Any], Any]
     """Evaluates an output against the expected output."""
 
+    @classmethod
+    def from_file(cls, id: str, description: str, path: str, evaluate) -> 'Dataset':
+        return cls(id, description, FileRows(path), evaluate)
+
+    @property
+    def content_hash(self) -> str:
+        """Version of the rows, changes whenever a row is added or edited"""
+        if isinstance(self.rows, FileRows):
+            return self.rows.content_hash
+        return rows_content_hash(self.rows)
+
+    def select(self, names: Optional[Iterable[str]] = None, tags: Optional[Iterable[str]] = None) -> 'Dataset':
+        """Dataset with only the rows with one of the names and / or tags"""
+        if not names and not tags:
+            return self
+        if isinstance(self.rows, FileRows):
+            return dataclasses.replace(self, rows=self.rows.where(names, tags))
+        names, tags = set(names or []), set(tags or [])
+        rows = [
+            (task_row, expected) for task_row, expected in self.rows
+            if (not names or task_row['name'] in names) and (not tags or tags.intersection(task_row.get('tags', [])))
+        ]
+        return dataclasses.replace(self, rows=rows)
+
     @property
     def _table(self) -> List[List[str]]:
         """Return a table representation of the dataset."""
         return [
             ["Id", self.id],
             ["Description", self.description],
+            ["Rows", len(self.rows)],
+            ["Version", self.content_hash[:12]],
         ]
 
     def _repr_html_(self) -> str:
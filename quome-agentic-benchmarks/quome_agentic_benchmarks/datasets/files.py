@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+from array import array
+from typing import Optional, Iterable, Iterator, Tuple, Any, List
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class FileRows:
+    """
+    Dataset rows streamed from a JSONL or Parquet file instead of held in memory.
+    Each record is one row: its "expected" field is the expected data, the rest is the task row
+    ({"name", "prompt", ...}). Rows can have "tags" to select subsets with where().
+    JSONL:   {"name": "twitter", "prompt": "Create an app like Twitter", "tags": ["social"], "expected": {...}}
+    Parquet: the same columns, "expected" is a JSON string.
+
+    Iterating streams (task_row, expected) pairs. len() and rows[i] use an index of the matching rows
+    (byte offsets for JSONL, row numbers for Parquet), built on first use.
+    """
+
+    def __init__(self, path: str, names: Optional[Iterable[str]] = None, tags: Optional[Iterable[str]] = None):
+        self.path = path
+        # (names, tags) filters a row has to pass all of, see where()
+        self.filters: Tuple[Tuple[Optional[set], Optional[set]], ...] = ()
+        if names or tags:
+            self.filters = ((set(names) if names else None, set(tags) if tags else None),)
+        self._index: Optional[array] = None
+        self._content_hash: Optional[str] = None
+
+    @property
+    def is_parquet(self) -> bool:
+        return self.path.endswith(".parquet")
+
+    def where(self, names: Optional[Iterable[str]] = None, tags: Optional[Iterable[str]] = None) -> 'FileRows':
+        """
+        Rows with one of the names and / or one of the tags, out of these rows (filters combine)
+
+        >>> import tempfile
+        >>> rows = [{"name": "a", "tags": ["x"]}, {"name": "b", "tags": ["x", "y"]}, {"name": "c", "tags": ["y"]}]
+        >>> with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+        ...     _ = f.write("".join(json.dumps(row) + "\\n" for row in rows))
+        >>> [row['name'] for row, _expected in FileRows(f.name).where(tags=["x"]).where(tags=["y"])]
+        ['b']
+        >>> [row['name'] for row, _expected in FileRows(f.name, names=["a", "b"]).where(tags=["y"])]
+        ['b']
+        >>> os.remove(f.name)
+        """
+        rows = FileRows(self.path)
+        rows.filters = self.filters
+        if names or tags:
+            rows.filters += ((set(names) if names else None, set(tags) if tags else None),)
+        rows._content_hash = self._content_hash
+        return rows
+
+    def _matches(self, record: dict) -> bool:
+        for names, tags in self.filters:
+            if names is not None and record.get('name') not in names:
+                return False
+            if tags is not None and not tags.intersection(record.get('tags') or []):
+                return False
+        return True
+
+    @staticmethod
+    def _split(record: dict) -> Tuple[dict, Any]:
+        expected = record.pop('expected', None)
+        if isinstance(expected, str):
+            expected = json.loads(expected)
+        return record, expected
+
+    def _records(self) -> Iterator[Tuple[int, dict]]:
+        """(position, record) of every row in the file, position is a byte offset or row number"""
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+
+            row_number = 0
+            for batch in pq.ParquetFile(self.path).iter_batches(batch_size=256):
+                for record in batch.to_pylist():
+                    yield row_number, record
+                    row_number += 1
+            return
+
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    yield offset, json.loads(line)
+                offset += len(line)
+
+    def __iter__(self) -> Iterator[Tuple[dict, Any]]:
+        for _position, record in self._records():
+            if self._matches(record):
+                yield self._split(record)
+
+    def _get_index(self) -> array:
+        if self._index is None:
+            self._index = array('q', (position for position, record in self._records() if self._matches(record)))
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self._get_index())
+
+    def __getitem__(self, i: int) -> Tuple[dict, Any]:
+        position = self._get_index()[i]
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(self.path)
+            for group in range(parquet_file.num_row_groups):
+                group_rows = parquet_file.metadata.row_group(group).num_rows
+                if position < group_rows:
+                    table = parquet_file.read_row_group(group).slice(position, 1)
+                    return self._split(table.to_pylist()[0])
+                position -= group_rows
+
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            return self._split(json.loads(f.readline()))
+
+    @property
+    def content_hash(self) -> str:
+        """sha256 of the file, recorded with each row's results so scores are tied to a dataset version"""
+        if self._content_hash is None:
+            digest = hashlib.sha256()
+            with open(self.path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
+
+def rows_content_hash(rows: List[Tuple[Any, Any]]) -> str:
+    """content_hash for datasets defined as a list of rows in Python"""
+    return hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def data_file(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
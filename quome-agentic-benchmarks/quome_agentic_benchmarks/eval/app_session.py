@@ -0,0 +1,64 @@
+import json
+from typing import Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from quome_agentic_benchmarks.utils.tracing import span
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds, see https://requests.readthedocs.io/en/latest/user/advanced/#timeouts
+
+
+class AppSession(requests.Session):
+    """
+    Keep-alive session for probing one running app. Every probe reuses the same pooled connections.
+    Paths are relative to the app's base url, requests get a default timeout and are traced as http spans.
+    with app_session(f"http://0.0.0.0:{port}") as session:
+        session.get("/docs")
+    """
+
+    def __init__(self, base_url: str, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        path = url
+        if url.startswith("/"):
+            url = f"{self.base_url}{url}"
+        with span(f"http {method.upper()} {path}", "http") as span_args:
+            resp = super().request(method, url, *args, **kwargs)
+            span_args['status'] = resp.status_code
+        return resp
+
+    def get_json(self, path: str, **kwargs):
+        """GET path and decode the JSON body straight from the response bytes"""
+        resp = self.get(path, **kwargs)
+        resp.raise_for_status()
+        return json.loads(resp.content)
+
+
+def app_session(base_url: str, retries: int = 3, backoff_factor: float = 0.1, pool_maxsize: int = 10,
+                status_forcelist: Iterable[int] = (502, 503, 504), timeout=DEFAULT_TIMEOUT) -> AppSession:
+    """
+    Session for a running app. Connection errors and gateway errors are retried with backoff, for apps
+    that answered the readiness probe but are still finishing startup (e.g. uvicorn reloading).
+    Only idempotent methods are retried on error status codes, a failed connect is always safe to retry.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=status_forcelist,
+        backoff_factor=backoff_factor,
+        raise_on_status=False,  # Hand back the last response, evaluators score the status code
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_maxsize)
+    session = AppSession(base_url, timeout=timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
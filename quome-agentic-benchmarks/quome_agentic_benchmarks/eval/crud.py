@@ -0,0 +1,375 @@
+"""
+Functional CRUD tests for generated REST APIs, driven by the app's OpenAPI spec.
+
+Every collection (a path with both GET and POST, e.g. /tweets) is exercised with
+create -> list -> read -> update -> delete, using request bodies faked from components.schemas.
+Collections are tested concurrently on one httpx.AsyncClient. Collections whose bodies reference
+another collection (e.g. Tweet.user_id -> /users) run after it, using the id it created.
+"""
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Callable
+
+import httpx
+
+from quome_agentic_benchmarks.eval.openapi import parse_route, PARAM
+from quome_agentic_benchmarks.utils.tracing import span
+
+CRUD_STEPS = ["create", "list", "read", "update", "delete"]
+CRUD_POINTS = 5  # Per passing step, same as the other sub-evals
+MAX_FAKE_DEPTH = 4  # Nested / recursive schemas are cut off here
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE"}
+
+
+def resolve_ref(schema: dict, schemas: Dict[str, dict]) -> dict:
+    ref = schema.get('$ref')
+    if ref and ref.startswith('#/components/schemas/'):
+        return schemas.get(ref.rsplit('/', 1)[-1], {})
+    return schema
+
+
+def fake_value(schema: dict, schemas: Dict[str, dict], name: str = "value", depth: int = 0,
+               ids: Optional[Dict[str, Any]] = None):
+    """
+    Fakes a value matching a JSON schema. Strings are made unique, generated apps often have unique columns.
+    ids maps property names like "user_id" to ids of items created earlier in the run.
+    >>> fake_value({'type': 'integer', 'minimum': 100}, {})
+    100
+    >>> fake_value({'$ref': '#/components/schemas/User'}, {'User': {'type': 'object', 'properties': {
+    ...     'id': {'type': 'integer', 'readOnly': True}, 'admin': {'type': 'boolean'}}}})
+    {'admin': True}
+    """
+    schema = resolve_ref(schema, schemas)
+    if ids and name in ids:
+        return ids[name]
+    for key in ('allOf', 'anyOf', 'oneOf'):
+        options = [s for s in schema.get(key, []) if resolve_ref(s, schemas).get('type') != 'null']
+        if key == 'allOf' and options:
+            merged = {'type': 'object', 'properties': {}, 'required': []}
+            for option in options:
+                option = resolve_ref(option, schemas)
+                merged['properties'].update(option.get('properties', {}))
+                merged['required'] += option.get('required', [])
+            return fake_value(merged, schemas, name, depth, ids)
+        if options:
+            return fake_value(options[0], schemas, name, depth, ids)
+
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if 'default' in schema:
+        return schema['default']
+
+    schema_type = schema.get('type', 'object' if 'properties' in schema else 'string')
+    if schema_type in ('integer', 'number'):
+        value = 42 if schema_type == 'integer' else 4.2
+        value = max(value, schema.get('minimum', value))
+        return min(value, schema.get('maximum', value))
+    if schema_type == 'boolean':
+        return True
+    if schema_type == 'array':
+        if depth >= MAX_FAKE_DEPTH:
+            return []
+        return [fake_value(schema.get('items', {}), schemas, name, depth + 1, ids)]
+    if schema_type == 'object':
+        if depth >= MAX_FAKE_DEPTH:
+            return {}
+        return {
+            prop: fake_value(prop_schema, schemas, prop, depth + 1, ids)
+            for prop, prop_schema in schema.get('properties', {}).items()
+            if not resolve_ref(prop_schema, schemas).get('readOnly')
+        }
+    return fake_string(schema, name)
+
+
+def fake_string(schema: dict, name: str) -> str:
+    string_format = schema.get('format')
+    if string_format == 'email':
+        return f"{uuid.uuid4().hex[:8]}@example.com"
+    if string_format == 'date-time':
+        return "2024-06-26T08:05:10Z"
+    if string_format == 'date':
+        return "2024-06-26"
+    if string_format == 'uuid':
+        return str(uuid.uuid4())
+    if string_format in ('uri', 'url'):
+        return f"https://example.com/{uuid.uuid4().hex[:8]}"
+    value = f"{name}-{uuid.uuid4().hex[:8]}"
+    if 'maxLength' in schema:
+        value = value[:schema['maxLength']]
+    return value.ljust(schema.get('minLength', 0), 'x')
+
+
+def fake_post_body(content: dict, schemas: Dict[str, dict], ids: Optional[Dict[str, Any]] = None):
+    """Fakes a JSON request body from an operation's requestBody content"""
+    media = content.get('application/json') or next(iter(content.values()), {})
+    return fake_value(media.get('schema', {}), schemas, ids=ids)
+
+
+@dataclass
+class Collection:
+    name: str  # Last segment of the collection path, e.g. "tweets"
+    path: str
+    item_path: Optional[str]  # e.g. /tweets/{tweet_id}
+    operations: Dict[str, dict]  # Path item of the collection
+    item_operations: Dict[str, dict]
+    references: List[str] = field(default_factory=list)  # *_id properties pointing at other collections
+
+
+def find_collections(paths: Dict[str, dict]) -> List[Collection]:
+    """Collections are paths without parameters that accept GET and POST, with an optional /{id} item path"""
+    by_segments = {parse_route(path)[1]: path for path in paths}
+    collections = []
+    for segments, path in by_segments.items():
+        methods = {m.lower() for m in paths[path]}
+        if not segments or PARAM in segments or not {'get', 'post'} <= methods:
+            continue
+        item_path = by_segments.get(segments + (PARAM,))
+        collections.append(Collection(
+            name=segments[-1],
+            path=path,
+            item_path=item_path,
+            operations={m.lower(): op for m, op in paths[path].items()},
+            item_operations={m.lower(): op for m, op in paths[item_path].items()} if item_path else {},
+        ))
+    return collections
+
+
+def _body_properties(operation: dict, schemas: Dict[str, dict]) -> List[str]:
+    content = operation.get('requestBody', {}).get('content', {})
+    media = content.get('application/json') or next(iter(content.values()), {})
+    return list(resolve_ref(media.get('schema', {}), schemas).get('properties', {}))
+
+
+def _id_properties(collection_name: str) -> List[str]:
+    """
+    Property names other schemas would use to reference a collection
+    >>> _id_properties("addresses")
+    ['addresses_id', 'addresse_id', 'address_id']
+    """
+    name = collection_name.lower()
+    names = [name]
+    if name.endswith('s'):
+        names.append(name[:-1])
+    if name.endswith('es'):
+        names.append(name[:-2])
+    return [f"{n}_id" for n in names]
+
+
+def link_references(collections: List[Collection], schemas: Dict[str, dict]):
+    """Finds create bodies referencing other collections, e.g. user_id -> /users"""
+    by_name = {}
+    for collection in collections:
+        for prop in _id_properties(collection.name):
+            by_name.setdefault(prop, collection)
+    for collection in collections:
+        for prop in _body_properties(collection.operations['post'], schemas):
+            target = by_name.get(prop.lower())
+            if target is not None and target is not collection:
+                collection.references.append(prop)
+
+
+def _item_id(item, collection: Collection):
+    if not isinstance(item, dict):
+        return None
+    param = collection.item_path.rsplit('{', 1)[-1].rstrip('}') if collection.item_path else None
+    for key in ('id', param, *(k for k in item if k.lower().endswith('id'))):
+        if key and item.get(key) is not None:
+            return item[key]
+    return None
+
+
+def _items(body) -> list:
+    if isinstance(body, list):
+        return body
+    if isinstance(body, dict):
+        return next((value for value in body.values() if isinstance(value, list)), [])
+    return []
+
+
+def _json(resp: httpx.Response):
+    try:
+        return json.loads(resp.content)
+    except ValueError:
+        return None
+
+
+class CrudRun:
+    """Runs the CRUD sequence of one collection and keeps the step results"""
+
+    def __init__(self, client: httpx.AsyncClient, collection: Collection, schemas: Dict[str, dict]):
+        self.client = client
+        self.collection = collection
+        self.schemas = schemas
+        self.steps: Dict[str, bool] = {}
+        self.errors: Dict[str, str] = {}
+        self.item_id = None
+        self.current_step: Optional[str] = None
+        self.timed_out = False
+
+    def _record(self, step: str, passed: bool, error: Optional[str] = None):
+        self.steps[step] = passed
+        if error:
+            self.errors[step] = error
+
+    def _item_url(self) -> str:
+        template = self.collection.item_path
+        return template[:template.rindex('{')] + str(self.item_id)
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except (httpx.ReadError, httpx.RemoteProtocolError):
+            # Apps often crash on a request and drop their keep-alive connections, the next request on
+            # a pooled connection then fails. Retry once on a new connection when that is safe.
+            if method not in IDEMPOTENT_METHODS:
+                raise
+            return await self.client.request(method, url, **kwargs)
+
+    async def _request(self, step: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        self.current_step = step
+        try:
+            resp = await self._send(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self._record(step, False, repr(e))
+            return None
+        if not resp.is_success:
+            self._record(step, False, f"{method} {url} returned {resp.status_code}: {resp.text[:200]}")
+            return None
+        return resp
+
+    async def create_read_update(self, ids: Dict[str, Any]):
+        collection = self.collection
+        body = fake_post_body(collection.operations['post'].get('requestBody', {}).get('content', {}), self.schemas, ids)
+        resp = await self._request("create", "POST", collection.path, json=body)
+        if resp is None:
+            return
+        self.item_id = _item_id(_json(resp), collection)
+        self._record("create", True)
+
+        resp = await self._request("list", "GET", collection.path)
+        if resp is not None:
+            items = _items(_json(resp))
+            found = self.item_id is None and bool(items) or any(_item_id(i, collection) == self.item_id for i in items)
+            self._record("list", found, None if found else "Created item missing from the list")
+
+        if self.item_id is None or not collection.item_path:
+            return  # Item steps need an id and an item path
+        if 'get' in collection.item_operations:
+            if await self._request("read", "GET", self._item_url()) is not None:
+                self._record("read", True)
+
+        update_method = next((m for m in ('put', 'patch') if m in collection.item_operations), None)
+        if update_method:
+            content = collection.item_operations[update_method].get('requestBody', {}).get('content', {})
+            body = fake_post_body(content, self.schemas, ids)
+            if await self._request("update", update_method.upper(), self._item_url(), json=body) is not None:
+                self._record("update", True)
+
+    def stop(self, first_step: str, deadline: float):
+        """Marks the step the run was on (first_step if it hadn't started) as failed, earlier steps keep their results"""
+        self.timed_out = True
+        step = self.current_step if self.current_step and self.current_step not in self.steps else first_step
+        if step not in self.steps:
+            self._record(step, False, f"Didn't finish within the {deadline} second deadline")
+
+    @property
+    def deletes(self) -> bool:
+        return self.item_id is not None and 'delete' in self.collection.item_operations
+
+    async def delete(self):
+        if not self.deletes:
+            return
+        if await self._request("delete", "DELETE", self._item_url()) is None:
+            return
+        try:
+            resp = await self._send("GET", self._item_url())
+            deleted = not resp.is_success or 'get' not in self.collection.item_operations
+        except httpx.HTTPError:
+            deleted = False
+        self._record("delete", deleted, None if deleted else "Item still readable after DELETE")
+
+
+async def run_crud_tests(open_api_spec: dict, base_url: str, max_concurrency: int = 8,
+                         timeout: float = 5.0, deadline: Optional[float] = None) -> List[CrudRun]:
+    """
+    Runs the CRUD sequence for every collection. Collections still running at the deadline are stopped and
+    their current step fails, the other collections keep their results.
+    """
+    schemas = open_api_spec.get('components', {}).get('schemas', {})
+    collections = find_collections(open_api_spec.get('paths', {}))
+    link_references(collections, schemas)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline if deadline is not None else None
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    transport = httpx.AsyncHTTPTransport(retries=2, limits=limits)  # Retries failed connects only
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, transport=transport) as client:
+        runs = [CrudRun(client, collection, schemas) for collection in collections]
+
+        async def limited(coroutine):
+            async with semaphore:
+                await coroutine
+
+        async def phase(group: List[CrudRun], first_step: str, step: Callable[[CrudRun], Any]):
+            tasks = {asyncio.create_task(limited(step(run))): run for run in group if not run.timed_out}
+            if not tasks:
+                return
+            timeout_left = max(0.0, end - loop.time()) if end is not None else None
+            done, pending = await asyncio.wait(tasks, timeout=timeout_left)
+            for task in pending:
+                task.cancel()
+                tasks[task].stop(first_step, deadline)
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                task.result()  # Raises bugs in the tests themselves
+
+        # Collections referenced by others go first, their items stay around until every collection is done.
+        independent = [run for run in runs if not run.collection.references]
+        dependent = [run for run in runs if run.collection.references]
+        await phase(independent, "create", lambda run: run.create_read_update({}))
+
+        ids = {}
+        for run in independent:
+            if run.item_id is not None:
+                for prop in _id_properties(run.collection.name):
+                    ids.setdefault(prop, run.item_id)
+        await phase(dependent, "create", lambda run: run.create_read_update(ids))
+
+        for group in (dependent, independent):
+            await phase([run for run in group if run.deletes], "delete", lambda run: run.delete())
+    return runs
+
+
+def test_crud_endpoints(open_api_spec: dict, base_url: str, deadline: float = 30.0) -> dict:
+    """
+    Runs the CRUD tests against a running app.
+    Returns a points breakdown in the same shape as the evaluators, plus errors per failed step.
+    """
+    results = {'points': 0, 'successful': [], 'failed': [], 'errors': {}}
+    start = time.monotonic()
+    with span("crud", "http") as span_args:
+        runs = asyncio.run(run_crud_tests(open_api_spec, base_url, deadline=deadline))
+        stopped = [run.collection.name for run in runs if run.timed_out]
+        if stopped:
+            results['errors']['crud'] = f"CRUD tests of {', '.join(stopped)} didn't finish within {deadline} seconds"
+        for run in runs:
+            for step in CRUD_STEPS:
+                if step not in run.steps:
+                    continue
+                subeval_name = f'crud-{run.collection.name}-{step}'
+                if run.steps[step]:
+                    results['points'] += CRUD_POINTS
+                    results['successful'].append(subeval_name)
+                else:
+                    results['failed'].append(subeval_name)
+                    results['errors'][subeval_name] = run.errors.get(step)
+        span_args.update(collections=len(runs), passed=len(results['successful']), failed=len(results['failed']))
+    results['seconds'] = time.monotonic() - start
+    return results
+
+
+test_crud_endpoints.__test__ = False  # Not a pytest test
@@ -0,0 +1,135 @@
+"""
+Load test stage for generated APIs: requests per second, latency percentiles and error rate
+at increasing concurrency levels, so apps that work but stall under load score lower.
+
+Runs when QUOME_LOAD_TEST=on or when a dataset row's expected values have a 'load_test' entry:
+    'load_test': {
+        'concurrency': [1, 8, 32],  # Concurrent clients per level
+        'duration': 3,  # Seconds per level
+        'paths': ["/tweets"],  # GET paths to hit, defaults to the API's collections
+        'p95_target': 0.5,  # Seconds, a level passes when its p95 latency and
+        'max_error_rate': 0.01,  # error rate are within these
+        'weight': 0,  # Points for passing every level, split evenly between levels
+    }
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, TypedDict, NotRequired
+
+import httpx
+
+from quome_agentic_benchmarks.eval.crud import find_collections
+from quome_agentic_benchmarks.utils.tracing import span
+
+# "off" (default) or "on" to load test every generated API, see .env.example
+LOAD_TEST = os.environ.get("QUOME_LOAD_TEST", "off")
+
+
+class LoadTestConfig(TypedDict):
+    concurrency: NotRequired[List[int]]
+    duration: NotRequired[float]
+    paths: NotRequired[List[str]]
+    p95_target: NotRequired[float]
+    max_error_rate: NotRequired[float]
+    weight: NotRequired[float]
+
+
+DEFAULT_LOAD_TEST = LoadTestConfig(concurrency=[1, 8, 32], duration=3, p95_target=0.5, max_error_rate=0.01, weight=0)
+
+
+def load_test_config(expected: dict) -> Optional[LoadTestConfig]:
+    """Load test settings for a row, or None when the stage is off"""
+    config = expected.get('load_test')
+    if config is None and LOAD_TEST != "on":
+        return None
+    return LoadTestConfig(**{**DEFAULT_LOAD_TEST, **(config or {})})
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """
+    Nearest rank percentile
+    >>> percentile([0.1, 0.2, 0.3, 0.4], 50)
+    0.2
+    >>> percentile([0.1, 0.2, 0.3, 0.4], 99)
+    0.4
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)  # ceil(p / 100 * n)
+    return sorted_values[rank - 1]
+
+
+async def run_level(base_url: str, paths: List[str], concurrency: int, duration: float) -> Dict[str, float]:
+    """concurrency clients send GET requests round robin over paths, back to back, for duration seconds"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=10, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    resp = await client.get(paths[i % len(paths)])
+                    ok = resp.is_success
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+                i += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    requests = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'rps': requests / elapsed if elapsed > 0 else 0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'error_rate': errors / requests if requests else 1.0,
+    }
+
+
+def load_test_paths(open_api_spec: dict) -> List[str]:
+    """List endpoints of the API's collections, or /openapi.json if it has none"""
+    return [collection.path for collection in find_collections(open_api_spec.get('paths', {}))] or ['/openapi.json']
+
+
+def run_load_test(base_url: str, open_api_spec: dict, config: LoadTestConfig) -> dict:
+    """
+    Runs every concurrency level and scores it.
+    Returns {'points', 'successful', 'failed', 'levels'}, the sub-evals are only set when the stage has a weight.
+    """
+    paths = config.get('paths') or load_test_paths(open_api_spec)
+    levels = []
+    for concurrency in config['concurrency']:
+        with span(f"load_test c={concurrency}", "load") as span_args:
+            level = asyncio.run(run_level(base_url, paths, concurrency, config['duration']))
+            level['passed'] = (
+                level['error_rate'] <= config['max_error_rate']
+                and level['p95'] is not None and level['p95'] <= config['p95_target']
+            )
+            span_args.update(rps=level['rps'], p95=level['p95'], error_rate=level['error_rate'])
+        print(f"Load test {concurrency=}: {level['rps']:.0f} rps, p95 {level['p95']}s, {level['error_rate']:.1%} errors")
+        levels.append(level)
+
+    results = {'points': 0, 'successful': [], 'failed': [], 'levels': levels, 'paths': paths}
+    weight = config.get('weight') or 0
+    if weight:
+        for level in levels:
+            subeval_name = f"load-c{level['concurrency']}"
+            if level['passed']:
+                results['points'] += weight / len(levels)
+                results['successful'].append(subeval_name)
+            else:
+                results['failed'].append(subeval_name)
+    return results
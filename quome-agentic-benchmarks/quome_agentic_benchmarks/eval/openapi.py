@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Tuple, Literal, Iterable
+
+HTTP_METHODS = {"get", "put", "post", "delete", "options", "head", "patch", "trace"}
+PARAM = "{}"  # Trie key for any {param} segment, parameter names don't matter when matching
+
+# exact: the route is the whole path, e.g. "/tweets/{id}" matches "/tweets/{tweet_id}" only
+# prefix: the path starts with the route, e.g. "/tweets" matches "/tweets" and "/tweets/{id}/likes"
+# contains: the route's segments appear in the path, e.g. "tweets" matches "/api/v1/tweets/{id}"
+MatchMode = Literal["exact", "prefix", "contains"]
+
+
+def parse_route(route: str) -> Tuple[Optional[str], Tuple[str, ...]]:
+    """
+    Splits an expected endpoint into its (optional) HTTP method and path segments.
+    >>> parse_route("GET /tweets/{tweet_id}/")
+    ('get', ('tweets', '{}'))
+    >>> parse_route("likes")
+    (None, ('likes',))
+    """
+    method = None
+    parts = route.strip().split(maxsplit=1)
+    if len(parts) == 2 and parts[0].lower() in HTTP_METHODS:
+        method, route = parts[0].lower(), parts[1]
+    segments = tuple(
+        PARAM if segment.startswith("{") and segment.endswith("}") else segment
+        for segment in route.strip("/").split("/") if segment
+    )
+    return method, segments
+
+
+class _Node:
+    __slots__ = ("children", "path", "paths_below")
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = {}
+        self.path: Optional[str] = None  # Path template, when a path ends at this node
+        self.paths_below: List[str] = []  # Every path at or under this node, so prefix matches don't walk the subtree
+
+
+class OpenApiPathIndex:
+    """
+    Segment trie over the paths of an OpenAPI spec, for scoring expected endpoints.
+    Unlike a substring check, "like" doesn't match "/likes" or "/unlike".
+    >>> index = OpenApiPathIndex({
+    ...     "/api/tweets": {"get": {}, "post": {}},
+    ...     "/api/tweets/{tweet_id}": {"get": {}, "delete": {}},
+    ...     "/api/tweets/{tweet_id}/likes": {"post": {}},
+    ...     "/unlike": {"post": {}},
+    ... })
+    >>> index.match("like")
+    []
+    >>> index.match("likes")
+    ['/api/tweets/{tweet_id}/likes']
+    >>> index.match("DELETE tweets/{id}")
+    ['/api/tweets/{tweet_id}']
+    >>> index.match("/api/tweets", mode="exact")
+    ['/api/tweets']
+    >>> index.match("/api/tweets", mode="prefix")
+    ['/api/tweets', '/api/tweets/{tweet_id}', '/api/tweets/{tweet_id}/likes']
+    >>> index.match("tweets", mode="prefix")
+    []
+    """
+
+    def __init__(self, paths: Dict[str, dict]):
+        self.root = _Node()
+        self.methods: Dict[str, set] = {}  # Lower case HTTP methods of each path
+        # Nodes by the segment leading to them, so "contains" lookups start where the route's first segment is
+        self._nodes_by_segment: Dict[str, List[_Node]] = {}
+        for path, path_item in paths.items():
+            self.add(path, path_item)
+
+    def add(self, path: str, path_item: Optional[dict] = None):
+        _, segments = parse_route(path)
+        node = self.root
+        node.paths_below.append(path)
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+                self._nodes_by_segment.setdefault(segment, []).append(child)
+            node = child
+            node.paths_below.append(path)
+        node.path = path
+        self.methods.setdefault(path, set()).update(
+            method.lower() for method in (path_item or {}) if method.lower() in HTTP_METHODS
+        )
+
+    def _walk(self, start: Iterable[_Node], segments: Tuple[str, ...]) -> List[_Node]:
+        nodes = list(start)
+        for segment in segments:
+            nodes = [node.children[segment] for node in nodes if segment in node.children]
+            if not nodes:
+                break
+        return nodes
+
+    def match(self, route: str, mode: MatchMode = "contains") -> List[str]:
+        """Path templates matching an expected route, optionally prefixed with a method ("POST /tweets")"""
+        method, segments = parse_route(route)
+        if mode == "contains" and segments:
+            nodes = self._walk(self._nodes_by_segment.get(segments[0], []), segments[1:])
+        else:
+            nodes = self._walk([self.root], segments)
+
+        if mode == "exact":
+            paths = [node.path for node in nodes if node.path is not None]
+        else:
+            paths = list(dict.fromkeys(path for node in nodes for path in node.paths_below))
+
+        if method:
+            paths = [path for path in paths if method in self.methods[path]]
+        return sorted(paths)
+
+    def match_all(self, routes: Iterable[str], mode: MatchMode = "contains") -> Dict[str, List[str]]:
+        return {route: self.match(route, mode) for route in routes}
+
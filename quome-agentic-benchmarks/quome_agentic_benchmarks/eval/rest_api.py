@@ -1,9 +1,10 @@
 import json
 import os
 
-import requests
-import pandas as pd
-
+from quome_agentic_benchmarks.eval.app_session import app_session
+from quome_agentic_benchmarks.eval.crud import test_crud_endpoints
+from quome_agentic_benchmarks.eval.load_test import load_test_config, run_load_test
+from quome_agentic_benchmarks.eval.openapi import OpenApiPathIndex
 from quome_agentic_benchmarks.utils.benchmark import EvaluationMetadata
 from quome_agentic_benchmarks.utils.coding import RunningProgram, build_and_run_docker, CodeInput, AllowedDockerFiles, safe_build_and_run_code
 
@@ -14,16 +15,20 @@ def evaluate_running_app(running_app: RunningProgram, expected: dict, output_dir
 
     results = {'eval': 'prompt-to-api', 'points': 0, 'successful': [], 'failed': []}
 
-    base_url = f"http://0.0.0.0:{running_app['host_port']}"
+    readiness = running_app.get('readiness')
+    if readiness:
+        results['metrics'] = {'ready': readiness.ready, 'time_to_ready': readiness.time_to_ready}
+
+    session = app_session(f"http://0.0.0.0:{running_app['host_port']}")
     try:
-        resp = requests.get(f'{base_url}/docs')
+        resp = session.get('/docs')
         if resp.status_code == 200:
             results['points'] += 10
             results['successful'].append('ping')
         else:
             results['failed'].append('ping')
 
-        api_docs = json.loads(requests.get(f"{base_url}/openapi.json").text)
+        api_docs = session.get_json('/openapi.json')
 
         if 'schemas' in expected:
             for schema in expected['schemas']:
@@ -40,28 +45,38 @@ def evaluate_running_app(running_app: RunningProgram, expected: dict, output_dir
                                 results['points'] += 5
                                 results['successful'].append(props_eval_name)
 
-        for route in expected['endpoints']:
-            # TODO - check each route exists in api docs
+        # Expected endpoints can set 'endpoint_match' to exact / prefix / contains, see eval/openapi.py
+        path_index = OpenApiPathIndex(api_docs['paths'])
+        path_matches = path_index.match_all(expected['endpoints'], mode=expected.get('endpoint_match', 'contains'))
+        for route, matched_paths in path_matches.items():
             subeval_name = f'path_exists-{route}'
 
-            if any(route in path for path in api_docs['paths'].keys()):
-                # Path "/api/tweets" will match /tweets
+            if matched_paths:
+                # Path "/api/tweets" will match tweets, but not like
                 results['points'] += 5
                 results['successful'].append(subeval_name)
             else:
                 results['failed'].append(subeval_name)
 
-            # TODO, check create read update and delete methods...
-            # 1. Check method / path exists
-            # 2. Verify functionality (actually call the methods)
-            # Actually call the POST /tweets endpoint, then the GET /tweets endpoint
-            # JSON schema -> endpoint input -> Fake an input str: "abc" int: 42
-            # Verify that new input was added to list.
-            # Expect the API to have created a tweet
-
-            # TODO: Eval with a "Judge" eval model (GPT40)
-            # https://huggingface.co/learn/cookbook/en/llm_judge
-            # Look up good Judge prompts...
+        # Create, list, read, update and delete an item in each collection of the API
+        crud_results = test_crud_endpoints(api_docs, session.base_url)
+        results['points'] += crud_results['points']
+        results['successful'] += crud_results['successful']
+        results['failed'] += crud_results['failed']
+        results['crud_errors'] = crud_results['errors']
+        results.setdefault('metrics', {})['crud_seconds'] = crud_results['seconds']
+
+        load_config = load_test_config(expected)
+        if load_config:
+            load_results = run_load_test(session.base_url, api_docs, load_config)
+            results['points'] += load_results['points']
+            results['successful'] += load_results['successful']
+            results['failed'] += load_results['failed']
+            results['load_test'] = {'levels': load_results['levels'], 'paths': load_results['paths']}
+
+        # TODO: Eval with a "Judge" eval model (GPT40)
+        # https://huggingface.co/learn/cookbook/en/llm_judge
+        # Look up good Judge prompts...
 
     except:
         print("An Error occurred during evaluation")
@@ -72,7 +87,8 @@ def evaluate_running_app(running_app: RunningProgram, expected: dict, output_dir
             if has_exception:
                 print("There was a runtime error")
                 print(app_logs)
-
+    finally:
+        session.close()
 
     # TODO: Evaluate the code quality, this can be done by opening the files in the base_dir
     # Does it use a database? (Yes = 20 points)
@@ -103,31 +119,3 @@ def eval_prompt_to_api_from_dir(dir, expected, run_command="fastapi run main.py"
         base_url = f"http://0.0.0.0:{running_app['host_port']}"
         evaluate_running_app(running_app, expected, output_dir=dir)
 
-
-def fake_post_body(content, schemas):
-    obj = {}
-
-def test_crud_endpoints(open_api_spec):
-    paths = open_api_spec['paths']
-    schemas = open_api_spec['components']['schemas']
-    base_url = f"http://0.0.0.0:8000"
-
-    for path, methods in paths.items():
-        # Restful conventions - Ending in s implies this endpoint is something like
-        # /tweets or /likes
-        endpoint = f'{base_url}/path'
-        if path[-1] == 's' and 'post' in methods and 'get' in methods:
-            # Get all items
-            items = requests.get(f'{base_url}/path').json()
-            # Post an item
-            fake_item = fake_post_body(
-                methods['post']['requestBody']['content'],
-                schemas
-            )
-
-            # Get all items again. Expect new item to be added
-
-        for method, endpoint_info in methods.items():
-            #
-            # if method == 'post':
-            resp = requests.request(method, f'{base_url}/path')
@@ -1,17 +1,20 @@
+from typing import Optional
+
 from langchain_community.document_loaders import RecursiveUrlLoader
 
+from quome_agentic_benchmarks.knowledge.index import DocIndex, get_doc_index, html_to_text
+
 
 # https://python.langchain.com/v0.2/docs/integrations/document_loaders/recursive_url/
 # https://api.python.langchain.com/en/latest/document_loaders/langchain_community.document_loaders.recursive_url_loader.RecursiveUrlLoader.html
-def load_fast_api_docs():
+def load_fast_api_docs(index: Optional[DocIndex] = None, max_depth: int = 3) -> DocIndex:
+    """Crawls the FastAPI tutorial into the local doc index (knowledge/index.py). Unchanged pages aren't re-embedded."""
+    index = index or get_doc_index()
     fast_api_docs_loader = RecursiveUrlLoader(
-        "https://fastapi.tiangolo.com/tutorial/"
+        "https://fastapi.tiangolo.com/tutorial/",
+        max_depth=max_depth,
+        extractor=html_to_text
     )
-    iter_docs = fast_api_docs_loader.lazy_load()
-
-    doc = next(iter_docs)
-    # TODO - Iterate through docs and index them somewhere, elasticsearch? Vector search tool?
-    print(doc)
-
-
-
+    added = index.add_documents((doc.metadata['source'], doc.page_content) for doc in fast_api_docs_loader.lazy_load())
+    print(f"Indexed {added} new chunks of the FastAPI docs, {len(index)} chunks in total")
+    return index
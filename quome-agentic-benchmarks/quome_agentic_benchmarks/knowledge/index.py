@@ -0,0 +1,530 @@
+"""
+Local document index for agent research, no network calls or per query setup.
+
+Documents are split into chunks and stored on disk in QUOME_DOC_INDEX_DIR (default .doc_index/):
+- manifest.json: every source with its content hash and chunk rows, plus deleted (tombstoned) row ranges
+- chunks-<generation>.jsonl: one {"source", "text"} line per chunk, append only
+- embeddings-<generation>.f32: float32 matrix, one row per chunk, searched through np.memmap
+
+Search combines cosine similarity of the embeddings with BM25 keyword scores, for a batch of queries at once.
+Re-ingesting only embeds new or changed documents. Changed / removed documents are tombstoned and the files are
+compacted (rewritten under a new generation) once more than half of the rows are dead.
+
+Usage:
+    python -m quome_agentic_benchmarks.knowledge.index ingest path/to/docs
+    python -m quome_agentic_benchmarks.knowledge.index fastapi  # Crawls the FastAPI tutorial
+    python -m quome_agentic_benchmarks.knowledge.index search "path parameters" "request body"
+"""
+import argparse
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, List, Iterable, Tuple, Dict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Index settings, see .env.example
+DOC_INDEX_DIR = os.environ.get("QUOME_DOC_INDEX_DIR", os.path.join(os.getcwd(), ".doc_index"))
+
+DOC_SUFFIXES = (".md", ".rst", ".txt", ".html", ".htm")
+MANIFEST_VERSION = 1
+SEARCH_BLOCK_ROWS = 65536  # Embedding rows multiplied at a time, bounds memory on large indexes
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    >>> tokenize("FastAPI's Path() parameters")
+    ['fastapi', 's', 'path', 'parameters']
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+def html_to_text(page: str) -> str:
+    """
+    >>> html_to_text("<html><style>p {}</style><h1>Path</h1><p>Query &amp; body</p><script>x()</script></html>")
+    'Path\\n\\nQuery & body'
+    """
+    page = re.sub(r"(?is)<(script|style|nav|footer)\b.*?</\1>", " ", page)
+    page = re.sub(r"(?i)</?(p|div|h[1-6]|li|pre|br|tr|section|article)\b[^>]*>", "\n", page)
+    page = html.unescape(re.sub(r"<[^>]+>", " ", page))
+    page = re.sub(r"[ \t]+", " ", page)
+    return re.sub(r"\s*\n\s*(\n\s*)*", "\n\n", page).strip()
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings without a model: word unigrams and bigrams hashed into dim buckets (the hashing trick), L2 normalized.
+    Offline and fast, finds chunks sharing vocabulary with the query. Pass a real embedding model to DocIndex
+    for semantic matches.
+    >>> embeddings = HashingEmbeddings()
+    >>> a, b, c = embeddings.embed_array(["create a user", "Create a new user", "delete tweets"])
+    >>> bool(a @ b > a @ c)
+    True
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self._hashes: Dict[str, int] = {}  # Docs reuse the same vocabulary, don't hash every word again
+
+    @property
+    def id(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            hashes, counts = np.unique(np.fromiter((self._hash(f) for f in features), np.int64, len(features)),
+                                       return_counts=True)
+            signs = np.where(hashes & 0x80000000, 1, -1)
+            np.add.at(vectors[i], hashes % self.dim, signs * (1 + np.log(counts)))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _hash(self, feature: str) -> int:
+        h = self._hashes.get(feature)
+        if h is None:
+            if len(self._hashes) > 1_000_000:
+                self._hashes.clear()
+            h = self._hashes[feature] = zlib.crc32(feature.encode("utf-8"))  # Stable between processes, unlike hash()
+        return h
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+@dataclass
+class SearchHit:
+    source: str
+    text: str
+    score: float
+
+
+class DocIndex:
+    """
+    On disk document index, see the module docstring.
+    index = DocIndex()
+    index.add_documents([("docs/path_params.md", text), ...])
+    index.search(["path parameters", "request body"], k=4)  # Top k hits per query
+    Safe to share between threads, each row's research nodes can use the same index.
+    """
+
+    def __init__(self, directory: str = DOC_INDEX_DIR, embeddings: Optional[Embeddings] = None,
+                 chunk_size: int = 1000, chunk_overlap: int = 100):
+        self.directory = directory
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self._lock = threading.RLock()
+        self._manifest = self._read_manifest()
+        self._reset()
+
+    # Storage
+
+    @property
+    def embeddings_id(self) -> str:
+        return getattr(self.embeddings, "id", None) or type(self.embeddings).__name__
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _chunks_path(self, generation: Optional[int] = None) -> str:
+        return self._path(f"chunks-{self._manifest['generation'] if generation is None else generation}.jsonl")
+
+    def _embeddings_path(self, generation: Optional[int] = None) -> str:
+        return self._path(f"embeddings-{self._manifest['generation'] if generation is None else generation}.f32")
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._path("manifest.json"), "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {'version': MANIFEST_VERSION, 'embeddings': self.embeddings_id, 'dim': None, 'generation': 0,
+                    'count': 0, 'chunks_bytes': 0, 'sources': {}, 'deleted': []}
+        if manifest['embeddings'] != self.embeddings_id:
+            raise ValueError(f"{self.directory} was built with {manifest['embeddings']} embeddings, "
+                             f"not {self.embeddings_id}. Use another directory or re-ingest.")
+        return manifest
+
+    def _write_manifest(self):
+        # Written last and renamed into place, rows past 'count' (an interrupted update) are ignored
+        tmp_path = self._path("manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self._path("manifest.json"))
+
+    @staticmethod
+    def _open_at(path: str, size: int):
+        """Opens a data file for appending after its first size bytes"""
+        f = open(path, "r+b" if os.path.exists(path) else "w+b")
+        f.seek(size)
+        f.truncate()
+        return f
+
+    def _reset(self):
+        """Drops the in memory state, rebuilt on the next search"""
+        self._matrix: Optional[np.memmap] = None
+        self._offsets: Optional[array] = None  # Byte offset of each chunk row
+        self._lengths: Optional[array] = None  # Tokens per chunk row
+        # BM25 postings, read from the chunks on the first search: term -> slice of rows / term frequencies,
+        # sorted by term. Rows added afterwards go in _new_postings, term -> (rows, term frequencies).
+        self._vocabulary: Dict[str, int] = {}
+        self._term_rows = self._term_frequencies = self._term_starts = None
+        self._new_postings: Dict[str, Tuple[array, array]] = {}
+        self._live_mask: Optional[np.ndarray] = None
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if hasattr(self.embeddings, "embed_array"):
+            return self.embeddings.embed_array(texts)
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    # Updates
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self._manifest['sources'])
+
+    def __len__(self) -> int:
+        """Number of live chunks"""
+        return self._manifest['count'] - self._deleted_rows()
+
+    def _deleted_rows(self) -> int:
+        return sum(end - start for start, end in self._manifest['deleted'])
+
+    def add_documents(self, documents: Iterable[Tuple[str, str]], batch_size: int = 256) -> int:
+        """
+        Adds (source, text) documents, replacing earlier versions of the same source.
+        Unchanged documents are skipped. Returns the number of chunks added.
+        """
+        added = 0
+        with self._lock:
+            pending = []
+            for source, text in documents:
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                known = self._manifest['sources'].get(source)
+                if known and known['hash'] == digest:
+                    continue
+                pending.append((source, digest, [chunk for chunk in self.splitter.split_text(text) if chunk.strip()]))
+                if sum(len(chunks) for _, _, chunks in pending) >= batch_size:
+                    added += self._append(pending)
+                    pending = []
+            if pending:
+                added += self._append(pending)
+            # Only now the new rows count, an interrupted add_documents leaves the index as it was
+            self._write_manifest()
+            if self._deleted_rows() > self._manifest['count'] / 2:
+                self.compact()
+        return added
+
+    def _append(self, pending: List[Tuple[str, str, List[str]]]) -> int:
+        manifest = self._manifest
+        texts = [chunk for _, _, chunks in pending for chunk in chunks]
+        vectors = self._embed(texts) if texts else None
+        if manifest['dim'] is None and vectors is not None:
+            manifest['dim'] = vectors.shape[1]
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+
+        row = first_row = manifest['count']
+        lines = []
+        for source, digest, chunks in pending:
+            self._tombstone(source)
+            manifest['sources'][source] = {'hash': digest, 'rows': [row, row + len(chunks)]}
+            for chunk in chunks:
+                lines.append(json.dumps({'source': source, 'text': chunk}).encode("utf-8") + b"\n")
+                row += 1
+
+        with self._open_at(self._chunks_path(), manifest['chunks_bytes']) as f:
+            f.write(b"".join(lines))
+        if vectors is not None:
+            with self._open_at(self._embeddings_path(), manifest['count'] * manifest['dim'] * 4) as f:
+                f.write(vectors.astype(np.float32).tobytes())
+
+        if self._offsets is not None:
+            # Extend the loaded BM25 postings instead of re-reading the whole index
+            offset = manifest['chunks_bytes']
+            for i, line in enumerate(lines):
+                self._index_row(first_row + i, offset, texts[i])
+                offset += len(line)
+        manifest['count'] = row
+        manifest['chunks_bytes'] += sum(len(line) for line in lines)
+        self._matrix = None
+        self._live_mask = None
+        return len(texts)
+
+    def _tombstone(self, source: str):
+        known = self._manifest['sources'].pop(source, None)
+        if known and known['rows'][1] > known['rows'][0]:
+            self._manifest['deleted'].append(known['rows'])
+            self._live_mask = None
+
+    def delete(self, sources: Iterable[str]):
+        with self._lock:
+            for source in sources:
+                self._tombstone(source)
+            self._write_manifest()
+            if self._deleted_rows() > self._manifest['count'] / 2:
+                self.compact()
+
+    def compact(self):
+        """Rewrites the live chunks under a new generation and removes the old files"""
+        with self._lock:
+            if not self._manifest['deleted']:
+                return
+            self._load()
+            manifest = self._manifest
+            old_generation = manifest['generation']
+            generation = old_generation + 1
+            matrix = self._open_matrix()
+            sources, row, size = {}, 0, 0
+            with open(self._chunks_path(generation), "wb") as chunks_out, \
+                    open(self._embeddings_path(generation), "wb") as embeddings_out, \
+                    open(self._chunks_path(), "rb") as chunks_in:
+                for source, entry in sorted(manifest['sources'].items(), key=lambda item: item[1]['rows'][0]):
+                    start, end = entry['rows']
+                    if start == end:
+                        sources[source] = {**entry, 'rows': [row, row]}
+                        continue
+                    chunks_in.seek(self._offsets[start])
+                    end_offset = self._offsets[end] if end < manifest['count'] else manifest['chunks_bytes']
+                    data = chunks_in.read(end_offset - self._offsets[start])
+                    chunks_out.write(data)
+                    if matrix is not None:
+                        embeddings_out.write(np.ascontiguousarray(matrix[start:end]).tobytes())
+                    sources[source] = {**entry, 'rows': [row, row + end - start]}
+                    row += end - start
+                    size += len(data)
+            del matrix
+            self._manifest = {**manifest, 'generation': generation, 'count': row, 'chunks_bytes': size,
+                              'sources': sources, 'deleted': []}
+            self._write_manifest()
+            self._reset()
+            for path in (self._chunks_path(old_generation), self._embeddings_path(old_generation)):
+                Path(path).unlink(missing_ok=True)
+            print(f"Compacted {self.directory} to {row} chunks")
+
+    # Search
+
+    def _index_row(self, row: int, offset: int, text: str):
+        """Adds a row appended after _load()"""
+        self._offsets.append(offset)
+        tokens = tokenize(text)
+        self._lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            if term not in self._new_postings:
+                self._new_postings[term] = (array('q'), array('f'))
+            rows, frequencies = self._new_postings[term]
+            rows.append(row)
+            frequencies.append(count)
+
+    def _postings(self, term: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+        postings = []
+        term_id = self._vocabulary.get(term)
+        if term_id is not None:
+            start, end = self._term_starts[term_id], self._term_starts[term_id + 1]
+            postings.append((self._term_rows[start:end], self._term_frequencies[start:end]))
+        if term in self._new_postings:
+            rows, frequencies = self._new_postings[term]
+            postings.append((np.array(rows, dtype=np.int64), np.array(frequencies, dtype=np.float32)))
+        return postings
+
+    def _live(self) -> np.ndarray:
+        if self._live_mask is None:
+            live = np.ones(self._manifest['count'], dtype=bool)
+            for start, end in self._manifest['deleted']:
+                live[start:end] = False
+            self._live_mask = live
+        return self._live_mask
+
+    def _load(self):
+        """Reads the chunk offsets and builds the BM25 postings of the live chunks"""
+        if self._offsets is not None:
+            return
+        offsets, lengths = array('q'), array('f')
+        term_ids, term_rows, term_frequencies = array('q'), array('q'), array('f')
+        vocabulary = {}
+        live = self._live()
+        if self._manifest['count']:
+            with open(self._chunks_path(), "rb") as f:
+                offset = 0
+                for row in range(self._manifest['count']):
+                    line = f.readline()
+                    offsets.append(offset)
+                    offset += len(line)
+                    if not live[row]:
+                        lengths.append(0)
+                        continue
+                    counts = Counter(tokenize(json.loads(line)['text']))
+                    lengths.append(sum(counts.values()))
+                    term_ids.extend([vocabulary.setdefault(term, len(vocabulary)) for term in counts])
+                    term_rows.extend([row] * len(counts))
+                    term_frequencies.extend(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        self._term_rows = np.array(term_rows, dtype=np.int64)[order]
+        self._term_frequencies = np.array(term_frequencies, dtype=np.float32)[order]
+        self._term_starts = np.searchsorted(term_ids[order], np.arange(len(vocabulary) + 1))
+        self._vocabulary = vocabulary
+        self._new_postings = {}
+        self._offsets, self._lengths = offsets, lengths
+
+    def _open_matrix(self) -> Optional[np.memmap]:
+        manifest = self._manifest
+        if self._matrix is None and manifest['count'] and manifest['dim']:
+            self._matrix = np.memmap(self._embeddings_path(), dtype=np.float32, mode="r",
+                                     shape=(manifest['count'], manifest['dim']))
+        return self._matrix
+
+    def _dense_scores(self, queries: List[str]) -> np.ndarray:
+        matrix = self._open_matrix()
+        query_vectors = self._embed(queries).T
+        scores = np.empty((len(matrix), len(queries)), dtype=np.float32)
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            scores[start:start + SEARCH_BLOCK_ROWS] = matrix[start:start + SEARCH_BLOCK_ROWS] @ query_vectors
+        return scores
+
+    def _bm25_scores(self, query: str) -> np.ndarray:
+        count = self._manifest['count']
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        average_length = lengths.sum() / max(len(self), 1) or 1
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if not postings:
+                continue
+            rows = np.concatenate([rows for rows, _ in postings])
+            frequencies = np.concatenate([frequencies for _, frequencies in postings])
+            idf = math.log(1 + (len(self) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / average_length)
+            scores[rows] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norm)
+        return scores
+
+    def _chunk(self, row: int) -> Tuple[str, str]:
+        with open(self._chunks_path(), "rb") as f:
+            f.seek(self._offsets[row])
+            chunk = json.loads(f.readline())
+        return chunk['source'], chunk['text']
+
+    def search(self, queries: List[str], k: int = 4, dense_weight: float = 0.5) -> List[List[SearchHit]]:
+        """
+        Top k chunks for each query. Scores are dense_weight * cosine similarity +
+        (1 - dense_weight) * BM25 score (scaled to 0-1 per query).
+        """
+        with self._lock:
+            self._load()
+            live = self._live()
+            k = min(k, int(live.sum()))
+            if not queries or k == 0:
+                return [[] for _ in queries]
+
+            keyword_scores = np.stack([self._bm25_scores(query) for query in queries], axis=1)
+            peaks = keyword_scores.max(axis=0)
+            keyword_scores /= np.where(peaks > 0, peaks, 1)
+            scores = dense_weight * self._dense_scores(queries) + (1 - dense_weight) * keyword_scores
+            scores[~live] = -np.inf
+
+            results = []
+            for column in scores.T:
+                top = np.argpartition(-column, k - 1)[:k]
+                top = top[np.argsort(-column[top])]
+                results.append([SearchHit(*self._chunk(int(row)), score=float(column[row])) for row in top])
+            return results
+
+
+def format_hits(hits: List[SearchHit]) -> str:
+    return "\n\n---\n\n".join(f"Source: {hit.source}\n{hit.text}" for hit in hits)
+
+
+def research_content(index: DocIndex, queries: List[str], k: int = 2, exclude: Iterable[str] = ()) -> List[str]:
+    """Formatted top hits for the queries, skipping hits already in exclude (e.g. the agent's research so far)"""
+    seen = set(exclude)
+    content = []
+    for hits in index.search(queries, k=k):
+        for hit in hits:
+            text = format_hits([hit])
+            if text not in seen:
+                seen.add(text)
+                content.append(text)
+    return content
+
+
+def ingest_directory(index: DocIndex, directory: str, suffixes: Iterable[str] = DOC_SUFFIXES) -> int:
+    """Adds the directory's documents (html is converted to text), and removes ones deleted since the last ingest"""
+    root = Path(directory).resolve()
+    suffixes = tuple(suffixes)
+    paths = sorted(path for path in root.rglob("*") if path.is_file() and path.suffix.lower() in suffixes)
+
+    def documents():
+        for path in paths:
+            text = path.read_text(errors="ignore")
+            yield str(path), html_to_text(text) if path.suffix.lower() in (".html", ".htm") else text
+
+    added = index.add_documents(documents())
+    current = {str(path) for path in paths}
+    index.delete([source for source in index.sources if source.startswith(f"{root}{os.sep}") and source not in current])
+    print(f"Indexed {added} new chunks from {directory}, {len(index)} chunks in total")
+    return added
+
+
+_doc_index: Optional[DocIndex] = None
+_doc_index_lock = threading.Lock()
+
+
+def get_doc_index() -> DocIndex:
+    """Shared index in QUOME_DOC_INDEX_DIR, used by the search_docs tool and the agents' research nodes"""
+    global _doc_index
+    with _doc_index_lock:
+        if _doc_index is None:
+            _doc_index = DocIndex()
+    return _doc_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local document index")
+    parser.add_argument("--index-dir", default=DOC_INDEX_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_command = commands.add_parser("ingest", help="Add / update the documents in a directory")
+    ingest_command.add_argument("directory")
+    commands.add_parser("fastapi", help="Crawl and index the FastAPI tutorial")
+    search_command = commands.add_parser("search")
+    search_command.add_argument("queries", nargs="+")
+    search_command.add_argument("-k", type=int, default=4)
+    commands.add_parser("compact", help="Drop deleted chunks from the index files")
+
+    args = parser.parse_args()
+    doc_index = DocIndex(args.index_dir)
+    if args.command == "ingest":
+        ingest_directory(doc_index, args.directory)
+    elif args.command == "fastapi":
+        from quome_agentic_benchmarks.knowledge.document_loaders import load_fast_api_docs
+
+        load_fast_api_docs(doc_index)
+    elif args.command == "search":
+        for query, query_hits in zip(args.queries, doc_index.search(args.queries, k=args.k)):
+            print(f"# {query}")
+            for hit in query_hits:
+                print(f"{hit.score:.3f} {hit.source}: {hit.text[:120]!r}")
+    elif args.command == "compact":
+        doc_index.compact()
@@ -0,0 +1,150 @@
+"""
+Agents, tools, tasks and datasets the benchmark knows about, described by metadata alone (module, supported models,
+provider, task types). Plugins are only imported when a matrix cell needs them, so cold starts and worker spin-up
+don't import every agent's provider code, and unsupported (agent, model) pairs are dropped before any graph is built.
+
+This is the only place an agent's supported models, provider and task types are declared. Agent modules read theirs
+from here (AGENTS.get(name)) instead of keeping their own copy.
+Both agents only write code (CodeInput), so neither runs prompt_to_prd, which needs a text document.
+
+Add new agents, tools, tasks and datasets here, next to their module.
+"""
+import importlib
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+# Task types, agents list the ones they can do
+CODE = "code"  # Output is a CodeInput (utils/coding.py)
+DOCUMENT = "document"  # Output is text
+
+
+@dataclass(frozen=True)
+class Plugin:
+    name: str
+    module: str  # Module path, only imported by load()
+    attribute: Optional[str] = None  # Member of the module, None for the module itself
+    models: FrozenSet[str] = frozenset()  # Models an agent supports, empty for any
+    provider: str = "default"  # Model provider, used to limit concurrent runs (utils/scheduler.py)
+    task_types: FrozenSet[str] = frozenset()  # Task types a task is / an agent can do, empty for any
+
+    def supports(self, model: Optional[str] = None, task_type: Optional[str] = None) -> bool:
+        """
+        >>> coder = Plugin("coder", "coder", models=frozenset({"llama3"}), task_types=frozenset({CODE}))
+        >>> coder.supports("llama3", CODE), coder.supports("gpt-4o"), coder.supports(task_type=DOCUMENT)
+        (True, False, False)
+        """
+        if model is not None and self.models and model not in self.models:
+            return False
+        if task_type is not None and self.task_types and task_type not in self.task_types:
+            return False
+        return True
+
+    def load(self) -> Any:
+        module = importlib.import_module(self.module)
+        return getattr(module, self.attribute) if self.attribute else module
+
+
+class Registry:
+    """Plugins of one kind by name"""
+
+    def __init__(self, kind: str, plugins: Iterable[Plugin] = ()):
+        self.kind = kind
+        self._plugins: Dict[str, Plugin] = {}
+        for plugin in plugins:
+            self.register(plugin)
+
+    def register(self, plugin: Plugin) -> Plugin:
+        if plugin.name in self._plugins:
+            raise ValueError(f"{self.kind} {plugin.name!r} is already registered")
+        self._plugins[plugin.name] = plugin
+        return plugin
+
+    def get(self, name: str) -> Plugin:
+        try:
+            return self._plugins[name]
+        except KeyError:
+            raise KeyError(f"Unknown {self.kind} {name!r}, expected one of {', '.join(self._plugins)}") from None
+
+    def load(self, names: Iterable[str]) -> List[Any]:
+        return [self.get(name).load() for name in names]
+
+    def names(self) -> List[str]:
+        return list(self._plugins)
+
+    def __contains__(self, name) -> bool:
+        return name in self._plugins
+
+    def __iter__(self) -> Iterator[Plugin]:
+        return iter(self._plugins.values())
+
+
+AGENTS = Registry("agent", [
+    Plugin(
+        "example_ollama_agent", "quome_agentic_benchmarks.agents.example_ollama_agent",
+        models=frozenset({"llama3", "codellama"}), provider="ollama", task_types=frozenset({CODE})
+    ),
+    Plugin(
+        "openai_coder_v1", "quome_agentic_benchmarks.agents.openai_coder_v1",
+        models=frozenset({"gpt-3.5-turbo"}), provider="openai", task_types=frozenset({CODE})
+    ),
+])
+
+TOOLS = Registry("tool", [
+    Plugin(name, "quome_agentic_benchmarks.tools", name)
+    for name in ["add", "create_api_template", "google_search", "search_docs"]
+])
+
+TASKS = Registry("task", [
+    Plugin("prompt_to_api", "quome_agentic_benchmarks.tasks.coding", "prompt_to_api", task_types=frozenset({CODE})),
+    Plugin("prompt_to_prd", "quome_agentic_benchmarks.tasks.coding", "prompt_to_prd", task_types=frozenset({DOCUMENT})),
+    Plugin(
+        "prompt_to_frontend", "quome_agentic_benchmarks.tasks.coding", "prompt_to_frontend",
+        task_types=frozenset({CODE})
+    ),
+])
+
+DATASETS = Registry("dataset", [
+    Plugin("prompt_to_api_v1", "quome_agentic_benchmarks.datasets.coding", "prompt_to_api_test"),
+    Plugin("prompt_to_prd_v1", "quome_agentic_benchmarks.datasets.coding", "prompt_to_prd_test"),
+    Plugin("prompt_to_frontend_v1", "quome_agentic_benchmarks.datasets.coding", "prompt_to_frontend_test"),
+])
+
+
+def matrix_cells(task_names, agent_names, model_names) -> List[Tuple[str, str, str]]:
+    """
+    The (task, agent, model) cells of the benchmark matrix the agents support, from the metadata alone.
+    Nothing is imported, skipped pairs are printed. Raises ValueError when a requested task has no cell left,
+    instead of quietly running nothing for it.
+
+    >>> matrix_cells(["prompt_to_api"], ["example_ollama_agent"], ["llama3", "gpt-3.5-turbo"])
+    gpt-3.5-turbo is not supported for example_ollama_agent
+    [('prompt_to_api', 'example_ollama_agent', 'llama3')]
+    >>> matrix_cells(["prompt_to_api", "prompt_to_prd"], ["example_ollama_agent"], ["llama3"])
+    Traceback (most recent call last):
+    ...
+    ValueError: No agent in ['example_ollama_agent'] can run prompt_to_prd (task types: document) with models ['llama3']
+    """
+    cells = []
+    for agent_name in agent_names:
+        agent = AGENTS.get(agent_name)
+        models = []
+        for model in model_names:
+            if agent.supports(model):
+                models.append(model)
+            else:
+                print(f"{model} is not supported for {agent_name}")
+        for task_name in task_names:
+            if not all(agent.supports(task_type=task_type) for task_type in TASKS.get(task_name).task_types):
+                print(f"{task_name} isn't a task {agent_name} can do")
+                continue
+            cells.extend((task_name, agent_name, model) for model in models)
+    for task_name in task_names:
+        if not any(cell[0] == task_name for cell in cells):
+            task_types = ', '.join(sorted(TASKS.get(task_name).task_types)) or 'any'
+            raise ValueError(
+                f"No agent in {list(agent_names)} can run {task_name} (task types: {task_types}) "
+                f"with models {list(model_names)}"
+            )
+    # Same order as the nested task / agent / model loops
+    order = {name: i for i, name in enumerate(task_names)}
+    return sorted(cells, key=lambda cell: order[cell[0]])
@@ -1,46 +1,109 @@
 # https://langchain-ai.github.io/langchain-benchmarks/notebooks/tool_usage/benchmark_all_tasks.html
+import argparse
+import asyncio
 import importlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from langchain_community.llms.ollama import Ollama
-from langgraph.checkpoint.sqlite import SqliteSaver
+from quome_agentic_benchmarks.registry import TOOLS
+from quome_agentic_benchmarks.utils.benchmark import get_checkpointer, parse_benchmark_start
+from quome_agentic_benchmarks.utils.scheduler import expand_matrix, run_jobs, arun_jobs, pending_jobs, \
+    DEFAULT_PROVIDER_CONCURRENCY
 
-# from quome_agentic_benchmarks.agents import get_agents
-from quome_agentic_benchmarks.tasks.base import run_task
-from quome_agentic_benchmarks.utils.benchmark import load_modules, load_members
 
-from tools import *
+def run_benchmark(model_names, tool_names, task_names, agent_names, max_workers=4,
+                  max_generation_concurrency=2, max_evaluation_concurrency=2, max_queued_outputs=None, resume=None,
+                  row_names=None, row_tags=None):
+    """
+    Runs every (task, agent, model, row) combination.
+    resume: timestamp of a previous run (its benchmark_results/<timestamp> dir). Rows with results are skipped,
+    interrupted agent graphs continue from their last checkpoint.
+    Rows generate while earlier rows are evaluated, max_queued_outputs generated rows can wait for evaluation.
+    row_names / row_tags: only run the dataset rows with one of these names / tags.
+    """
+    print(f"Running benchmark: {model_names=}, {task_names=}, {tool_names=}, {agent_names=}")
+    # Agents and tasks are looked up in registry.py, and only imported for the (agent, model) pairs they support
+    tools = TOOLS.load(tool_names)
+
+    benchmark_start = parse_benchmark_start(resume) if resume else datetime.now()
+
+    # Used to save checkpoints for each run, stored on disk with the run's results.
+    checkpointer = get_checkpointer(benchmark_start)
 
+    # Every (task, agent, model, row) is an independent job, run on a bounded worker pool.
+    jobs = expand_matrix(task_names, agent_names, model_names, tools, checkpointer=checkpointer,
+                         row_names=row_names, row_tags=row_tags)
+    if resume:
+        jobs = pending_jobs(jobs, benchmark_start)
+    print(f"Running jobs, {max_generation_concurrency} generating / {max_evaluation_concurrency} evaluating")
+    return run_jobs(
+        jobs,
+        benchmark_start,
+        max_workers=max_workers,
+        max_generation_concurrency=max_generation_concurrency,
+        max_evaluation_concurrency=max_evaluation_concurrency,
+        max_queued_outputs=max_queued_outputs,
+    )
 
-def run_benchmark(model_names, tool_names, task_names, agent_names):
+
+async def arun_benchmark(model_names, tool_names, task_names, agent_names, provider_concurrency=None,
+                         max_evaluation_concurrency=2, max_queued_outputs=None, resume=None, row_names=None,
+                         row_tags=None):
+    """
+    Async version of run_benchmark. All rows are in flight on one event loop, limited per model provider.
+    Sync graph nodes and evaluations run on the loop's default executor, use run_async_benchmark to run this on a
+    loop with an executor sized for the concurrency.
+    """
     print(f"Running benchmark: {model_names=}, {task_names=}, {tool_names=}, {agent_names=}")
-    tools = load_members(tool_names, 'quome_agentic_benchmarks.tools')
-    coding_tasks = load_members(task_names, 'quome_agentic_benchmarks.tasks.coding')
-    agents = load_modules(agent_names, 'quome_agentic_benchmarks.agents')
-
-    benchmark_start = datetime.now()
-
-    # Used to save checkpoints for each run. May want to make a custom version
-    # To log the checkpoints for each run.
-    checkpointer = SqliteSaver.from_conn_string(":memory:")
-
-    for task in coding_tasks:
-        print(f"Running Task: {task.name}")
-        for a in agents:
-            for model in model_names:
-                agent_to_test = a.agent(
-                    llm=model,
-                    tools=tools,
-                    checkpointer=checkpointer
-                )
-                if not agent_to_test:
-                    # Model not supported for agent
-                    continue
-
-                print(f"Evaluating agent {agent_to_test.name} with model {model} on task {task}")
-                agent_id = f"{model}-{agent_to_test.name}"
-                run_task(agent_id, agent_to_test, task, tools, benchmark_start)
+    # Agents and tasks are looked up in registry.py, and only imported for the (agent, model) pairs they support
+    tools = TOOLS.load(tool_names)
+
+    benchmark_start = parse_benchmark_start(resume) if resume else datetime.now()
+    checkpointer = get_checkpointer(benchmark_start, aio=True)
+
+    jobs = expand_matrix(task_names, agent_names, model_names, tools, checkpointer=checkpointer,
+                         row_names=row_names, row_tags=row_tags)
+    if resume:
+        jobs = pending_jobs(jobs, benchmark_start)
+    print("Running jobs")
+    async with checkpointer:  # Closes the sqlite connection when done
+        return await arun_jobs(
+            jobs,
+            benchmark_start,
+            provider_concurrency=provider_concurrency,
+            max_evaluation_concurrency=max_evaluation_concurrency,
+            max_queued_outputs=max_queued_outputs,
+        )
+
+
+def run_async_benchmark(model_names, tool_names, task_names, agent_names, provider_concurrency=None,
+                        max_evaluation_concurrency=2, **kwargs):
+    """
+    Runs arun_benchmark on its own event loop, see arun_benchmark for the arguments.
+    Sync graph nodes are run by LangGraph on the loop's default executor (it can't be passed in), so the loop gets
+    one large enough for every provider slot and evaluation to be in use at once. It's shut down with the loop.
+    """
+    limits = {**DEFAULT_PROVIDER_CONCURRENCY, **(provider_concurrency or {})}
+    with asyncio.Runner() as runner:
+        runner.get_loop().set_default_executor(ThreadPoolExecutor(
+            max_workers=sum(limits.values()) + max_evaluation_concurrency, thread_name_prefix="benchmark"
+        ))
+        return runner.run(arun_benchmark(
+            model_names, tool_names, task_names, agent_names, provider_concurrency=provider_concurrency,
+            max_evaluation_concurrency=max_evaluation_concurrency, **kwargs
+        ))
 
 
 if __name__ == "__main__":
-    run_benchmark(["llama3", "gpt-3.5-turbo"], ["create_api_template"], ["prompt_to_api"], ["example_ollama_agent"])
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume",
+        metavar="TIMESTAMP",
+        help="Continue an interrupted run, e.g. --resume 20240626-080510 (see benchmark_results/)"
+    )
+    parser.add_argument("--row", action="append", dest="rows", help="Only run dataset rows with this name")
+    parser.add_argument("--tag", action="append", dest="tags", help="Only run dataset rows with this tag")
+    args = parser.parse_args()
+
+    run_benchmark(["llama3", "gpt-3.5-turbo"], ["create_api_template"], ["prompt_to_api"], ["example_ollama_agent"],
+                  resume=args.resume, row_names=args.rows, row_tags=args.tags)
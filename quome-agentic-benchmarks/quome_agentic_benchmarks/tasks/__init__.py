@@ -1,9 +1,5 @@
-from os.path import dirname, basename, isfile, join
-import glob
+from quome_agentic_benchmarks.registry import TASKS
 
-# Dynamically import all modules
-modules = glob.glob(join(dirname(__file__), "*.py"))
-
-# Enables from <this_module> import *
+# Tasks are listed in registry.py and imported when a benchmark uses them
 # See https://stackoverflow.com/questions/44834/what-does-all-mean-in-python
-__all__ = [basename(f)[:-3] for f in modules if isfile(f) and not f.startswith('_')]
+__all__ = list(dict.fromkeys(plugin.module.rsplit('.', 1)[-1] for plugin in TASKS))
@@ -1,16 +1,20 @@
+import asyncio
+import contextlib
 import dataclasses
 import string
 from datetime import datetime
 from typing import List, TypedDict
 
-from langchain.agents import AgentExecutor
 from langchain_core.messages import HumanMessage
 from langchain_core.runnables import Runnable
 from tabulate import tabulate
 
 from quome_agentic_benchmarks.datasets import get_dataset
 from quome_agentic_benchmarks.datasets.base import Dataset
-from quome_agentic_benchmarks.utils.benchmark import get_benchmark_output_dir, EvaluationMetadata
+from quome_agentic_benchmarks.utils.benchmark import EvaluationMetadata
+from quome_agentic_benchmarks.utils.llm_metrics import LLMMetricsCallbackHandler
+from quome_agentic_benchmarks.utils.pipeline import run_pipeline
+from quome_agentic_benchmarks.utils.tracing import TraceCallbackHandler, span
 
 
 class TaskData(TypedDict):
@@ -70,34 +74,177 @@ class BaseTask:
 
 
 def run_task(agent_id: str, agent_runnable: Runnable, task: BaseTask, tools, benchmark_start: datetime):
+    """Runs all rows of a task, the next row generates while the previous one is evaluated (utils/pipeline.py)"""
+
+    def generate(row):
+        task_row, _expected = row
+        return generate_task_output(agent_id, agent_runnable, task, task_row, benchmark_start)
+
+    def evaluate(row, generated):
+        _task_row, expected = row
+        eval_metadata, task_output = generated
+        return evaluate_task_output(eval_metadata, task, task_output, expected)
+
+    return [result for _i, _row, result in sorted(run_pipeline(task.dataset.rows, generate, evaluate),
+                                                  key=lambda entry: entry[0])]
+
+
+def run_task_row(agent_id: str, agent_runnable: Runnable, task: BaseTask, task_row, expected,
+                 benchmark_start: datetime):
+    """Generates and evaluates a single dataset row. Rows are independent, so this can run on any worker."""
+    eval_metadata, task_output = generate_task_output(agent_id, agent_runnable, task, task_row, benchmark_start)
+    return evaluate_task_output(eval_metadata, task, task_output, expected)
+
+
+def _prepare_row(agent_id: str, task: BaseTask, task_row, benchmark_start: datetime, model=None):
     task_prompt = string.Template(task.task_prompt)
     task_id = task.name
 
-    for task_row, expected in task.dataset.rows:
-        prompt = task_row['prompt']
-        task_row_id = task_row['name']
-        # executor = AgentExecutor(agent=agent_runnable, tools=tools)
-        instruction_prompt = task_prompt.substitute(prompt=prompt)
-        thread_config = {"configurable": {"thread_id": "1"}}  # Thread needed for checkpointing
-        # See Runnable methods for other methods - Stream, Astream, astream_log, batch, etc.
-        # TODO - Possible to do batch here. Particularly useful when using model services like Open AI.
-
-        eval_metadata = EvaluationMetadata(
-            agent_id, task_id, task_row_id, benchmark_start
-        )
+    prompt = task_row['prompt']
+    task_row_id = task_row['name']
+    # executor = AgentExecutor(agent=agent_runnable, tools=tools)
+    instruction_prompt = task_prompt.substitute(prompt=prompt)
 
-        eval_metadata.start()
-        # Start the task
-        chunks = []
-        for chunk in agent_runnable.stream({"task": instruction_prompt}, thread_config):
-            print(chunk)
-            chunks.append(chunk)  # Careful with model streaming outputs here, could be a lot of chunks...
-        # End the task, get the task_output from final dict
-        eval_metadata.end()
-        task_output = list(chunks[-1].values())[-1]['task_output']
+    eval_metadata = EvaluationMetadata(
+        agent_id, task_id, task_row_id, benchmark_start, model=model, dataset_version=task.dataset.content_hash
+    )
+    return {"task": instruction_prompt}, eval_metadata
+
+
+def _resume_point(agent_runnable: Runnable, state):
+    """
+    Decides how to (re)start a row given its last checkpoint.
+    Returns (resume, task_output). resume means continue the interrupted graph from its last node,
+    task_output is only set when the graph already finished and doesn't need to run again.
+    """
+    if state is None or not state.values:
+        return False, None
+    if state.next:
+        print(f"Resuming {agent_runnable.name} from {state.next}")
+        return True, None
+    task_output = state.values.get('task_output')
+    return task_output is not None, task_output
+
+
+def _agent_config(eval_metadata: EvaluationMetadata, agent_runnable: Runnable) -> dict:
+    """Graph config for the row: its checkpoint thread, plus callbacks timing each node and LLM call"""
+    node_names = [name for name in getattr(agent_runnable, 'nodes', {}) if not name.startswith('__')]
+    return {
+        **eval_metadata.checkpoint_config,
+        "callbacks": [
+            TraceCallbackHandler(eval_metadata.tracer, node_names),
+            LLMMetricsCallbackHandler(eval_metadata.llm_usage, node_names),
+        ],
+    }
+
+
+def _has_checkpointer(agent_runnable: Runnable):
+    return getattr(agent_runnable, 'checkpointer', None) is not None
 
-        eval_metadata.log_agent_call_chain(chunks)
 
-        # resp: TaskData = agent_runnable.invoke({"task": instruction_prompt}, thread_config)
-        # task_output = final_output['task_output']
-        eval_results = task.dataset.evaluate(eval_metadata, task_output, expected)
+def _finish_row(eval_metadata: EvaluationMetadata, last_chunk, state=None):
+    """
+    Ends the task and gets the task_output from the final chunk. A resumed thread whose pending node makes no update
+    streams no chunks, then the task_output comes from the graph's checkpointed state.
+    """
+    eval_metadata.end()
+    eval_metadata.save_trace()
+    if last_chunk is not None:
+        return list(last_chunk.values())[-1]['task_output']
+
+    task_output = state.values.get('task_output') if state is not None and state.values else None
+    if task_output is None:
+        raise ValueError(
+            f"{eval_metadata.agent_id} streamed nothing for {eval_metadata.task_id} row {eval_metadata.task_row}, "
+            f"and its state has no task_output"
+        )
+    return task_output
+
+
+def generate_task_output(agent_id: str, agent_runnable: Runnable, task: BaseTask, task_row,
+                         benchmark_start: datetime, model=None):
+    agent_input, eval_metadata = _prepare_row(agent_id, task, task_row, benchmark_start, model=model)
+    # Thread needed for checkpointing. Each row gets its own thread so rows can run concurrently and be resumed.
+    thread_config = eval_metadata.checkpoint_config
+    # See Runnable methods for other methods - Stream, Astream, astream_log, batch, etc.
+
+    if _has_checkpointer(agent_runnable):
+        resume, task_output = _resume_point(agent_runnable, agent_runnable.get_state(thread_config))
+        if task_output is not None:
+            return eval_metadata, task_output
+        if resume:
+            agent_input = None  # Continue from the last checkpoint
+
+    eval_metadata.start()
+    # Start the task. Chunks are streamed to the trace file, only the last one is kept for the task_output.
+    last_chunk = None
+    with eval_metadata.tracer.activate(), span("generate", "row"), eval_metadata.agent_trace() as trace:
+        for chunk in agent_runnable.stream(agent_input, _agent_config(eval_metadata, agent_runnable)):
+            print(chunk)
+            trace.write(chunk)
+            last_chunk = chunk
+    state = None
+    if last_chunk is None and _has_checkpointer(agent_runnable):
+        state = agent_runnable.get_state(thread_config)
+    task_output = _finish_row(eval_metadata, last_chunk, state)
+
+    # resp: TaskData = agent_runnable.invoke({"task": instruction_prompt}, thread_config)
+    # task_output = final_output['task_output']
+    return eval_metadata, task_output
+
+
+async def agenerate_task_output(agent_id: str, agent_runnable: Runnable, task: BaseTask, task_row,
+                                benchmark_start: datetime, model=None):
+    """Async version of generate_task_output, built on the graph's astream"""
+    agent_input, eval_metadata = _prepare_row(agent_id, task, task_row, benchmark_start, model=model)
+    thread_config = eval_metadata.checkpoint_config
+
+    if _has_checkpointer(agent_runnable):
+        resume, task_output = _resume_point(agent_runnable, await agent_runnable.aget_state(thread_config))
+        if task_output is not None:
+            return eval_metadata, task_output
+        if resume:
+            agent_input = None  # Continue from the last checkpoint
+
+    eval_metadata.start()
+    last_chunk = None
+    with eval_metadata.tracer.activate(), span("generate", "row"), eval_metadata.agent_trace() as trace:
+        async for chunk in agent_runnable.astream(agent_input, _agent_config(eval_metadata, agent_runnable)):
+            print(chunk)
+            trace.write(chunk)
+            last_chunk = chunk
+    state = None
+    if last_chunk is None and _has_checkpointer(agent_runnable):
+        state = await agent_runnable.aget_state(thread_config)
+    task_output = _finish_row(eval_metadata, last_chunk, state)
+    return eval_metadata, task_output
+
+
+def evaluate_task_output(eval_metadata: EvaluationMetadata, task: BaseTask, task_output, expected):
+    with eval_metadata.tracer.activate():
+        try:
+            with span("evaluate", "row"):
+                eval_results = task.dataset.evaluate(eval_metadata, task_output, expected)
+            return eval_metadata.add_llm_usage(eval_results)
+        finally:
+            eval_metadata.save_trace()
+
+
+async def aevaluate_task_output(eval_metadata: EvaluationMetadata, task: BaseTask, task_output, expected):
+    # Evaluations build and run Docker containers with blocking clients, keep them off the event loop.
+    return await asyncio.to_thread(evaluate_task_output, eval_metadata, task, task_output, expected)
+
+
+async def arun_task(agent_id: str, agent_runnable: Runnable, task: BaseTask, tools, benchmark_start: datetime,
+                    max_concurrency=None):
+    """Runs all rows of a task concurrently on the current event loop"""
+    row_slots = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+
+    async def arun_task_row(task_row, expected):
+        async with row_slots:
+            eval_metadata, task_output = await agenerate_task_output(
+                agent_id, agent_runnable, task, task_row, benchmark_start
+            )
+            return await aevaluate_task_output(eval_metadata, task, task_output, expected)
+
+    return await asyncio.gather(*(arun_task_row(task_row, expected) for task_row, expected in task.dataset.rows))
@@ -1,12 +1,15 @@
 # Define a tool by writing a function, and annotating with @tool decorator.
+# Tools calling slow / paid APIs can add @managed_tool for caching and rate limits, see utils/tool_executor.py
+from functools import lru_cache
 from typing import Type, Optional
 
-from langchain_community.tools.asknews.tool import SearchInput
-from langchain_community.utilities import GoogleSearchAPIWrapper
 from langchain_core.callbacks import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
 from langchain_core.tools import tool, BaseTool
 from pydantic.v1 import BaseModel
 
+from quome_agentic_benchmarks.knowledge.index import get_doc_index, format_hits
+from quome_agentic_benchmarks.utils.tool_executor import managed_tool
+
 
 # See https://python.langchain.com/v0.1/docs/modules/tools/custom_tools/
 
@@ -142,22 +145,41 @@ def delete(
 
 
 # Search tools
+@lru_cache(maxsize=1)
+def _google_search_api():
+    # Created on the first search, reads GOOGLE_API_KEY / GOOGLE_CSE_ID
+    from langchain_community.utilities import GoogleSearchAPIWrapper
+    return GoogleSearchAPIWrapper()
+
+
+def _search_docs_offline(query):
+    # Stand-in for web searches with QUOME_TOOL_BACKEND=offline
+    return format_hits(get_doc_index().search([query], k=4)[0]) or "No results"
+
+
 # See https://python.langchain.com/v0.2/docs/integrations/tools/google_search/
+@managed_tool(rate_limit=1, burst=5, offline=_search_docs_offline)  # Custom Search API allows 100 queries / minute
 @tool
 def google_search(query):
     """
     Run a Google search for the query
     """
-    search = GoogleSearchAPIWrapper()
-    return search.run(query)
+    return _google_search_api().run(query)
 
-#  TODO - Vector search / Elasticsearch tool (index documents, enable search)
-# See knowledge/document_loaders.py
+
+# Local document index, see knowledge/index.py. Fill it with
+# python -m quome_agentic_benchmarks.knowledge.index fastapi (or ingest <docs directory>)
+@tool
+def search_docs(query: str) -> str:
+    """
+    Search the local documentation index (e.g. the FastAPI tutorial) for the query
+    """
+    return format_hits(get_doc_index().search([query], k=4)[0]) or "No documents found"
 
 # class SearchFastApiDocs(BaseTool):
 #     name = "search_fast_api_docs"
 #     description = "useful for when you need to answer questions about current events"
-#     args_schema: Type[BaseModel] = SearchInput
+#     args_schema: Type[BaseModel] = SearchInput  # from langchain_community.tools.asknews.tool
 #
 #     def __init__(self):
 #         fast_api_docs_loader = RecursiveUrlLoader(
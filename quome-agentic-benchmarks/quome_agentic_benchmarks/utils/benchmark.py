@@ -1,10 +1,17 @@
 import importlib
 import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, is_dataclass, field
 from datetime import datetime, timezone
+from enum import Enum
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any, Callable
+
+from quome_agentic_benchmarks.utils.llm_metrics import LLMUsage, efficiency
+from quome_agentic_benchmarks.utils.tracing import Tracer
+
+BENCHMARK_RESULTS_DIR = "benchmark_results"
+BENCHMARK_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
 
 
 @dataclass
@@ -15,6 +22,10 @@ class EvaluationMetadata:
     benchmark_start: datetime
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
+    model: Optional[str] = None
+    dataset_version: Optional[str] = None  # content_hash of the dataset the row came from
+    tracer: Tracer = field(default_factory=Tracer, repr=False)  # Timing spans for this row, see utils/tracing.py
+    llm_usage: LLMUsage = field(default_factory=LLMUsage, repr=False)  # Tokens / latency, see utils/llm_metrics.py
 
     def start(self):
         self.start_time = datetime.now(timezone.utc)
@@ -25,8 +36,7 @@ class EvaluationMetadata:
     @property
     def output_dir(self) -> str:
         directory = os.path.join(
-            "benchmark_results",
-            str(self.benchmark_start.strftime("%Y%m%d-%H%M%S")),
+            get_benchmark_dir(self.benchmark_start),
             self.task_id,
             self.agent_id,
             self.task_row
@@ -35,23 +45,146 @@ class EvaluationMetadata:
         Path(directory).mkdir(parents=True, exist_ok=True)
         return directory
 
-    def log_agent_call_chain(self, chunks: List[Dict[str, Any]]):
-        # TODO: Can support streaming logs? Then we can ensure progress is logged.
-        # TODO: Support retrying failed runs? Note, checkpoints are available in langgraph.
-        print(chunks)
-        with open(os.path.join(self.output_dir, 'agent.log'), 'w') as log_file:
-            # Only works for JSON-serializable data...
-            # TODO: Fix to support generic python agent state.
-            log_data = [next(iter(chunk.items())) for chunk in chunks]
-            try:
-                json.dump(log_data, log_file)
-            except TypeError:
-                # Not JSON serializable, write as string
-                log_file.write(str(log_data))
-
-
-def get_benchmark_output_dir(agent_id, task_name, task_row_name, eval_end_date):
-    return os.path.join("benchmark_results")
+    @property
+    def checkpoint_config(self) -> dict:
+        """LangGraph config for this row. Every row gets its own checkpoint thread, so it can be resumed on its own."""
+        thread_id = "/".join([
+            self.benchmark_start.strftime(BENCHMARK_TIMESTAMP_FORMAT),
+            self.agent_id,
+            self.model or '',
+            self.task_id,
+            self.task_row
+        ])
+        return {"configurable": {"thread_id": thread_id}}
+
+    @property
+    def generation_seconds(self) -> Optional[float]:
+        if self.start_time and self.end_time:
+            return (self.end_time - self.start_time).total_seconds()
+        return None
+
+    @property
+    def is_complete(self) -> bool:
+        """True once the row has been evaluated. Used to skip rows when resuming a run."""
+        return os.path.exists(os.path.join(self.output_dir, "evaluation_results.json"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'agent_id': self.agent_id,
+            'model': self.model,
+            'dataset_version': self.dataset_version,
+            'task_id': self.task_id,
+            'task_row': self.task_row,
+            'benchmark_start': self.benchmark_start,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+        }
+
+    def add_llm_usage(self, eval_results) -> Dict[str, Any]:
+        """
+        Adds the row's LLM usage and efficiency (points per token / second) to its evaluation_results.json
+        """
+        if not isinstance(eval_results, dict):
+            eval_results = {'points': eval_results}
+
+        usage = self.llm_usage.summary()
+        eval_results['llm_usage'] = usage
+        eval_results['generation_seconds'] = self.generation_seconds
+        if isinstance(eval_results.get('points'), (int, float)):
+            eval_results['efficiency'] = efficiency(eval_results['points'], usage, self.generation_seconds)
+
+        with open(os.path.join(self.output_dir, "evaluation_results.json"), "w") as f:
+            json.dump(eval_results, f, default=to_jsonable)
+        return eval_results
+
+    def save_trace(self):
+        """Writes the row's metadata.json and its timing spans to trace.json (Chrome trace format)"""
+        with open(os.path.join(self.output_dir, 'metadata.json'), 'w') as f:
+            json.dump(self.to_dict(), f, default=to_jsonable)
+        self.tracer.dump(os.path.join(self.output_dir, 'trace.json'), metadata=self.to_dict())
+
+    def agent_trace(self, serializer=None) -> 'AgentTraceWriter':
+        """
+        Append-only trace of the agent's streamed chunks, one JSON object per line.
+        with eval_metadata.agent_trace() as trace:
+            trace.write(chunk)
+        """
+        return AgentTraceWriter(os.path.join(self.output_dir, 'agent_trace.jsonl'), serializer=serializer)
+
+
+def to_jsonable(obj):
+    """
+    Default serializer for agent state that json can't handle on its own.
+    Handles the enums, pydantic models (incl. langchain messages) and dataclasses used in agent state,
+    anything else is written as its string representation.
+    """
+    if isinstance(obj, Enum):
+        return obj.name
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump()  # Pydantic v2
+    if hasattr(obj, 'dict'):
+        return obj.dict()  # Pydantic v1, langchain messages
+    return str(obj)
+
+
+class AgentTraceWriter:
+    """
+    Writes agent chunks to a JSONL file as they arrive. Each line is flushed immediately,
+    so progress is on disk even if the row never finishes, and nothing is kept in memory.
+    """
+
+    def __init__(self, path: str, serializer: Optional[Callable[[Any], Any]] = None):
+        self.path = path
+        self.serializer = serializer or to_jsonable
+        self._file = None
+
+    def __enter__(self):
+        # Append, so a resumed row keeps the trace of its earlier attempt.
+        self._file = open(self.path, 'a')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        self._file = None
+
+    def write(self, chunk: Dict[str, Any]):
+        for node, update in chunk.items():
+            record = {'time': datetime.now(timezone.utc), 'node': node, 'update': update}
+            self._file.write(json.dumps(record, default=self.serializer))
+            self._file.write("\n")
+        self._file.flush()
+
+
+def get_benchmark_dir(benchmark_start: datetime) -> str:
+    return os.path.join(BENCHMARK_RESULTS_DIR, benchmark_start.strftime(BENCHMARK_TIMESTAMP_FORMAT))
+
+
+def parse_benchmark_start(timestamp: str) -> datetime:
+    """Inverse of the benchmark_results/<timestamp> directory name. Used with --resume"""
+    return datetime.strptime(timestamp, BENCHMARK_TIMESTAMP_FORMAT)
+
+
+def get_checkpointer(benchmark_start: datetime, aio: bool = False):
+    """
+    On-disk LangGraph checkpoint store for a benchmark run.
+    Lives next to the results, so an interrupted run can continue from its last completed node.
+    Graphs run with astream need the async saver (aio=True), SqliteSaver only implements the sync methods.
+    """
+    directory = get_benchmark_dir(benchmark_start)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(directory, "checkpoints.sqlite")
+    if aio:
+        from langgraph.checkpoint.aiosqlite import AsyncSqliteSaver
+        return AsyncSqliteSaver.from_conn_string(path)
+
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    return SqliteSaver.from_conn_string(path)
 
 
 def load_modules(module_names, package, relative_package=''):
@@ -1,47 +1,287 @@
 
 import contextlib
-import itertools
 import json
 import os
 import re
 import uuid
-from asyncio import sleep
-from docker.errors import APIError
+from docker.errors import APIError, BuildError, ContainerError
 from enum import Enum
 
 import requests
 
+from dataclasses import dataclass, field
 from datetime import date, datetime
 from docker.models.containers import Container
 from pathlib import Path
-from typing import TypedDict, NotRequired, Optional
+from typing import TypedDict, NotRequired, Optional, List, Dict, Tuple, Iterable
+
+from quome_agentic_benchmarks.utils.container_pool import CONTAINER_POOL, ContainerPool, get_container_pool
+from quome_agentic_benchmarks.utils.docker_cache import DOCKER_LAYER_CACHE, python_app_dockerfile, \
+    get_dependency_image
+from quome_agentic_benchmarks.utils.ports import get_host_port
+from quome_agentic_benchmarks.utils.readiness import ReadinessProbe, ReadinessResult, wait_until_ready, \
+    STATIC_READINESS_PROBE
+from quome_agentic_benchmarks.utils.tracing import span
 
 _example_llm_code_output = "requirements.txt\n```fastapi==0.1.2\npandas==1.2.3```Some explanation\nsome_other_file.py\n```abc\nabc\nabc\n```"
 _example_llm_code_output_2 = "main.py\n```python\nprint('hello world')```"
 
-# Regex matches code blocks denoted by three backticks ```
-# Also matches ```python and ```bash
-backtick_code_regex = '```(?:[\\w]*\n)?'
+# Code fences: three or more backticks or tildes. The info string after an opening fence is a language and / or
+# file name (```python, ```main.py, ```python title="app/main.py"), otherwise the code starts right after the fence.
+_FENCE_REGEX = re.compile(r"`{3,}|~{3,}")
+_FENCE_INFO_REGEX = re.compile(r"[ \t]*([\w+#./-]*)(?:[ \t]+(?:(?:title|file|filename)=)?[\"']?([\w./-]+)[\"']?)?[ \t]*(?=\n|$)")
+_FILE_EXTENSIONS = (
+    "py|txt|md|rst|js|jsx|mjs|cjs|ts|tsx|vue|html|htm|css|scss|json|yaml|yml|toml|cfg|ini|conf|env|sh|sql|xml|csv|"
+    "svg|lock|go|rs|java|kt|rb|php|c|h|cpp|hpp|cs|swift|example|template|j2|jinja|proto|graphql|gql"
+)
+_FILE_NAME_REGEX = re.compile(
+    rf"(?<![\w/.:-])((?:[\w.-]+/)*(?:[\w-][\w.-]*\.(?:{_FILE_EXTENSIONS})|Dockerfile|Makefile|Procfile|"
+    rf"\.env|\.gitignore|\.dockerignore))(?![\w/-])"
+)
+# First line comments naming the file, e.g. "# main.py", "// src/app.js", "<!-- index.html -->", "# File: main.py"
+_FILE_COMMENT_REGEX = re.compile(r"\s*(?:#|//|--|;|<!--|/\*)\s*(?:file(?:name)?:\s*)?(\S+?)\s*(?:-->|\*/)?\s*$", re.IGNORECASE)
+_MARKDOWN_LANGUAGES = {"md", "markdown", "mdx"}
+_SHELL_LANGUAGES = {"bash", "sh", "shell", "console", "zsh", "terminal", "powershell", "cmd"}
+
+
+@dataclass
+class CodeBlock:
+    content: str
+    language: str  # From the opening fence, may be empty
+    file_name: Optional[str]
+    label: str  # Last line of text before the block, e.g. "run command" or "Here is main.py:"
+    line: int  # Line of the opening fence, starting at 1
+
+
+@dataclass
+class ExtractedFiles:
+    files: Dict[str, str] = field(default_factory=dict)  # File name -> content, for blocks with a file name
+    blocks: List[CodeBlock] = field(default_factory=list)  # Every code block, in order
+    diagnostics: List[str] = field(default_factory=list)  # Unterminated fences, unnamed blocks, duplicates...
+
+    def labelled(self, text: str) -> Optional[CodeBlock]:
+        """First block whose file name or label contains the text"""
+        text = text.lower()
+        for block in self.blocks:
+            if text in (block.file_name or "").lower() or text in block.label.lower():
+                return block
+        return None
+
+    def unnamed(self, languages: Iterable[str] = ()) -> Optional[CodeBlock]:
+        """First block without a file name in one of the languages (any language if none are given)"""
+        languages = set(languages)
+        for block in self.blocks:
+            if block.file_name is None and (not languages or block.language.lower() in languages):
+                return block
+        return None
+
+
+def _is_file_name(text: str) -> bool:
+    return bool(text) and _FILE_NAME_REGEX.fullmatch(text) is not None
+
+
+def _block_file_name(info_file: Optional[str], language: str, label: str, region: str, content: str) -> Optional[str]:
+    """File name of a code block: from its fence, the line before it, a first line comment or the text before it"""
+    if info_file:
+        return info_file
+    # Shell blocks are usually commands ("Install requirements.txt:"), only a script name counts
+    shell = language.lower() in _SHELL_LANGUAGES
+    label_names = [name for name in _FILE_NAME_REGEX.findall(label) if not shell or name.endswith(".sh")]
+    if label_names:
+        return label_names[-1]
+    first_line = content.split("\n", 1)[0]
+    comment = _FILE_COMMENT_REGEX.fullmatch(first_line)
+    if comment and _is_file_name(comment.group(1)):
+        return comment.group(1)
+    region_names = [name for name in _FILE_NAME_REGEX.findall(region) if not shell or name.endswith(".sh")]
+    return region_names[-1] if region_names else None
+
+
+def extract_files_from_llm_output(llm_output: str) -> ExtractedFiles:
+    """
+    Every code block (file) in llm output in one pass, with its file name when it has one.
+    File names come from the fence (```main.py, ```python title="main.py"), the line before the block
+    (main.py, **main.py**, Here is `app/models.py`:), a first line comment (# main.py) or the text since the last block.
+    Unterminated blocks run to the end of the output. Markdown blocks may contain fenced blocks themselves.
+
+    >>> extracted = extract_files_from_llm_output(_example_llm_code_output)
+    >>> extracted.files
+    {'requirements.txt': 'fastapi==0.1.2\\npandas==1.2.3', 'some_other_file.py': 'abc\\nabc\\n'}
+    >>> extracted = extract_files_from_llm_output(
+    ...     "Files:\\n```python title=app/main.py\\nimport models\\n```\\n"
+    ...     "```python\\n# app/models.py\\nUSERS = []\\n```\\n"
+    ...     "README.md\\n```markdown\\n# Usage\\n```bash\\nfastapi run\\n```\\n```\\n"
+    ...     "run command\\n```fastapi run app/main.py```\\n"
+    ...     "```python\\nprint('unnamed')\\n```\\n"
+    ...     "```python\\nprint('unterminated')\\n"
+    ... )
+    >>> extracted.files
+    {'app/main.py': 'import models\\n', 'app/models.py': '# app/models.py\\nUSERS = []\\n', 'README.md': '# Usage\\n```bash\\nfastapi run\\n```\\n'}
+    >>> extracted.labelled("run command").content
+    'fastapi run app/main.py'
+    >>> extracted.diagnostics
+    ['line 17: code block has no file name', 'line 18: python block has no file name', 'line 21: unterminated python block, ran it to the end of the output', 'line 21: python block has no file name']
+    """
+    result = ExtractedFiles()
+    text = llm_output.replace("\r\n", "\n")
+    block_end = 0  # End of the last closed block, the text after it is the next block's label
+    line, line_pos = 1, 0
+
+    def line_at(position: int) -> int:
+        # Counted incrementally, so the whole scan stays linear in the output length
+        nonlocal line, line_pos
+        line += text.count("\n", line_pos, position)
+        line_pos = position
+        return line
+
+    scan_pos, scan_line_start = 0, 0
+
+    def line_start_of(position: int) -> int:
+        # Only searches back to the previous fence, also linear
+        nonlocal scan_pos, scan_line_start
+        newline = text.rfind("\n", scan_pos, position)
+        if newline != -1:
+            scan_line_start = newline + 1
+        scan_pos = position
+        return scan_line_start
+
+    open_block = None  # Dict describing the block being read
+
+    def close(content_end: int):
+        content = text[open_block['start']:content_end]
+        file_name = _block_file_name(open_block['info_file'], open_block['language'], open_block['label'],
+                                     open_block['region'], content)
+        block = CodeBlock(content, open_block['language'], file_name, open_block['label'], open_block['line'])
+        result.blocks.append(block)
+        if file_name is None:
+            result.diagnostics.append(f"line {block.line}: {block.language or 'code'} block has no file name")
+        elif file_name in result.files:
+            result.diagnostics.append(f"line {block.line}: {file_name} appears again, using this version")
+        if file_name is not None:
+            result.files[file_name] = content
+
+    def open_at(fence: re.Match, info: Optional[re.Match]):
+        nonlocal open_block
+        region = text[block_end:fence.start()]
+        label = next((text_line.strip() for text_line in reversed(region.splitlines()) if text_line.strip()), "")
+        language, info_file = "", None
+        if info:
+            language, info_file = info.group(1), info.group(2)
+            if _is_file_name(language) and not info_file:
+                language, info_file = language.rsplit(".", 1)[-1] if "." in language else "", language
+            start = min(info.end() + 1, len(text))
+        else:
+            start = fence.end()
+        open_block = {
+            'fence': fence.group(), 'start': start, 'language': language, 'info_file': info_file,
+            'label': label[:200], 'region': region, 'line': line_at(fence.start()), 'depth': 0,
+            'markdown': language.lower() in _MARKDOWN_LANGUAGES or (info_file or "").endswith(".md"),
+        }
+
+    for fence in _FENCE_REGEX.finditer(text):
+        marker = fence.group()
+        if open_block is None:
+            open_at(fence, _FENCE_INFO_REGEX.match(text, fence.end()))
+            continue
+        if fence.start() < open_block['start']:
+            continue  # Part of the info string / opening line
+        if marker[0] != open_block['fence'][0] or len(marker) < len(open_block['fence']):
+            continue  # e.g. ``` inside a ```` block
+
+        line_start = line_start_of(fence.start())
+        indent = fence.start()
+        while indent > line_start and text[indent - 1] in " \t":
+            indent -= 1
+        at_line_start = indent == line_start
+        info = _FENCE_INFO_REGEX.match(text, fence.end())
+        opens_block = at_line_start and info is not None and bool(info.group(1))  # A closing fence has no info
+
+        if open_block['markdown']:
+            # Markdown files have fenced blocks of their own, only a bare fence of the outer level closes them
+            if not at_line_start:
+                continue
+            if opens_block:
+                open_block['depth'] += 1
+                continue
+            if open_block['depth']:
+                open_block['depth'] -= 1
+                continue
+
+        if opens_block:
+            # A new block starts before this one was closed
+            result.diagnostics.append(
+                f"line {open_block['line']}: unterminated {open_block['language'] or 'code'} block, "
+                f"closed it at the next block on line {line_at(fence.start())}"
+            )
+            close(line_start)
+            block_end = line_start
+            open_at(fence, info)
+            continue
+
+        close(line_start if at_line_start else fence.start())
+        block_end = fence.end()
+        open_block = None
+
+    if open_block is not None:
+        result.diagnostics.append(
+            f"line {open_block['line']}: unterminated {open_block['language'] or 'code'} block, "
+            f"ran it to the end of the output"
+        )
+        close(len(text))
+    if not result.blocks:
+        result.diagnostics.append("No code blocks found")
+    return result
 
 
 def extract_code_from_llm_output(file_name, llm_output):
     """
-    Extracts a single code block (file) from llm output. Relies on three backticks ``` for code blocks
+    Extracts a single code block (file) from llm output, see extract_files_from_llm_output for all files at once
     >>> extract_code_from_llm_output("requirements.txt", _example_llm_code_output)
     'fastapi==0.1.2\\npandas==1.2.3'
 
     >>> extract_code_from_llm_output("main.py", _example_llm_code_output_2)
     "print('hello world')"
     """
+    extracted = extract_files_from_llm_output(llm_output)
+    if file_name in extracted.files:
+        return extracted.files[file_name]
 
-    llm_output.find(file_name)
-    code_blocks = re.split(backtick_code_regex, llm_output[llm_output.find(file_name):])
-
-    if len(code_blocks) < 2:
+    block = extracted.labelled(file_name)
+    if block is None:
         print(f"No code blocks found for {file_name}")
         return ""
+    return block.content
+
 
-    return code_blocks[1]
+def code_files(extracted: ExtractedFiles, required: Dict[str, Tuple[str, ...]]) -> Dict[str, str]:
+    """
+    CodeInput files from extracted llm output: every file write_code_to_dir accepts, plus the required files
+    (file name -> languages). A missing required file is filled in from the first unnamed block in one of its
+    languages, or left empty.
+    >>> extracted = extract_files_from_llm_output("```python\\nprint(1)\\n```\\nDockerfile\\n```\\nFROM x\\n```")
+    >>> code_files(extracted, {"main.py": ("python", "py"), "requirements.txt": ("txt", "text")})
+    {'main.py': 'print(1)\\n', 'requirements.txt': ''}
+    >>> extracted.diagnostics[1:]
+    ["Dropped Dockerfile, the file can't be written", 'line 1: used the unnamed python block as main.py', 'No requirements.txt in the output, left it empty']
+    """
+    files = {}
+    for path, content in extracted.files.items():
+        if path in DISALLOWED_PATHS or path.startswith("/") or ".." in path:
+            extracted.diagnostics.append(f"Dropped {path}, the file can't be written")
+            continue
+        files[path] = content
+
+    for path, languages in required.items():
+        if path in files:
+            continue
+        block = extracted.unnamed(languages)
+        if block is not None:
+            files[path] = block.content
+            extracted.diagnostics.append(f"line {block.line}: used the unnamed {block.language} block as {path}")
+        else:
+            files[path] = ""
+            extracted.diagnostics.append(f"No {path} in the output, left it empty")
+    return files
 
 
 DEFAULT_PYTHON_DOCKERFILE = """FROM python:alpine
@@ -82,24 +322,46 @@ class CodeInput(TypedDict):
     build_command: NotRequired[str]
     run_command: NotRequired[str]
     port: NotRequired[int]
+    readiness_probe: NotRequired[ReadinessProbe]  # How to tell the app is up, see utils/readiness.py
 
 
 class RunningProgram(TypedDict):
-    container: Container
-    host_port: int
+    container: Optional[Container]  # None if the image didn't build or the container didn't start
+    host_port: Optional[int]  # None if the container exited before its port was published
     build_logs: str
     base_dir: str
     runtime_error: Optional[str]
+    readiness: Optional[ReadinessResult]
 
 
 DISALLOWED_PATHS = {"Dockerfile"}
 
 
-def write_code_to_dir(code: CodeInput, output_dir: Optional[str] = None) -> str:
+def code_input_to_json(code: CodeInput) -> dict:
+    """
+    CodeInput as plain JSON, with the dockerfile stored by name. Used to hand task outputs to other machines.
+    >>> code_input_to_json({"files": {"main.py": "print(1)"}, "dockerfile": AllowedDockerFiles.python})
+    {'files': {'main.py': 'print(1)'}, 'dockerfile': 'python'}
+    >>> code_input_from_json(_)['dockerfile'] is AllowedDockerFiles.python
+    True
+    """
+    if not isinstance(code, dict) or not isinstance(code.get('dockerfile'), AllowedDockerFiles):
+        return code  # Not code, e.g. a PRD
+    return {**code, 'dockerfile': code['dockerfile'].name}
+
+
+def code_input_from_json(data: dict) -> CodeInput:
+    if not isinstance(data, dict) or not isinstance(data.get('dockerfile'), str):
+        return data
+    return CodeInput(**{**data, 'dockerfile': AllowedDockerFiles[data['dockerfile']]})
+
+
+def write_code_to_dir(code: CodeInput, output_dir: Optional[str] = None, dockerfile: Optional[str] = None) -> str:
     """
         Writes all files to temporary directory within generated_apps
         This function is likely a large security risk.
         Writing Dockerfiles is possible here. Useful, but definitely carries risks.
+        dockerfile overrides the contents of code['dockerfile'], e.g. to build on a cached dependency image.
     """
     if output_dir is None:
         output_dir = os.path.join(os.getcwd(), "generated", "apps", str(date.today()))
@@ -118,17 +380,101 @@ def write_code_to_dir(code: CodeInput, output_dir: Optional[str] = None) -> str:
             raise ValueError(f"Writing custom {path} is not allowed")
 
         # Could try and only expose writing to files through docker...
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
         with open(file_path, "w") as f:
             f.write(content)
 
     # Write Dockerfile
     dockerfile_path = os.path.join(base_dir, "Dockerfile")
     with open(dockerfile_path, "w") as f:
-        f.write(code['dockerfile'].value)
+        f.write(dockerfile or code['dockerfile'].value)
 
     return base_dir
 
 
+def _cached_dockerfile(code: CodeInput) -> Optional[str]:
+    """Python apps are built on an image with their requirements pre-installed, see utils/docker_cache.py"""
+    requirements_txt = code['files'].get('requirements.txt')
+    if DOCKER_LAYER_CACHE == "off" or code['dockerfile'] != AllowedDockerFiles.python or not requirements_txt:
+        return None
+    return python_app_dockerfile(requirements_txt)
+
+
+def _container_pool_for(code: CodeInput) -> Optional[ContainerPool]:
+    """Warm container pool to run the code in, if pooling is enabled and the code's runtime has one"""
+    if CONTAINER_POOL != "on":
+        return None
+
+    if code['dockerfile'] == AllowedDockerFiles.static_web:
+        # busybox httpd serves whatever is in its directory, no need to restart it between apps.
+        return get_container_pool(
+            "static_web",
+            image="busybox:1.35",
+            container_port=code.get('port', 3000),
+            app_dir="/tmp/static",
+            command=f"busybox httpd -f -v -p {code.get('port', 3000)} -h /tmp/static",
+            restart_app=False,
+        )
+
+    requirements_txt = code['files'].get('requirements.txt')
+    if code['dockerfile'] == AllowedDockerFiles.python and requirements_txt and DOCKER_LAYER_CACHE != "off":
+        # One pool per dependency set, see utils/docker_cache.py
+        image = get_dependency_image(requirements_txt)
+        return get_container_pool(
+            image,
+            image=image,
+            container_port=code.get('port', 8000),
+            app_dir="/tmp/app",
+            command="tail -f /dev/null",
+        )
+    return None
+
+
+@contextlib.contextmanager
+def failed_build(base_dir, error):
+    """
+    RunningProgram for code whose image didn't build, e.g. LLM written requirements that don't install.
+    Nothing is running, so evaluators score it like an app that crashed.
+    """
+    if isinstance(error, BuildError):
+        build_logs = ''.join([r.get('stream', '') for r in error.build_log])
+    else:
+        build_logs = (error.stderr or b'').decode('utf-8', errors='replace')
+    print(f"Build failed: {error}")
+    with open(os.path.join(base_dir, "build.log"), "w") as f:
+        f.write(build_logs)
+    with open(os.path.join(base_dir, "error.log"), "w") as f:
+        f.write(str(error))
+
+    yield RunningProgram(
+        container=None,
+        host_port=None,
+        build_logs=build_logs,
+        base_dir=base_dir,
+        runtime_error=str(error),
+        readiness=None
+    )
+
+
+@contextlib.contextmanager
+def run_in_pooled_container(pool: ContainerPool, base_dir, run_command=None, readiness_probe=None):
+    """Like build_and_run_docker, but runs the code in a leased container from a warm pool"""
+    with pool.lease(base_dir, run_command=run_command or "python main.py", readiness_probe=readiness_probe) as container:
+        running_program = RunningProgram(
+            container=container,
+            host_port=container.host_port,
+            build_logs='',
+            base_dir=base_dir,
+            runtime_error=None,
+            readiness=container.readiness
+        )
+        try:
+            yield running_program
+        finally:
+            with open(os.path.join(base_dir, "application.log"), "w") as f:
+                f.write(container.logs().decode('utf-8'))
+
+
 def safe_build_and_run_code(code: CodeInput, app_id=None, output_dir=None):
     """Use this function with Python's "with" keyword
     with safe_build_and_run_code(...) as running_app:
@@ -138,7 +484,30 @@ def safe_build_and_run_code(code: CodeInput, app_id=None, output_dir=None):
         app_id = str(uuid.uuid4())  # For docker images.
 
     code_dir = os.path.join(output_dir, 'app')
-    write_code_to_dir(code, output_dir=code_dir)
+    try:
+        dockerfile = _cached_dockerfile(code)
+    except (BuildError, ContainerError) as e:
+        # The dependency image didn't build, the row fails instead of the whole job
+        dockerfile, build_error = None, e
+    else:
+        build_error = None
+    with span("write_files", "files", count=len(code['files'])):
+        write_code_to_dir(code, output_dir=code_dir, dockerfile=dockerfile)
+    if build_error:
+        return failed_build(code_dir, build_error)
+
+    readiness_probe = code.get('readiness_probe')
+    if readiness_probe is None and code['dockerfile'] == AllowedDockerFiles.static_web:
+        readiness_probe = STATIC_READINESS_PROBE
+
+    try:
+        pool = _container_pool_for(code)
+    except (BuildError, ContainerError) as e:
+        return failed_build(code_dir, e)
+    if pool:
+        return run_in_pooled_container(
+            pool, code_dir, run_command=code.get('run_command', None), readiness_probe=readiness_probe
+        )
 
     # Delegated generator...
     # https://stackoverflow.com/questions/11197186/how-to-yield-results-from-a-nested-generator-function
@@ -146,80 +515,88 @@ def safe_build_and_run_code(code: CodeInput, app_id=None, output_dir=None):
         code_dir,
         app_id,
         run_command=code.get('run_command', None),
-        expose_port=code.get('port', 8000)
+        expose_port=code.get('port', 8000),
+        readiness_probe=readiness_probe
     )
 
 
 @contextlib.contextmanager
-def build_and_run_docker(base_dir, tag, run_command="python main.py", expose_port=8000):
+def build_and_run_docker(base_dir, tag, run_command="python main.py", expose_port=8000,
+                         readiness_probe: Optional[ReadinessProbe] = None):
     import docker
 
     if tag is None:
         tag = str(uuid.uuid4())
 
     client = docker.from_env()
-    port_mapping = {}
-    ports_in_use = set(itertools.chain.from_iterable(map(lambda c: (int(v[0]['HostPort']) for v in c.ports.values() if v), client.containers.list())))
-    available_host_port = next(port for port in range(expose_port, expose_port+100) if port not in ports_in_use)
     # Build docker image.
     # https://docker-py.readthedocs.io/en/stable/images.html#docker.models.images.ImageCollection.build
     # https://docker-py.readthedocs.io/en/stable/images.html#docker.models.images.Image
-    port_mapping[f'{expose_port}/tcp'] = available_host_port
+    # None lets Docker assign a free host port, read back once the container is running. See utils/ports.py
+    port_mapping = {f'{expose_port}/tcp': None}
 
-    image, _build_logs = client.images.build(path=base_dir, tag=tag.lower())
+    with span("docker_build", "docker", tag=tag.lower()):
+        image, _build_logs = client.images.build(path=base_dir, tag=tag.lower())
 
     # Run the app image in a docker container
     # https://docker-py.readthedocs.io/en/stable/containers.html#docker.models.containers.ContainerCollection.run
     runtime_error = None
     container = None
     try:
-        container = client.containers.run(
-            image,
-            command=run_command,  # May need to be careful here... Check with Ryan
-            ports=port_mapping,
-            detach=True,
-            name=tag.lower(),
-        )
+        with span("container_start", "docker"):
+            container = client.containers.run(
+                image,
+                command=run_command,  # May need to be careful here... Check with Ryan
+                ports=port_mapping,
+                detach=True,
+                name=tag.lower(),
+            )
+            host_port = get_host_port(container, expose_port)
     except APIError as e:
         runtime_error = e
+        host_port = None
+
+    # Wait til the app accepts connections, or the container exits (e.g. scripts, or a crash on startup)
+    readiness = None
+    if host_port:
+        def container_alive():
+            container.reload()
+            return container.status not in ('exited', 'dead')
 
-    # Wait til container starts
-    wait_seconds = 30
-    retry_seconds = 1
-    elapsed_time = 0
-    while not runtime_error and container.status not in ('running', 'exited') and elapsed_time < wait_seconds:
-        container.reload()
-        sleep(retry_seconds)
-        elapsed_time += retry_seconds
-        continue
+        with span("readiness", "docker") as span_args:
+            readiness = wait_until_ready(host_port, probe=readiness_probe, is_alive=container_alive)
+            span_args.update(ready=readiness.ready, attempts=readiness.attempts)
+        print(f"Container {container.name} ready={readiness.ready} in {readiness.time_to_ready}s")
 
     try:
         running_program = RunningProgram(
             container=container,
-            host_port=available_host_port,
+            host_port=host_port,
             build_logs=''.join([r.get('stream', '') for r in _build_logs]),
             base_dir=base_dir,
-            runtime_error=runtime_error
+            runtime_error=runtime_error,
+            readiness=readiness
         )
         yield running_program
 
     finally:
         # Cleanup
-        with open(os.path.join(base_dir, "build.log"), "w") as f:
-            f.write(running_program['build_logs'])
-
-        if runtime_error:
-            with open(os.path.join(base_dir, "error.log"), "w") as f:
-                f.write(str(runtime_error))
-
-        if container:
-            with open(os.path.join(base_dir, "application.log"), "w") as f:
-                f.write(container.logs().decode('utf-8'))
-            container.stop()
-            container.wait()
-            container.remove()
-
-        image.remove(force=True)
+        with span("teardown", "docker"):
+            with open(os.path.join(base_dir, "build.log"), "w") as f:
+                f.write(running_program['build_logs'])
+
+            if runtime_error:
+                with open(os.path.join(base_dir, "error.log"), "w") as f:
+                    f.write(str(runtime_error))
+
+            if container:
+                with open(os.path.join(base_dir, "application.log"), "w") as f:
+                    f.write(container.logs().decode('utf-8'))
+                container.stop()
+                container.wait()
+                container.remove()
+
+            image.remove(force=True)
 
 
 FASTAPI_HELLOWORLD = """from fastapi import FastAPI
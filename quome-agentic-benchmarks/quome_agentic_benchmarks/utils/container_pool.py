@@ -0,0 +1,211 @@
+import atexit
+import contextlib
+import io
+import os
+import shlex
+import tarfile
+import threading
+from typing import Optional, Dict
+
+from quome_agentic_benchmarks.utils.ports import get_host_port
+from quome_agentic_benchmarks.utils.readiness import ReadinessProbe, wait_until_ready
+from quome_agentic_benchmarks.utils.tracing import span
+
+# Warm container pool settings, see .env.example
+# QUOME_CONTAINER_POOL: "off" (default) or "on" to run static sites and python apps in pre-started containers.
+CONTAINER_POOL = os.environ.get("QUOME_CONTAINER_POOL", "off")
+# Max idle containers kept per pool.
+CONTAINER_POOL_SIZE = int(os.environ.get("QUOME_CONTAINER_POOL_SIZE", 4))
+
+APP_LOG_PATH = "/tmp/app.log"
+APP_PID_PATH = "/tmp/app.pid"
+# Pool containers run as nobody, like the non-root users of the Dockerfiles in utils/coding.py.
+# App directories go under /tmp, the one place nobody can create them.
+POOL_USER = "65534:65534"
+
+
+class LeasedContainer:
+    """
+    A pool container running one generated app.
+    Acts like a docker Container for the evaluators, except logs() returns the app's output
+    rather than the output of the container's idle process.
+    """
+
+    def __init__(self, container, host_port: int, app_dir: str):
+        self.container = container
+        self.host_port = host_port
+        self.app_dir = app_dir
+        self.readiness = None
+
+    def __getattr__(self, item):
+        return getattr(self.container, item)
+
+    def load(self, code_dir: str):
+        """Replaces the app directory in the container with the generated files"""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name in os.listdir(code_dir):
+                if name == "Dockerfile":
+                    continue
+                tar.add(os.path.join(code_dir, name), arcname=name, filter=_owned_by_pool_user)
+        self.container.put_archive(self.app_dir, archive.getvalue())
+
+    def start(self, run_command: str):
+        """Starts the app process in the background, output goes to APP_LOG_PATH"""
+        # run_command comes from the LLM, it's split into arguments and never goes through the shell.
+        # The shell only records the app's pid (exec keeps it) and redirects its output.
+        argv = shlex.split(run_command)
+        if not argv:
+            raise ValueError("Empty run command")
+        self.container.exec_run(
+            ["sh", "-c", f'echo $$ > {APP_PID_PATH} && cd "$0" && exec "$@" > {APP_LOG_PATH} 2>&1',
+             self.app_dir, *argv],
+            detach=True,
+        )
+
+    def is_alive(self, app_process: bool = True) -> bool:
+        """False once the container, or the app process started by start(), has exited"""
+        self.container.reload()
+        if self.container.status in ('exited', 'dead'):
+            return False
+        if not app_process:
+            return True
+        # No pid file yet means the app is still starting
+        exit_code, _output = self.container.exec_run(
+            ["sh", "-c", f"[ ! -f {APP_PID_PATH} ] || kill -0 $(cat {APP_PID_PATH})"]
+        )
+        return exit_code == 0
+
+    def logs(self) -> bytes:
+        _exit_code, output = self.container.exec_run(["cat", APP_LOG_PATH])
+        return output
+
+    def reset(self):
+        """Stops the app and clears its files, leaving the container's idle process running"""
+        # kill -1 signals every process except PID 1 (the idle process) and the shell sending it.
+        # Only the directory's contents are removed: a server serving it (busybox httpd) resolved the directory
+        # when it started, and would keep serving the deleted one if it was recreated.
+        app_dir = shlex.quote(self.app_dir)
+        self.container.exec_run(
+            ["sh", "-c", f"kill -9 -1; find {app_dir} -mindepth 1 -delete; rm -f {APP_LOG_PATH} {APP_PID_PATH}"]
+        )
+
+
+def _owned_by_pool_user(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+    # So the app can write to its directory and reset() can delete the files
+    uid, gid = POOL_USER.split(":")
+    tarinfo.uid, tarinfo.gid = int(uid), int(gid)
+    tarinfo.uname = tarinfo.gname = ""
+    return tarinfo
+
+
+class ContainerPool:
+    """
+    Pool of pre-started runtime containers for one image.
+    Containers run an idle process (or a server that picks up new files by itself, like busybox httpd).
+    Leasing a container copies in the generated files and starts the app, releasing it stops the app
+    and puts the container back, so an evaluation skips the image build and container start.
+    """
+
+    def __init__(self, image: str, container_port: int, app_dir: str, command: str,
+                 restart_app: bool = True, size: int = CONTAINER_POOL_SIZE):
+        self.image = image
+        self.container_port = container_port
+        self.app_dir = app_dir
+        self.command = command
+        self.restart_app = restart_app  # False when the container's own process serves the files
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _start_container(self) -> LeasedContainer:
+        import docker
+
+        client = docker.from_env()
+        container = client.containers.run(
+            self.image,
+            command=["sh", "-c", f"mkdir -p {shlex.quote(self.app_dir)} && exec {self.command}"],
+            ports={f'{self.container_port}/tcp': None},  # Docker picks a free host port
+            detach=True,
+            user=POOL_USER,
+            labels={"quome.pool": self.image},
+        )
+        return LeasedContainer(container, get_host_port(container, self.container_port), self.app_dir)
+
+    def _acquire(self) -> LeasedContainer:
+        with self._lock:
+            while self._idle:
+                leased = self._idle.pop()
+                leased.container.reload()
+                if leased.container.status == 'running':
+                    return leased
+                leased.container.remove(force=True)
+        return self._start_container()
+
+    def _release(self, leased: LeasedContainer):
+        try:
+            leased.reset()
+            leased.container.reload()
+            healthy = leased.container.status == 'running'
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            if healthy and len(self._idle) < self.size:
+                self._idle.append(leased)
+                return
+        leased.container.remove(force=True)
+
+    def warm(self, count: Optional[int] = None):
+        """Pre-starts containers so the first evaluations don't pay for container startup"""
+        started = [self._start_container() for _ in range(count or self.size)]
+        with self._lock:
+            self._idle.extend(started)
+
+    @contextlib.contextmanager
+    def lease(self, code_dir: str, run_command: Optional[str] = None, readiness_probe: Optional[ReadinessProbe] = None):
+        with span("pool_acquire", "docker", image=self.image):
+            leased = self._acquire()
+        try:
+            with span("load_files", "docker"):
+                leased.load(code_dir)
+            if self.restart_app:
+                with span("app_start", "docker"):
+                    leased.start(run_command)
+            with span("readiness", "docker") as span_args:
+                leased.readiness = wait_until_ready(
+                    leased.host_port, probe=readiness_probe,
+                    is_alive=lambda: leased.is_alive(app_process=self.restart_app)
+                )
+                span_args.update(ready=leased.readiness.ready, attempts=leased.readiness.attempts)
+            yield leased
+        finally:
+            with span("teardown", "docker"):
+                self._release(leased)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for leased in idle:
+            leased.container.remove(force=True)
+
+
+_pools: Dict[str, ContainerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_container_pool(key: str, **pool_kwargs) -> ContainerPool:
+    """Returns the pool for key, creating it with pool_kwargs the first time"""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ContainerPool(**pool_kwargs)
+        return _pools[key]
+
+
+@atexit.register
+def close_container_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
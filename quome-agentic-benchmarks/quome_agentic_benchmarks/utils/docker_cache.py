@@ -0,0 +1,153 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from quome_agentic_benchmarks.utils.tracing import span
+
+# Dependency layer cache settings, see .env.example
+# QUOME_DOCKER_LAYER_CACHE: "on" (default) or "off" to build every app from scratch.
+DOCKER_LAYER_CACHE = os.environ.get("QUOME_DOCKER_LAYER_CACHE", "on")
+# Local directory of wheels shared by every dependency image build. Filled from PyPI unless offline.
+PIP_WHEELHOUSE = os.environ.get("QUOME_WHEELHOUSE")
+# Only install from the wheelhouse, never reach out to PyPI.
+PIP_OFFLINE = os.environ.get("QUOME_PIP_OFFLINE", "0") == "1"
+
+DEPENDENCY_IMAGE_REPOSITORY = "quome-deps"
+PYTHON_BASE_IMAGE = "python:alpine"
+
+PYTHON_DEPENDENCY_DOCKERFILE = """FROM {base_image}
+WORKDIR /opt/app
+COPY requirements.txt requirements.txt
+{wheelhouse_copy}
+RUN pip install {pip_args} -r requirements.txt{wheelhouse_cleanup}
+"""
+
+# Only the app source goes in this image, dependencies come from the cached base image.
+PYTHON_APP_DOCKERFILE = """FROM {base_image}
+WORKDIR /opt/app
+COPY . .
+CMD ["python", "main.py"]
+"""
+
+_build_locks = defaultdict(threading.Lock)
+
+
+def normalize_requirements(requirements_txt: str) -> str:
+    """
+    Normalizes requirements so formatting differences map to the same image.
+    >>> normalize_requirements("fastapi==0.111.0\\n\\n# web\\nuvicorn  \\n")
+    'fastapi==0.111.0\\nuvicorn'
+    """
+    lines = (line.strip() for line in requirements_txt.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith('#'))
+
+
+def dependency_image_tag(requirements_txt: str, base_image: str = PYTHON_BASE_IMAGE) -> str:
+    """
+    >>> dependency_image_tag("fastapi==0.111.0") == dependency_image_tag("fastapi==0.111.0\\n")
+    True
+    """
+    key = f"{base_image}\n{normalize_requirements(requirements_txt)}"
+    return f"{DEPENDENCY_IMAGE_REPOSITORY}:{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def fill_wheelhouse(client, requirements_txt: str, wheelhouse: str, base_image: str = PYTHON_BASE_IMAGE,
+                    wheel_dir: Optional[str] = None, offline: bool = False):
+    """
+    Downloads / builds wheels for the requirements into the shared wheelhouse.
+    Runs inside the base image, so wheels match the platform they are installed on.
+    wheel_dir gets just the wheels the requirements resolve to (from the wheelhouse or newly built),
+    offline only resolves them from the wheelhouse.
+    """
+    with tempfile.TemporaryDirectory() as requirements_dir:
+        with open(os.path.join(requirements_dir, "requirements.txt"), "w") as f:
+            f.write(requirements_txt)
+
+        volumes = {
+            os.path.abspath(wheelhouse): {'bind': '/wheelhouse', 'mode': 'ro' if wheel_dir else 'rw'},
+            requirements_dir: {'bind': '/requirements', 'mode': 'ro'},
+        }
+        if wheel_dir:
+            volumes[os.path.abspath(wheel_dir)] = {'bind': '/wheels', 'mode': 'rw'}
+        no_index = " --no-index" if offline else ""
+        client.containers.run(
+            base_image,
+            command=f"pip wheel --wheel-dir {'/wheels' if wheel_dir else '/wheelhouse'} --find-links /wheelhouse"
+                    f"{no_index} -r /requirements/requirements.txt",
+            volumes=volumes,
+            remove=True,
+        )
+
+    if wheel_dir:
+        # Newly built wheels are shared with the next builds
+        for name in os.listdir(wheel_dir):
+            if not os.path.exists(os.path.join(wheelhouse, name)):
+                shutil.copy2(os.path.join(wheel_dir, name), os.path.join(wheelhouse, name))
+
+
+def get_dependency_image(requirements_txt: str, base_image: str = PYTHON_BASE_IMAGE,
+                         wheelhouse: Optional[str] = PIP_WHEELHOUSE, offline: bool = PIP_OFFLINE) -> str:
+    """
+    Returns the tag of an image with the requirements installed, building it if it doesn't exist yet.
+    Images are keyed by the hash of requirements.txt and kept between rows and runs,
+    so an app build only has to copy in its source.
+    Raises docker.errors.BuildError / ContainerError when the requirements don't install.
+    """
+    import docker
+    from docker.errors import ImageNotFound
+
+    tag = dependency_image_tag(requirements_txt, base_image)
+    client = docker.from_env()
+
+    # Rows with the same requirements often build at the same time, only build once.
+    with _build_locks[tag]:
+        try:
+            client.images.get(tag)
+            return tag
+        except ImageNotFound:
+            pass
+
+        print(f"Building dependency image {tag}")
+        with tempfile.TemporaryDirectory() as build_dir:
+            with open(os.path.join(build_dir, "requirements.txt"), "w") as f:
+                f.write(requirements_txt)
+
+            pip_args = "--no-cache-dir"
+            wheelhouse_copy = ""
+            wheelhouse_cleanup = ""
+            if wheelhouse:
+                os.makedirs(wheelhouse, exist_ok=True)
+                # Docker can only COPY from the build context. Only the wheels these requirements resolve to go in,
+                # the whole wheelhouse would be sent to the daemon on every build.
+                wheel_dir = os.path.join(build_dir, "wheelhouse")
+                os.makedirs(wheel_dir)
+                with span("fill_wheelhouse", "docker", offline=offline):
+                    fill_wheelhouse(client, requirements_txt, wheelhouse, base_image, wheel_dir=wheel_dir,
+                                    offline=offline)
+                wheelhouse_copy = "COPY wheelhouse /tmp/wheelhouse"
+                wheelhouse_cleanup = " && rm -rf /tmp/wheelhouse"
+                pip_args += " --no-index --find-links /tmp/wheelhouse"
+            elif offline:
+                raise ValueError("QUOME_PIP_OFFLINE requires a wheelhouse, set QUOME_WHEELHOUSE")
+
+            with open(os.path.join(build_dir, "Dockerfile"), "w") as f:
+                f.write(PYTHON_DEPENDENCY_DOCKERFILE.format(
+                    base_image=base_image,
+                    wheelhouse_copy=wheelhouse_copy,
+                    pip_args=pip_args,
+                    wheelhouse_cleanup=wheelhouse_cleanup,
+                ))
+
+            with span("dependency_image_build", "docker", tag=tag):
+                client.images.build(path=build_dir, tag=tag)
+
+    return tag
+
+
+def python_app_dockerfile(requirements_txt: str) -> str:
+    """Dockerfile for a python app on top of its cached dependency image"""
+    return PYTHON_APP_DOCKERFILE.format(base_image=get_dependency_image(requirements_txt))
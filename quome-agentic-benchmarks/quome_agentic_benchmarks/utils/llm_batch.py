@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+
+from quome_agentic_benchmarks.utils.tracing import Tracer, current_tracer, shared_span
+
+# Batched LLM calls, see .env.example
+# QUOME_LLM_BATCH: "off" (default) or "on" to coalesce the same node's calls for concurrent rows into one batch.
+LLM_BATCH_MODE = os.environ.get("QUOME_LLM_BATCH", "off")
+LLM_BATCH_WINDOW = float(os.environ.get("QUOME_LLM_BATCH_WINDOW", 0.05))  # Seconds to wait for more rows
+LLM_BATCH_SIZE = int(os.environ.get("QUOME_LLM_BATCH_SIZE", 16))
+
+
+class BatchedRunnable(Runnable):
+    """
+    Coalesces invoke() calls made around the same time by different rows into one runnable.batch() call
+    (ainvoke() into one abatch()). The first call of a batch waits up to window seconds for others to join,
+    a full batch is sent right away.
+    Each call keeps its own config, so callbacks (LLM usage, tracing) and cache lookups are still per row,
+    and every row in a batch gets the llm_batch span in its trace.
+
+    Wrap a model once per agent graph, graphs are shared between the rows of an (agent, model), so calls are
+    grouped by model. Batches are only as large as the number of rows generating at the same time, see
+    max_generation_concurrency / provider_concurrency in run.py.
+
+    Chat models send the batch as concurrent requests. Providers with a real batch endpoint can override batch().
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> from langchain_core.runnables import RunnableLambda
+    >>> double = BatchedRunnable(RunnableLambda(lambda x: x * 2), window=1, max_batch_size=4)
+    >>> with ThreadPoolExecutor(4) as pool:
+    ...     list(pool.map(double.invoke, [1, 2, 3, 4]))
+    [2, 4, 6, 8]
+    >>> double.batches
+    1
+    """
+
+    def __init__(self, runnable: Runnable, window: float = LLM_BATCH_WINDOW, max_batch_size: int = LLM_BATCH_SIZE):
+        self.runnable = runnable
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = 0  # Number of batch() / abatch() calls made, for stats
+        self._pending: Optional[List[Tuple[Any, RunnableConfig, Future, Optional[Tracer]]]] = None
+        self._cond = threading.Condition()
+        self._apending: Optional[List[Tuple[Any, RunnableConfig, asyncio.Future, Optional[Tracer]]]] = None
+        self._afull: Optional[asyncio.Event] = None
+
+    def get_name(self, suffix: Optional[str] = None, *, name: Optional[str] = None) -> str:
+        return self.runnable.get_name(suffix, name=name)
+
+    def _split(self, batch):
+        inputs = [item[0] for item in batch]
+        configs = [item[1] for item in batch]
+        tracers = [item[3] for item in batch]
+        return inputs, configs, tracers
+
+    @staticmethod
+    def _resolve(batch, outputs):
+        for (_input, _config, future, _tracer), output in zip(batch, outputs):
+            if future.done():
+                continue  # Cancelled by its caller
+            if isinstance(output, BaseException):
+                future.set_exception(output)
+            else:
+                future.set_result(output)
+
+    @staticmethod
+    def _stopped(batch, error: BaseException):
+        """
+        Fails the rows of a batch that didn't run, e.g. because the leader was cancelled or interrupted.
+        The other rows get a RuntimeError, cancelling / interrupting them too is up to their own callers.
+        """
+        if not isinstance(error, Exception):
+            error = RuntimeError(f"LLM batch stopped before it finished: {error!r}")
+        BatchedRunnable._resolve(batch, [error] * len(batch))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Resolve the config in the caller's thread, it holds this row's callbacks (see ensure_config)
+        future = Future()
+        with self._cond:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = []
+            batch.append((input, ensure_config(config), future, current_tracer()))
+            if len(batch) >= self.max_batch_size:
+                self._pending = None
+                self._cond.notify_all()
+
+        if leader:
+            try:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._pending is not batch, timeout=self.window)
+            finally:
+                # Even if interrupted while waiting, so later calls don't join a batch nobody runs
+                with self._cond:
+                    if self._pending is batch:
+                        self._pending = None
+            try:
+                self._run(batch)
+            except BaseException as e:
+                future.cancel()  # The leader raises e itself
+                self._stopped(batch, e)
+                raise
+        return future.result()
+
+    def _run(self, batch):
+        inputs, configs, tracers = self._split(batch)
+        self.batches += 1
+        with shared_span(tracers, f"llm_batch {self.get_name()}", "llm", size=len(batch)):
+            try:
+                # Fresh context, so the leader row's config doesn't leak into the other rows' calls
+                outputs = contextvars.Context().run(
+                    self.runnable.batch, inputs, configs, return_exceptions=True
+                )
+            except Exception as e:
+                outputs = [e] * len(batch)
+        self._resolve(batch, outputs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._apending
+        leader = batch is None
+        if leader:
+            batch = self._apending = []
+            full = self._afull = asyncio.Event()
+        batch.append((input, ensure_config(config), future, current_tracer()))
+        if len(batch) >= self.max_batch_size:
+            self._apending = None
+            self._afull.set()
+
+        if leader:
+            try:
+                try:
+                    await asyncio.wait_for(full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    # Even if cancelled while waiting, so later calls don't join a batch nobody runs
+                    if self._apending is batch:
+                        self._apending = None
+                await self._arun(batch)
+            except BaseException as e:
+                future.cancel()  # The leader raises e itself
+                self._stopped(batch, e)
+                raise
+        return await future
+
+    async def _arun(self, batch):
+        inputs, configs, tracers = self._split(batch)
+        self.batches += 1
+        with shared_span(tracers, f"llm_batch {self.get_name()}", "llm", size=len(batch)):
+            try:
+                outputs = await self.runnable.abatch(inputs, configs, return_exceptions=True)
+            except Exception as e:
+                outputs = [e] * len(batch)
+        self._resolve(batch, outputs)
+
+
+def batched(runnable: Runnable) -> Runnable:
+    """BatchedRunnable around the runnable with QUOME_LLM_BATCH=on, else the runnable itself"""
+    if LLM_BATCH_MODE != "on":
+        return runnable
+    return BatchedRunnable(runnable)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+# Cache settings, see .env.example
+# QUOME_LLM_CACHE: "on" (default), "off" to bypass the cache, "refresh" to skip lookups but still store responses.
+LLM_CACHE_MODE = os.environ.get("QUOME_LLM_CACHE", "on")
+LLM_CACHE_DIR = os.environ.get("QUOME_LLM_CACHE_DIR", os.path.join(os.getcwd(), ".llm_cache"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("QUOME_LLM_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Eviction frees the cache down to this fraction of max_bytes (low-water mark),
+# so the cache dir is scanned once per ~10% of max_bytes written instead of on every new entry.
+LLM_CACHE_LOW_WATER = 0.9
+
+
+class DiskLLMCache(BaseCache):
+    """
+    Content-addressed LLM response cache stored on disk.
+
+    LangChain calls lookup/update with the serialized messages (prompt) and a string describing the model
+    (llm_string). The llm_string includes the provider, model name, params like temperature and any bound
+    tools, so structured output schemas are part of the key too.
+    Entries are evicted least recently used first once the cache is larger than max_bytes, in one batch
+    down to low_water * max_bytes. The size is kept as a running total, the directory is only read when evicting.
+
+    Use by passing it to a model: ChatOpenAI(model=..., cache=DiskLLMCache(...))
+    See https://python.langchain.com/v0.2/docs/how_to/chat_model_caching/
+    """
+
+    def __init__(self, directory: str = LLM_CACHE_DIR, max_bytes: int = LLM_CACHE_MAX_BYTES, refresh=False,
+                 low_water: float = LLM_CACHE_LOW_WATER):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.refresh = refresh  # Don't read from the cache, only write new responses.
+        self._lock = threading.Lock()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        return Path(self.directory).glob("*/*.json")
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.refresh:
+            return None
+
+        path = self._path(self.key(prompt, llm_string))
+        try:
+            with open(path, "r") as f:
+                generations = loads(f.read())
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError):
+            return None
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        path = self._path(self.key(prompt, llm_string))
+        data = dumps(list(return_val))
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            # Write to a temp file and rename, so concurrent readers never see a partial entry.
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._size += os.path.getsize(path) - previous_size
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Removes least recently used entries until the cache is at its low-water mark.
+
+        >>> import tempfile
+        >>> cache = DiskLLMCache(tempfile.mkdtemp(), max_bytes=1000, low_water=0.5)
+        >>> for i in range(4):
+        ...     cache.update(f"prompt {i}", "llm", [])
+        >>> size = cache._size
+        >>> cache.max_bytes = size - 1
+        >>> cache.update("prompt 4", "llm", [])  # Over the limit, evicts past it down to half
+        >>> cache._size <= cache.max_bytes // 2, cache._size == sum(p.stat().st_size for p in cache._entries())
+        (True, True)
+        """
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Removed since the glob
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(key=lambda e: e[0])
+
+        target = int(self.max_bytes * self.low_water)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+
+_llm_cache: Optional[DiskLLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[DiskLLMCache]:
+    """Shared cache for agent models. Returns None when the cache is bypassed (QUOME_LLM_CACHE=off)."""
+    global _llm_cache
+    if LLM_CACHE_MODE == "off":
+        return None
+
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskLLMCache(refresh=LLM_CACHE_MODE == "refresh")
+    return _llm_cache
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+from uuid import UUID
+
+from quome_agentic_benchmarks.utils.tracing import NodeTrackingCallbackHandler, model_name
+
+
+@dataclass
+class LLMCall:
+    node: Optional[str]
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float  # Seconds from request to the full response
+    time_to_first_token: Optional[float]  # Only known when the model streams tokens (e.g. ChatOllama)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        return self.completion_tokens / self.latency if self.latency > 0 else None
+
+
+class LLMUsage:
+    """Token usage and latency of every LLM call made while generating one row"""
+
+    def __init__(self):
+        self.calls: List[LLMCall] = []
+        self._lock = threading.Lock()
+
+    def record(self, call: LLMCall):
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+
+        def totals(group: List[LLMCall]):
+            latency = sum(c.latency for c in group)
+            completion_tokens = sum(c.completion_tokens for c in group)
+            ttfts = [c.time_to_first_token for c in group if c.time_to_first_token is not None]
+            return {
+                'calls': len(group),
+                'prompt_tokens': sum(c.prompt_tokens for c in group),
+                'completion_tokens': completion_tokens,
+                'total_tokens': sum(c.prompt_tokens + c.completion_tokens for c in group),
+                'latency': latency,
+                'tokens_per_second': completion_tokens / latency if latency > 0 else None,
+                'mean_time_to_first_token': sum(ttfts) / len(ttfts) if ttfts else None,
+            }
+
+        by_node = defaultdict(list)
+        for call in calls:
+            by_node[call.node or 'unknown'].append(call)
+
+        return {
+            **totals(calls),
+            'nodes': {node: totals(group) for node, group in by_node.items()},
+            'call_log': [{**asdict(c), 'tokens_per_second': c.tokens_per_second} for c in calls],
+        }
+
+
+def token_counts(response) -> Tuple[int, int]:
+    """
+    (prompt tokens, completion tokens) of an LLMResult.
+    Providers report usage in different places: usage_metadata (newer langchain), response_metadata['token_usage']
+    (OpenAI), llm_output (OpenAI, not set on cache hits) or generation_info eval counts (Ollama).
+    """
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, 'message', None)
+            usage_metadata = getattr(message, 'usage_metadata', None)
+            response_metadata = getattr(message, 'response_metadata', None) or {}
+            generation_info = generation.generation_info or {}
+            if usage_metadata:
+                prompt_tokens += usage_metadata.get('input_tokens', 0)
+                completion_tokens += usage_metadata.get('output_tokens', 0)
+            elif response_metadata.get('token_usage'):
+                prompt_tokens += response_metadata['token_usage'].get('prompt_tokens', 0)
+                completion_tokens += response_metadata['token_usage'].get('completion_tokens', 0)
+            elif 'eval_count' in generation_info:
+                prompt_tokens += generation_info.get('prompt_eval_count', 0)
+                completion_tokens += generation_info.get('eval_count', 0)
+
+    if not (prompt_tokens or completion_tokens):
+        token_usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = token_usage.get('prompt_tokens', 0)
+        completion_tokens = token_usage.get('completion_tokens', 0)
+    return prompt_tokens, completion_tokens
+
+
+class LLMMetricsCallbackHandler(NodeTrackingCallbackHandler):
+    """
+    Records tokens, latency and time to first token of each LLM call in an agent graph, with the calling node.
+    Pass in the graph config: {"callbacks": [LLMMetricsCallbackHandler(usage, node_names)]}
+    """
+
+    def __init__(self, usage: LLMUsage, node_names: Iterable[str]):
+        super().__init__(node_names)
+        self.usage = usage
+        self._calls: Dict[UUID, dict] = {}
+
+    def _on_model_start(self, serialized, run_id, parent_run_id, kwargs):
+        model = model_name(serialized, kwargs.get("invocation_params"))
+        self._remember(run_id, parent_run_id, f"llm:{model}")
+        node = self.node_for_run(parent_run_id)
+        with self._lock:
+            self._calls[run_id] = {'model': model, 'node': node, 'start': time.perf_counter(), 'first_token': None}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._on_model_start(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._on_model_start(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.get(run_id)
+            if call and call['first_token'] is None:
+                call['first_token'] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        end = time.perf_counter()
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+
+        prompt_tokens, completion_tokens = token_counts(response)
+        self.usage.record(LLMCall(
+            node=call['node'],
+            model=call['model'],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=end - call['start'],
+            time_to_first_token=call['first_token'] - call['start'] if call['first_token'] else None,
+        ))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._calls.pop(run_id, None)
+
+
+def efficiency(points, usage_summary: Dict[str, Any], generation_seconds: Optional[float]) -> Dict[str, Any]:
+    """
+    Points per 1k tokens and per second of generation, for comparing agents on cost rather than only points.
+    >>> efficiency(50, {'total_tokens': 2000}, 10.0)
+    {'points_per_1k_tokens': 25.0, 'points_per_second': 5.0}
+    """
+    total_tokens = usage_summary.get('total_tokens')
+    return {
+        'points_per_1k_tokens': points / (total_tokens / 1000) if total_tokens else None,
+        'points_per_second': points / generation_seconds if generation_seconds else None,
+    }
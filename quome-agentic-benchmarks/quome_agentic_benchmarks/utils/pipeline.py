@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Iterable, Iterator, Optional, Tuple
+
+_DONE = object()  # Stage finished marker on the queues
+
+
+def run_pipeline(items: Iterable[Any], generate: Callable[[Any], Any], evaluate: Callable[[Any, Any], Any],
+                 generation_workers: int = 1, evaluation_workers: int = 1,
+                 max_queued: Optional[int] = None) -> Iterator[Tuple[int, Any, Any]]:
+    """
+    Runs generate(item) and evaluate(item, generated) as two pipeline stages, on their own threads, connected by a
+    queue of at most max_queued outputs (defaults to evaluation_workers). The next items generate while earlier
+    ones are evaluated, so the LLM isn't idle during Docker builds and Docker isn't idle during generation.
+    When evaluation falls behind, generation waits for room in the queue instead of piling up outputs.
+
+    items are read as the generation workers get to them, so a generator of rows is never held in memory as a whole.
+    Yields (index, item, result) as evaluations finish, index is the item's position in items.
+    Items that raised have the exception as their result.
+
+    >>> import time
+    >>> def generate(x):
+    ...     time.sleep(0.1)
+    ...     return x * 2
+    >>> def evaluate(x, generated):
+    ...     time.sleep(0.1)
+    ...     if x == 3:
+    ...         raise ValueError("bad row")
+    ...     return generated + 1
+    >>> start = time.monotonic()
+    >>> [result for _i, _item, result in sorted(run_pipeline(iter([1, 2, 3, 4]), generate, evaluate))]
+    [3, 5, ValueError('bad row'), 9]
+    >>> time.monotonic() - start < 0.7  # 0.5s pipelined, 0.8s one row after the other
+    True
+    """
+    generated = queue.Queue(maxsize=max_queued or evaluation_workers)
+    finished = queue.Queue()  # Drained by the caller as results come in
+    todo = iter(enumerate(items))
+    todo_lock = threading.Lock()
+    stop = threading.Event()  # Set when the caller stops early, or reading items failed
+    errors = []
+
+    def generator():
+        while not stop.is_set():
+            with todo_lock:
+                try:
+                    i, item = next(todo)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+                    return
+            try:
+                output = generate(item)
+            except Exception as e:
+                finished.put((i, item, e))
+                continue
+            # Blocks while the queue is full (back-pressure)
+            generated.put((i, item, output))
+
+    def evaluator():
+        while True:
+            entry = generated.get()
+            if entry is _DONE:
+                return
+            i, item, output = entry
+            try:
+                result = evaluate(item, output)
+            except Exception as e:
+                result = e
+            finished.put((i, item, result))
+
+    def close(generators, evaluators):
+        for future in generators:
+            future.result()
+        for _ in evaluators:
+            generated.put(_DONE)  # After the queued outputs
+        for future in evaluators:
+            future.result()
+        finished.put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=generation_workers + evaluation_workers + 1,
+                                  thread_name_prefix="pipeline")
+    try:
+        generators = [executor.submit(generator) for _ in range(generation_workers)]
+        evaluators = [executor.submit(evaluator) for _ in range(evaluation_workers)]
+        executor.submit(close, generators, evaluators)
+        while (entry := finished.get()) is not _DONE:
+            yield entry
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()  # Rows in flight still finish
+        executor.shutdown(wait=True)
+
+
+async def arun_pipeline(items: Iterable[Any], agenerate: Callable[[Any], Any], aevaluate: Callable[[Any, Any], Any],
+                        generation_slot: Optional[Callable[[Any], AsyncContextManager]] = None,
+                        evaluation_workers: int = 1, max_queued: Optional[int] = None,
+                        max_in_flight: int = 16) -> AsyncIterator[Tuple[int, Any, Any]]:
+    """
+    Async version of run_pipeline. Items generate concurrently, limited by generation_slot(item)
+    (e.g. a per provider semaphore). A slot is held until the output is queued, so a full queue holds up generation.
+    At most max_in_flight items are read ahead of evaluation (generating or waiting for a slot).
+
+    >>> async def agenerate(x):
+    ...     await asyncio.sleep(0.01)
+    ...     return x * 2
+    >>> async def aevaluate(x, generated):
+    ...     return generated + 1
+    >>> async def main():
+    ...     one_at_a_time = asyncio.Semaphore(1)
+    ...     pipeline = arun_pipeline(iter([1, 2, 3]), agenerate, aevaluate, generation_slot=lambda x: one_at_a_time)
+    ...     return sorted([(i, result) async for i, _item, result in pipeline])
+    >>> asyncio.run(main())
+    [(0, 3), (1, 5), (2, 7)]
+    """
+    generated = asyncio.Queue(maxsize=max_queued or evaluation_workers)
+    finished = asyncio.Queue()
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def agenerator(i, item):
+        try:
+            async with generation_slot(item) if generation_slot else contextlib.nullcontext():
+                try:
+                    output = await agenerate(item)
+                except Exception as e:
+                    await finished.put((i, item, e))
+                    return
+                await generated.put((i, item, output))
+        finally:
+            in_flight.release()
+
+    async def feed():
+        generators = set()
+        try:
+            for i, item in enumerate(items):
+                await in_flight.acquire()
+                task = asyncio.create_task(agenerator(i, item))
+                generators.add(task)
+                task.add_done_callback(generators.discard)
+        finally:
+            await asyncio.gather(*list(generators))
+            for _ in range(evaluation_workers):
+                await generated.put(_DONE)
+
+    async def aevaluator():
+        try:
+            while (entry := await generated.get()) is not _DONE:
+                i, item, output = entry
+                try:
+                    result = await aevaluate(item, output)
+                except Exception as e:
+                    result = e
+                await finished.put((i, item, result))
+        finally:
+            await finished.put(_DONE)
+
+    feeder = asyncio.create_task(feed())
+    evaluators = [asyncio.create_task(aevaluator()) for _ in range(evaluation_workers)]
+    try:
+        remaining = evaluation_workers
+        while remaining:
+            entry = await finished.get()
+            if entry is _DONE:
+                remaining -= 1
+                continue
+            yield entry
+        await feeder  # Raises if reading items failed
+    finally:
+        for task in [feeder, *evaluators]:
+            task.cancel()
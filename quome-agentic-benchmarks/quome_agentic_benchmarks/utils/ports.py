@@ -0,0 +1,17 @@
+from typing import Optional
+
+
+def get_host_port(container, container_port: int) -> Optional[int]:
+    """
+    Host port Docker published container_port on.
+    Containers are started with ports={'<port>/tcp': None}, which lets Docker pick a free ephemeral host port.
+    Docker hands out ports atomically, so parallel evaluations never collide and we don't need to scan
+    existing containers for a free port. Returns None if the container already exited.
+    """
+    container.reload()
+    bindings = container.ports.get(f'{container_port}/tcp') or []
+    # Docker may publish the port on IPv4 and IPv6, both get the same host port.
+    for binding in bindings:
+        if binding.get('HostPort'):
+            return int(binding['HostPort'])
+    return None
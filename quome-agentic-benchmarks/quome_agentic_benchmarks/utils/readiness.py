@@ -0,0 +1,75 @@
+import contextlib
+import socket
+import time
+from dataclasses import dataclass
+from typing import TypedDict, NotRequired, Optional, Callable, Literal
+
+import requests
+
+
+class ReadinessProbe(TypedDict):
+    # "http" waits for any HTTP response, "tcp" for the port to accept connections.
+    # Prefer http for docker apps: docker's userland proxy accepts TCP connections on the host port
+    # before the app inside the container is listening.
+    type: Literal["http", "tcp"]
+    path: NotRequired[str]  # For http probes, defaults to "/"
+    success_only: NotRequired[bool]  # For http probes, only count 2xx responses (e.g. a static site's index page)
+    deadline: NotRequired[float]  # Seconds to wait before giving up
+
+
+DEFAULT_READINESS_PROBE = ReadinessProbe(type="http", path="/", deadline=30)
+# Static file servers answer straight away, a 404 for / means the site's files are missing
+STATIC_READINESS_PROBE = ReadinessProbe(type="http", path="/", deadline=10, success_only=True)
+
+
+@dataclass
+class ReadinessResult:
+    ready: bool
+    time_to_ready: Optional[float]  # Seconds from the start of probing until the app answered
+    attempts: int
+    error: Optional[str] = None
+
+
+def probe_once(host: str, port: int, probe: ReadinessProbe, timeout: float = 1) -> bool:
+    if probe['type'] == 'tcp':
+        with contextlib.suppress(OSError), socket.create_connection((host, port), timeout=timeout):
+            return True
+        return False
+
+    try:
+        response = requests.get(f"http://{host}:{port}{probe.get('path', '/')}", timeout=timeout)
+    except requests.RequestException:
+        return False
+    if probe.get('success_only'):
+        return 200 <= response.status_code < 300
+    return True  # Any response, even a 404, means the app is accepting requests
+
+
+def wait_until_ready(port: int, host: str = "0.0.0.0", probe: Optional[ReadinessProbe] = None,
+                     is_alive: Optional[Callable[[], bool]] = None, initial_backoff: float = 0.05,
+                     max_backoff: float = 1.0) -> ReadinessResult:
+    """
+    Probes the app until it answers, its deadline passes, or is_alive() says it is gone (e.g. container exited).
+    Retries back off exponentially from initial_backoff to max_backoff, so fast apps are picked up
+    within milliseconds while slow ones don't get hammered (and neither does dockerd via is_alive).
+    """
+    probe = probe or DEFAULT_READINESS_PROBE
+    deadline = probe.get('deadline', DEFAULT_READINESS_PROBE['deadline'])
+    start = time.monotonic()
+    backoff = initial_backoff
+    attempts = 0
+
+    while True:
+        attempts += 1
+        if probe_once(host, port, probe):
+            return ReadinessResult(True, time.monotonic() - start, attempts)
+
+        if is_alive is not None and not is_alive():
+            return ReadinessResult(False, None, attempts, error="App exited before it was ready")
+
+        remaining = deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            return ReadinessResult(False, None, attempts, error=f"App not ready after {deadline} seconds")
+
+        time.sleep(min(backoff, remaining))
+        backoff = min(backoff * 2, max_backoff)
@@ -0,0 +1,236 @@
+"""
+Columnar store for benchmark results.
+
+Results are written per row as benchmark_results/<run>/<task>/<agent_id>/<row>/evaluation_results.json.
+ingest() loads them once into two Parquet tables, partitioned by run and task, so reports read a few
+columnar files instead of parsing thousands of small JSON files:
+- rows: one record per evaluated row (points, tokens, efficiency, time to ready)
+- sub_evals: one record per sub-eval of a row (e.g. path_exists-tweets), with whether it passed
+
+Usage:
+    python -m quome_agentic_benchmarks.utils.results_store ingest
+    python -m quome_agentic_benchmarks.utils.results_store leaderboard --task prompt_to_api
+    python -m quome_agentic_benchmarks.utils.results_store diff 20240626-080510 20240627-101500
+"""
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from quome_agentic_benchmarks.utils.benchmark import BENCHMARK_RESULTS_DIR
+
+RESULTS_STORE_DIR = os.path.join(BENCHMARK_RESULTS_DIR, "_store")
+PARTITION_COLUMNS = ["run", "task"]
+
+_KEY_FIELDS = [
+    pa.field("run", pa.string()),
+    pa.field("task", pa.string()),
+    pa.field("agent_id", pa.string()),
+    pa.field("model", pa.string()),
+    pa.field("row", pa.string()),
+]
+
+# Fixed column types. Written without them, a column that's all None in a run (e.g. load_p95 with the load test off)
+# is stored as null in that run's partition, and reading it together with other runs fails.
+SCHEMAS = {
+    "rows": pa.schema(_KEY_FIELDS + [
+        pa.field("dataset_version", pa.string()),
+        pa.field("points", pa.float64()),
+        pa.field("successful", pa.int64()),
+        pa.field("failed", pa.int64()),
+        pa.field("prompt_tokens", pa.int64()),
+        pa.field("completion_tokens", pa.int64()),
+        pa.field("total_tokens", pa.int64()),
+        pa.field("llm_calls", pa.int64()),
+        pa.field("generation_seconds", pa.float64()),
+        pa.field("time_to_ready", pa.float64()),
+        pa.field("points_per_1k_tokens", pa.float64()),
+        pa.field("points_per_second", pa.float64()),
+        pa.field("load_max_rps", pa.float64()),
+        pa.field("load_p95", pa.float64()),
+        pa.field("load_error_rate", pa.float64()),
+    ]),
+    "sub_evals": pa.schema(_KEY_FIELDS + [
+        pa.field("sub_eval", pa.string()),
+        pa.field("passed", pa.bool_()),
+    ]),
+}
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_run(results_dir: str, run: str) -> Tuple[List[dict], List[dict]]:
+    """Reads a run's evaluation_results.json files into (rows, sub_evals) records"""
+    rows, sub_evals = [], []
+    for results_path in sorted(Path(results_dir, run).glob("*/*/*/evaluation_results.json")):
+        row_dir = results_path.parent
+        task, agent_id, row = row_dir.parent.parent.name, row_dir.parent.name, row_dir.name
+        results = _read_json(str(results_path))
+        if not isinstance(results, dict):
+            continue
+        metadata = _read_json(str(row_dir / "metadata.json")) or {}
+
+        key = {'run': run, 'task': task, 'agent_id': agent_id, 'model': metadata.get('model'), 'row': row}
+        usage = results.get('llm_usage') or {}
+        efficiency = results.get('efficiency') or {}
+        metrics = results.get('metrics') or {}
+        load_levels = (results.get('load_test') or {}).get('levels') or [{}]
+        rows.append({
+            **key,
+            'dataset_version': metadata.get('dataset_version'),
+            'points': results.get('points'),
+            'successful': len(results.get('successful', [])),
+            'failed': len(results.get('failed', [])),
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+            'total_tokens': usage.get('total_tokens'),
+            'llm_calls': usage.get('calls'),
+            'generation_seconds': results.get('generation_seconds'),
+            'time_to_ready': metrics.get('time_to_ready'),
+            'points_per_1k_tokens': efficiency.get('points_per_1k_tokens'),
+            'points_per_second': efficiency.get('points_per_second'),
+            'load_max_rps': max((level['rps'] for level in load_levels if 'rps' in level), default=None),
+            'load_p95': load_levels[-1].get('p95'),  # At the highest concurrency
+            'load_error_rate': load_levels[-1].get('error_rate'),
+        })
+        sub_evals.extend({**key, 'sub_eval': name, 'passed': True} for name in results.get('successful', []))
+        sub_evals.extend({**key, 'sub_eval': name, 'passed': False} for name in results.get('failed', []))
+    return rows, sub_evals
+
+
+class ResultsStore:
+    """Parquet tables of benchmark results, with the queries we use for reports"""
+
+    def __init__(self, store_dir: str = RESULTS_STORE_DIR):
+        self.store_dir = store_dir
+
+    def _table_dir(self, table: str) -> str:
+        return os.path.join(self.store_dir, table)
+
+    def ingested_runs(self) -> List[str]:
+        table_dir = Path(self._table_dir("rows"))
+        if not table_dir.exists():
+            return []
+        return sorted(p.name.split("=", 1)[1] for p in table_dir.glob("run=*"))
+
+    def ingest(self, results_dir: str = BENCHMARK_RESULTS_DIR, runs: Optional[List[str]] = None,
+               refresh: bool = False) -> List[str]:
+        """
+        Loads runs from results_dir into the store. Runs that were already ingested are skipped
+        unless refresh is set (e.g. for a run that was still in progress). Returns the ingested runs.
+        """
+        if runs is None:
+            runs = sorted(
+                p.name for p in Path(results_dir).iterdir()
+                if p.is_dir() and not p.name.startswith("_")
+            )
+        if not refresh:
+            done = set(self.ingested_runs())
+            runs = [run for run in runs if run not in done]
+
+        for run in runs:
+            rows, sub_evals = load_run(results_dir, run)
+            for table, records in (("rows", rows), ("sub_evals", sub_evals)):
+                # Replace the run's partitions, writing to an existing partition would add files next to the old ones.
+                shutil.rmtree(os.path.join(self._table_dir(table), f"run={run}"), ignore_errors=True)
+                if records:
+                    schema = SCHEMAS[table]
+                    pd.DataFrame.from_records(records, columns=schema.names).to_parquet(
+                        self._table_dir(table), partition_cols=PARTITION_COLUMNS, index=False, schema=schema
+                    )
+            print(f"Ingested run {run}: {len(rows)} rows, {len(sub_evals)} sub-evals")
+        return runs
+
+    def table(self, table: str, run: Optional[str] = None, task: Optional[str] = None) -> pd.DataFrame:
+        """Reads a table, only touching the partitions for the given run / task"""
+        table_dir = self._table_dir(table)
+        if not os.path.exists(table_dir):
+            return pd.DataFrame()
+        filters = [(column, "=", value) for column, value in (("run", run), ("task", task)) if value]
+        df = pd.read_parquet(table_dir, filters=filters or None, schema=SCHEMAS.get(table))
+        for column in PARTITION_COLUMNS:
+            df[column] = df[column].astype(str)  # Partition columns are read back as categories
+        return df
+
+    def leaderboard(self, task: Optional[str] = None, run: Optional[str] = None) -> pd.DataFrame:
+        """Agents ranked by mean points per task, with their token usage and efficiency"""
+        rows = self.table("rows", run=run, task=task)
+        if rows.empty:
+            return rows
+        board = rows.groupby(["task", "agent_id"], as_index=False, dropna=False).agg(
+            rows=("row", "count"),
+            mean_points=("points", "mean"),
+            total_points=("points", "sum"),
+            mean_tokens=("total_tokens", "mean"),
+            points_per_1k_tokens=("points_per_1k_tokens", "mean"),
+            points_per_second=("points_per_second", "mean"),
+            mean_time_to_ready=("time_to_ready", "mean"),
+            mean_load_max_rps=("load_max_rps", "mean"),
+        )
+        return board.sort_values(["task", "mean_points"], ascending=[True, False]).reset_index(drop=True)
+
+    def sub_eval_pass_rates(self, task: Optional[str] = None, run: Optional[str] = None) -> pd.DataFrame:
+        """Fraction of rows passing each sub-eval, per agent"""
+        sub_evals = self.table("sub_evals", run=run, task=task)
+        if sub_evals.empty:
+            return sub_evals
+        return sub_evals.pivot_table(
+            index=["task", "sub_eval"], columns="agent_id", values="passed", aggfunc="mean"
+        ).reset_index()
+
+    def diff_runs(self, run_a: str, run_b: str, task: Optional[str] = None) -> pd.DataFrame:
+        """Points per (task, agent, row) in two runs, and the change from run_a to run_b"""
+        key = ["task", "agent_id", "row"]
+        a = self.table("rows", run=run_a, task=task)
+        b = self.table("rows", run=run_b, task=task)
+        if a.empty and b.empty:
+            return pd.DataFrame()
+        diff = pd.merge(
+            a[key + ["points"]] if not a.empty else pd.DataFrame(columns=key + ["points"]),
+            b[key + ["points"]] if not b.empty else pd.DataFrame(columns=key + ["points"]),
+            on=key, how="outer", suffixes=(f"_{run_a}", f"_{run_b}"),
+        )
+        diff["change"] = diff[f"points_{run_b}"] - diff[f"points_{run_a}"]
+        return diff.sort_values("change", na_position="first").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark results store")
+    parser.add_argument("--results-dir", default=BENCHMARK_RESULTS_DIR)
+    parser.add_argument("--store-dir", default=RESULTS_STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_command = commands.add_parser("ingest", help="Load new runs into the store")
+    ingest_command.add_argument("runs", nargs="*", help="Runs to (re)ingest, defaults to every new run")
+
+    for name in ("leaderboard", "pass_rates"):
+        query_command = commands.add_parser(name)
+        query_command.add_argument("--task")
+        query_command.add_argument("--run")
+
+    diff_command = commands.add_parser("diff", help="Compare the points of two runs")
+    diff_command.add_argument("run_a")
+    diff_command.add_argument("run_b")
+    diff_command.add_argument("--task")
+
+    args = parser.parse_args()
+    store = ResultsStore(args.store_dir)
+    if args.command == "ingest":
+        store.ingest(args.results_dir, runs=args.runs or None, refresh=bool(args.runs))
+    elif args.command == "leaderboard":
+        print(store.leaderboard(task=args.task, run=args.run).to_markdown(index=False))
+    elif args.command == "pass_rates":
+        print(store.sub_eval_pass_rates(task=args.task, run=args.run).to_markdown(index=False))
+    elif args.command == "diff":
+        print(store.diff_runs(args.run_a, args.run_b, task=args.task).to_markdown(index=False))
@@ -0,0 +1,165 @@
+import asyncio
+import traceback
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from langchain_core.runnables import Runnable
+
+from quome_agentic_benchmarks.registry import AGENTS, TASKS, matrix_cells
+from quome_agentic_benchmarks.utils.benchmark import EvaluationMetadata
+from quome_agentic_benchmarks.utils.pipeline import run_pipeline, arun_pipeline
+from quome_agentic_benchmarks.tasks.base import BaseTask, generate_task_output, evaluate_task_output, \
+    agenerate_task_output, aevaluate_task_output
+
+# Max concurrent agent runs per model provider on the async path.
+# Hosted APIs take many parallel requests, a local Ollama server only a couple.
+DEFAULT_PROVIDER_CONCURRENCY = {
+    "openai": 16,
+    "ollama": 2,
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkJob:
+    """One cell of the benchmark matrix: a single dataset row for a (task, agent, model)"""
+    task: BaseTask
+    agent_id: str
+    agent_runnable: Runnable
+    model: str
+    task_row: dict
+    expected: Any
+    provider: str = "default"
+
+    @property
+    def name(self) -> str:
+        return f"{self.task.name}/{self.agent_id}/{self.task_row['name']}"
+
+
+def job_agent_id(model: str, agent_runnable: Runnable) -> str:
+    return f"{model}-{agent_runnable.name}"
+
+
+def expand_matrix(task_names, agent_names, model_names, tools, checkpointer=None, row_names=None,
+                  row_tags=None) -> Iterator[BenchmarkJob]:
+    """
+    Expands task x agent x model x dataset row into independent jobs, yielded as the dataset rows are read
+    so large (streamed) datasets are never held in memory.
+    Pairs the agent doesn't support are dropped from the registry metadata first (see registry.py), so only the
+    agents and tasks in use are imported. Agent graphs are built once per (agent, model) and shared between that
+    pair's jobs.
+    row_names / row_tags only keep the dataset rows with one of those names / tags.
+    """
+    graphs = {}  # (agent, model) -> agent graph
+    for task_name, agent_name, model in matrix_cells(task_names, agent_names, model_names):
+        if (agent_name, model) not in graphs:
+            graphs[agent_name, model] = AGENTS.get(agent_name).load().agent(
+                llm=model,
+                tools=tools,
+                checkpointer=checkpointer
+            )
+        agent_to_test = graphs[agent_name, model]
+        if not agent_to_test:
+            # The agent turned the model down
+            continue
+
+        task = TASKS.get(task_name).load()
+        agent_id = job_agent_id(model, agent_to_test)
+        for task_row, expected in task.dataset.select(row_names, row_tags).rows:
+            yield BenchmarkJob(
+                task, agent_id, agent_to_test, model, task_row, expected,
+                provider=AGENTS.get(agent_name).provider
+            )
+
+
+def pending_jobs(jobs: Iterable[BenchmarkJob], benchmark_start: datetime) -> Iterator[BenchmarkJob]:
+    """Drops jobs whose row already has evaluation results in this run. Used when resuming."""
+    skipped = 0
+    for job in jobs:
+        if EvaluationMetadata(job.agent_id, job.task.name, job.task_row['name'], benchmark_start).is_complete:
+            skipped += 1
+            continue
+        yield job
+    print(f"Skipped {skipped} completed jobs")
+
+
+def _job_result(job: BenchmarkJob, outcome: Any) -> Any:
+    if isinstance(outcome, Exception):
+        # One broken row shouldn't take down the rest of the sweep.
+        print(f"Job {job.name} failed")
+        traceback.print_exception(outcome)
+    return outcome
+
+
+def _in_job_order(indexed_results: List[Tuple[int, str, Any]]) -> List[Tuple[str, Any]]:
+    return [(name, result) for _i, name, result in sorted(indexed_results, key=lambda entry: entry[0])]
+
+
+def run_jobs(jobs: Iterable[BenchmarkJob], benchmark_start: datetime, max_workers=4,
+             max_generation_concurrency=2, max_evaluation_concurrency=2,
+             max_queued_outputs=None) -> List[Tuple[str, Any]]:
+    """
+    Runs jobs as a generate -> evaluate pipeline (see utils/pipeline.py).
+    max_generation_concurrency threads run the agents (LLM calls) and hand their output to
+    max_evaluation_concurrency threads building and evaluating it (Docker), through a queue of at most
+    max_queued_outputs (defaults to max_evaluation_concurrency). Rows generate while earlier rows are evaluated,
+    so a run takes about as long as the slower stage instead of both. When evaluation falls behind, generation waits.
+    max_workers stands in for the limits that aren't set.
+    jobs can be a generator (see expand_matrix), it's read as generation gets to it and jobs are dropped once
+    evaluated. Returns (job name, eval_results) pairs in job order. Failed jobs are logged and have the raised
+    exception as their result.
+    """
+
+    def generate(job: BenchmarkJob):
+        print(f"Evaluating agent {job.agent_id} on task {job.task.name} row {job.task_row['name']}")
+        return generate_task_output(
+            job.agent_id, job.agent_runnable, job.task, job.task_row, benchmark_start, model=job.model
+        )
+
+    def evaluate(job: BenchmarkJob, generated):
+        eval_metadata, task_output = generated
+        return evaluate_task_output(eval_metadata, job.task, task_output, job.expected)
+
+    pipeline = run_pipeline(
+        jobs, generate, evaluate,
+        generation_workers=max_generation_concurrency or max_workers,
+        evaluation_workers=max_evaluation_concurrency or max_workers,
+        max_queued=max_queued_outputs,
+    )
+    return _in_job_order([(i, job.name, _job_result(job, outcome)) for i, job, outcome in pipeline])
+
+
+async def arun_jobs(jobs: Iterable[BenchmarkJob], benchmark_start: datetime, provider_concurrency=None,
+                    max_evaluation_concurrency=2, max_queued_outputs=None) -> List[Tuple[str, Any]]:
+    """
+    Runs jobs concurrently on one event loop, as a generate -> evaluate pipeline like run_jobs.
+    Generation is limited per model provider (see DEFAULT_PROVIDER_CONCURRENCY), evaluation by max_evaluation_concurrency.
+    A row keeps its provider slot until its output is queued for evaluation (at most max_queued_outputs).
+    Jobs are read ahead only as far as every provider's slots (see arun_pipeline's max_in_flight).
+    """
+    provider_concurrency = {**DEFAULT_PROVIDER_CONCURRENCY, **(provider_concurrency or {})}
+    generation_slots = {}
+
+    def provider_slots(job: BenchmarkJob):
+        if job.provider not in generation_slots:
+            generation_slots[job.provider] = asyncio.Semaphore(provider_concurrency.get(job.provider, 4))
+        return generation_slots[job.provider]
+
+    async def agenerate(job: BenchmarkJob):
+        print(f"Evaluating agent {job.agent_id} on task {job.task.name} row {job.task_row['name']}")
+        return await agenerate_task_output(
+            job.agent_id, job.agent_runnable, job.task, job.task_row, benchmark_start, model=job.model
+        )
+
+    async def aevaluate(job: BenchmarkJob, generated):
+        eval_metadata, task_output = generated
+        return await aevaluate_task_output(eval_metadata, job.task, task_output, job.expected)
+
+    pipeline = arun_pipeline(
+        jobs, agenerate, aevaluate,
+        generation_slot=provider_slots,
+        evaluation_workers=max_evaluation_concurrency,
+        max_queued=max_queued_outputs,
+        max_in_flight=sum(provider_concurrency.values()),
+    )
+    return _in_job_order([(i, job.name, _job_result(job, outcome)) async for i, job, outcome in pipeline])
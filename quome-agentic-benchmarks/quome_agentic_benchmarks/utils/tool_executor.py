@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional, Callable, Dict, Any, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+from quome_agentic_benchmarks.utils.tracing import span
+
+# Tool execution settings, see .env.example
+# QUOME_TOOL_CACHE: "on" (default) or "off". QUOME_TOOL_BACKEND: "live" (default) or "offline", which only answers
+# from the cache and the tools' local stand-ins, so runs don't need network access or API keys.
+TOOL_CACHE_MODE = os.environ.get("QUOME_TOOL_CACHE", "on")
+TOOL_CACHE_DIR = os.environ.get("QUOME_TOOL_CACHE_DIR", os.path.join(os.getcwd(), ".tool_cache"))
+TOOL_BACKEND = os.environ.get("QUOME_TOOL_BACKEND", "live")
+DEFAULT_TOOL_TTL = 24 * 3600  # Seconds
+MAX_MEMORY_ENTRIES = 10_000  # The disk cache has the rest
+
+
+class RateLimiter:
+    """
+    Token bucket, rate calls per second with bursts of up to burst calls. acquire() blocks until the call may go out.
+    Waiting callers reserve their slot, so they go out in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Returns the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ToolExecutor:
+    """
+    Runs tool calls with
+    - a TTL cache, in memory and on disk (cache_dir, None for memory only), keyed on the tool name and arguments.
+      Identical calls from other rows, revisions and later runs are answered without calling the tool.
+    - single flight, identical calls made while one is running wait for its result instead of going out again
+    - per tool rate limits
+    - an offline backend, which answers from the cache or the tool's local stand-in (if it has one)
+    Errors aren't cached.
+
+    >>> from langchain_core.tools import tool
+    >>> calls = []
+    >>> @managed_tool(executor=ToolExecutor(cache_dir=None))
+    ... @tool
+    ... def shout(text: str) -> str:
+    ...     '''Shouts the text'''
+    ...     time.sleep(0.2)
+    ...     calls.append(text)
+    ...     return text.upper()
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(4) as pool:
+    ...     list(pool.map(shout.invoke, [{"text": "hi"}] * 4))
+    ['HI', 'HI', 'HI', 'HI']
+    >>> shout.invoke({"text": "hi"}), shout.invoke({"text": "bye"}), calls
+    ('HI', 'BYE', ['hi', 'bye'])
+    """
+
+    def __init__(self, cache_dir: Optional[str] = TOOL_CACHE_DIR, backend: str = TOOL_BACKEND,
+                 cache: bool = TOOL_CACHE_MODE != "off"):
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.cache = cache
+        self._memory: Dict[str, Tuple[float, Any]] = {}  # key -> (expires, result)
+        self._in_flight: Dict[str, Future] = {}
+        self._rate_limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(tool_name: str, arguments: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps([tool_name, arguments], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._path(key), "r") as f:
+                    stored = json.load(f)
+                entry = (stored['expires'], stored['result'])
+            except (FileNotFoundError, ValueError, KeyError):
+                pass
+        if entry is None or entry[0] < now:
+            return False, None
+        with self._lock:
+            self._memory[key] = entry
+        return True, entry[1]
+
+    def _store(self, key: str, result: Any, ttl: float):
+        now = time.time()
+        with self._lock:
+            if len(self._memory) >= MAX_MEMORY_ENTRIES:
+                self._memory = {k: entry for k, entry in self._memory.items() if entry[0] >= now}
+                if len(self._memory) >= MAX_MEMORY_ENTRIES:
+                    self._memory.clear()
+            expires = now + ttl
+            self._memory[key] = (expires, result)
+        if not self.cache_dir:
+            return
+        try:
+            data = json.dumps({'expires': expires, 'result': result})
+        except TypeError:
+            return  # Not JSON, only cached in memory
+        path = self._path(key)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def set_rate_limit(self, tool_name: str, rate: float, burst: int = 1):
+        self._rate_limiters[tool_name] = RateLimiter(rate, burst)
+
+    def run(self, tool_name: str, func: Callable[..., Any], arguments: Dict[str, Any], ttl: float = DEFAULT_TOOL_TTL,
+            offline: Optional[Callable[..., Any]] = None) -> Any:
+        """Calls func(**arguments) for the tool, or answers from the cache / an identical call in flight"""
+        key = self.key(tool_name, arguments)
+        if self.cache:
+            hit, result = self._lookup(key)
+            if hit:
+                with span(f"tool {tool_name}", "tool", cached=True):
+                    return result
+
+        if self.backend == "offline":
+            if offline is None:
+                return f"{tool_name} isn't available offline (QUOME_TOOL_BACKEND=offline)"
+            with span(f"tool {tool_name}", "tool", offline=True):
+                return offline(**arguments)  # Stand-in results aren't cached, a live run should replace them
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = Future()
+        if not leader:
+            with span(f"tool {tool_name}", "tool", deduplicated=True):
+                return in_flight.result()
+
+        try:
+            with span(f"tool {tool_name}", "tool", cached=False) as span_args:
+                rate_limiter = self._rate_limiters.get(tool_name)
+                if rate_limiter:
+                    span_args['rate_limit_wait'] = rate_limiter.acquire()
+                result = func(**arguments)
+            if self.cache:
+                self._store(key, result, ttl)
+            in_flight.set_result(result)
+            return result
+        except BaseException as e:
+            in_flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+_tool_executor: Optional[ToolExecutor] = None
+_tool_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ToolExecutor:
+    """Executor shared by the managed tools in tools.py"""
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ToolExecutor()
+    return _tool_executor
+
+
+def managed_tool(ttl: float = DEFAULT_TOOL_TTL, rate_limit: Optional[float] = None, burst: int = 1,
+                 offline: Optional[Callable[..., Any]] = None, executor: Optional[ToolExecutor] = None):
+    """
+    Decorator running a @tool through a ToolExecutor (the shared one by default), see ToolExecutor.
+    rate_limit is in calls per second, offline is the tool's stand-in for QUOME_TOOL_BACKEND=offline.
+
+    @managed_tool(ttl=3600, rate_limit=1, offline=local_search)
+    @tool
+    def web_search(query: str) -> str:
+        ...
+    """
+
+    def decorator(wrapped: BaseTool) -> BaseTool:
+        if not isinstance(wrapped, StructuredTool) or wrapped.func is None:
+            raise TypeError(f"managed_tool wraps sync @tool functions, got {wrapped!r}")
+        # Resolved on the first call, so tools.py can be imported without creating the cache directory
+        get_executor = (lambda: executor) if executor else get_tool_executor
+        configured = set()
+
+        def run(*args, **arguments):
+            # Single argument tools can be invoked with a plain string, which comes in positionally
+            arguments = {**dict(zip(wrapped.args, args)), **arguments}
+            tool_executor = get_executor()
+            if rate_limit and id(tool_executor) not in configured:
+                tool_executor.set_rate_limit(wrapped.name, rate_limit, burst)
+                configured.add(id(tool_executor))
+            return tool_executor.run(wrapped.name, wrapped.func, arguments, ttl=ttl, offline=offline)
+
+        return StructuredTool(
+            name=wrapped.name,
+            description=wrapped.description,
+            args_schema=wrapped.args_schema,
+            func=run,
+            return_direct=wrapped.return_direct,
+        )
+
+    return decorator
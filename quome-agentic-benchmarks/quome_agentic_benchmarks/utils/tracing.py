@@ -0,0 +1,199 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterable
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Tracer of the row currently being worked on. Set with tracer.activate()
+_current_tracer: ContextVar[Optional['Tracer']] = ContextVar("quome_current_tracer", default=None)
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+class Tracer:
+    """
+    Collects timing spans for one benchmark row and writes them in the Chrome trace event format.
+    Open the trace.json in chrome://tracing or https://ui.perfetto.dev
+    See https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, category: str, start_us: int, end_us: int, thread_id: Optional[int] = None,
+                 args: Optional[Dict[str, Any]] = None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",  # Complete event, has a start and a duration
+            "ts": start_us,
+            "dur": max(end_us - start_us, 0),
+            "pid": os.getpid(),
+            "tid": thread_id or threading.get_native_id(),
+            "args": args or {},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "benchmark", **args):
+        start = _now_us()
+        try:
+            yield args  # Callers can add args (e.g. a status code) while the span is open
+        finally:
+            self.add_span(name, category, start, _now_us(), args=args)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes this the tracer used by span() in the current thread / task"""
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    def dump(self, path: str, metadata: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e["ts"])
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "metadata": metadata or {}}, f, default=str)
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "benchmark", **args):
+    """
+    Times a block as part of the current row's trace. Does nothing when no tracer is active.
+    with span("docker_build", "docker", tag=tag):
+        ...
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, category, **args) as span_args:
+        yield span_args
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextlib.contextmanager
+def shared_span(tracers: Iterable[Optional[Tracer]], name: str, category: str = "benchmark", **args):
+    """
+    Like span(), but recorded in each of the tracers, for work done once on behalf of several rows
+    (e.g. a batched LLM call, see utils/llm_batch.py).
+    """
+    start = _now_us()
+    try:
+        yield args
+    finally:
+        end = _now_us()
+        unique = {id(tracer): tracer for tracer in tracers if tracer is not None}
+        for tracer in unique.values():
+            tracer.add_span(name, category, start, end, args=dict(args))
+
+
+class NodeTrackingCallbackHandler(BaseCallbackHandler):
+    """
+    Keeps track of the run tree of a graph, so nested runs (e.g. LLM calls) can be attributed to their graph node.
+    Base class for the callback handlers collecting per-node data.
+    """
+
+    def __init__(self, node_names: Iterable[str]):
+        self.node_names = set(node_names)
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._names: Dict[UUID, str] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, run_id: UUID, parent_run_id: Optional[UUID], name: str):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            self._names[run_id] = name
+
+    def node_for_run(self, run_id: Optional[UUID]) -> Optional[str]:
+        """Name of the graph node a (nested) run belongs to"""
+        with self._lock:
+            while run_id is not None:
+                if self._names.get(run_id) in self.node_names:
+                    return self._names[run_id]
+                run_id = self._parents.get(run_id)
+        return None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        self._remember(run_id, parent_run_id, name)
+        if name in self.node_names:
+            self.on_node_start(name, run_id)
+
+    def on_node_start(self, name: str, run_id: UUID):
+        pass
+
+
+def model_name(serialized, invocation_params) -> str:
+    params = invocation_params or {}
+    return params.get("model") or params.get("model_name") or (serialized or {}).get("name", "llm")
+
+
+class TraceCallbackHandler(NodeTrackingCallbackHandler):
+    """
+    Records a span for each LangGraph node and each LLM call made by an agent graph.
+    Pass in the graph config: {"callbacks": [TraceCallbackHandler(tracer, node_names)]}
+    """
+
+    def __init__(self, tracer: Tracer, node_names: Iterable[str]):
+        super().__init__(node_names)
+        self.tracer = tracer
+        self._runs: Dict[UUID, dict] = {}
+
+    def _start(self, run_id: UUID, name: str, category: str, args=None):
+        with self._lock:
+            self._runs[run_id] = {
+                "name": name, "cat": category, "start": _now_us(),
+                "tid": threading.get_native_id(), "args": args or {},
+            }
+
+    def _end(self, run_id: UUID, **args):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.tracer.add_span(run["name"], run["cat"], run["start"], _now_us(), thread_id=run["tid"],
+                             args={**run["args"], **args})
+
+    def on_node_start(self, name: str, run_id: UUID):
+        self._start(run_id, name, "node")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    def _on_model_start(self, serialized, run_id, parent_run_id, kwargs):
+        model = model_name(serialized, kwargs.get("invocation_params"))
+        self._remember(run_id, parent_run_id, f"llm:{model}")
+        self._start(run_id, f"llm:{model}", "llm", args={
+            "model": model,
+            "node": self.node_for_run(parent_run_id),
+        })
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._on_model_start(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._on_model_start(serialized, run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
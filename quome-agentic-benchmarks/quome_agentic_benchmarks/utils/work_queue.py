@@ -0,0 +1,244 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable
+
+# Job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class LeasedJob:
+    id: str
+    pool: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+class WorkQueue:
+    """
+    Durable queue of benchmark jobs, shared by a coordinator and workers on any number of machines.
+    Workers lease a job for lease_seconds and keep the lease alive with heartbeat(). When a worker dies its lease
+    expires and the job goes back on the queue, until it has used up max_attempts.
+    Jobs are routed by pool (e.g. "generate" on GPU nodes, "evaluate" on Docker nodes).
+    Backends implement the methods below, see SqliteWorkQueue.
+    """
+
+    def put(self, pool: str, job_id: str, payload: Dict[str, Any], max_attempts: int = 3) -> bool:
+        """Adds a job. Job ids are unique, putting an existing id again does nothing and returns False."""
+        raise NotImplementedError
+
+    def lease(self, pools: Iterable[str], worker_id: str, lease_seconds: float) -> Optional[LeasedJob]:
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extends a lease. False when the worker lost it (expired and leased by another worker)."""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> bool:
+        raise NotImplementedError
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Puts the job back on the queue, or marks it failed once it has used up its attempts"""
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Number of jobs per pool and state"""
+        raise NotImplementedError
+
+    def results(self, pool: str) -> List[Dict[str, Any]]:
+        """Finished jobs of a pool with their payload, result and error"""
+        raise NotImplementedError
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    WorkQueue in a SQLite file, for workers on a single host (any number of worker processes).
+    Leases are taken in an IMMEDIATE transaction, so only one worker gets each job. That relies on SQLite's file
+    locking, which isn't reliable on network shares (NFS, SMB), where two workers could lease the same job.
+    Don't share the file between machines, workers on several hosts need a backend on a database server.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                pool TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_pool_state ON jobs (pool, state, created);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, the worker's heartbeat runs on its own thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def put(self, pool, job_id, payload, max_attempts=3):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, pool, payload, state, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, pool, json.dumps(payload), QUEUED, max_attempts, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float):
+        conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+            "worker = NULL, error = 'Lease expired', updated = ? WHERE state = ? AND lease_expires < ?",
+            (FAILED, QUEUED, now, LEASED, now),
+        )
+
+    def lease(self, pools, worker_id, lease_seconds):
+        pools = list(pools)
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                f"SELECT id, pool, payload, attempts FROM jobs WHERE state = ? "
+                f"AND pool IN ({','.join('?' * len(pools))}) ORDER BY created LIMIT 1",
+                (QUEUED, *pools),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (LEASED, worker_id, now + lease_seconds, now, row['id']),
+            )
+        return LeasedJob(row['id'], row['pool'], json.loads(row['payload']), row['attempts'] + 1)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                (now + lease_seconds, now, job_id, worker_id, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                (DONE, json.dumps(result, default=str), time.time(), job_id, worker_id, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+                "worker = NULL, error = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                (FAILED, QUEUED, error, time.time(), job_id, worker_id, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def counts(self):
+        with self._transaction() as conn:
+            self._requeue_expired(conn, time.time())
+            rows = conn.execute("SELECT pool, state, COUNT(*) AS n FROM jobs GROUP BY pool, state").fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['pool'], {})[row['state']] = row['n']
+        return counts
+
+    def results(self, pool):
+        rows = self._conn().execute(
+            "SELECT id, state, payload, result, error, attempts FROM jobs WHERE pool = ? AND state IN (?, ?) "
+            "ORDER BY id",
+            (pool, DONE, FAILED),
+        ).fetchall()
+        return [{
+            'id': row['id'],
+            'state': row['state'],
+            'payload': json.loads(row['payload']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'attempts': row['attempts'],
+        } for row in rows]
+
+
+# Queue backends by url scheme, e.g. sqlite:///benchmark_results/work_queue.sqlite. Register other backends here,
+# a multi-host one needs a database server with row locks (e.g. Postgres, SELECT ... FOR UPDATE SKIP LOCKED).
+QUEUE_BACKENDS = {
+    "sqlite": SqliteWorkQueue,
+}
+
+DEFAULT_QUEUE_URL = os.environ.get("QUOME_WORK_QUEUE", "sqlite:///benchmark_results/work_queue.sqlite")
+
+
+def get_work_queue(url: str = DEFAULT_QUEUE_URL) -> WorkQueue:
+    scheme, _, location = url.partition("://")
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown work queue backend {scheme!r}, expected one of {list(QUEUE_BACKENDS)}")
+    # sqlite:///relative/path and sqlite:////absolute/path, like SQLAlchemy urls
+    return QUEUE_BACKENDS[scheme](location[1:] if location.startswith("/") else location)
+
+
+class Heartbeat:
+    """
+    Keeps a job's lease alive from a background thread while the job runs.
+    with Heartbeat(queue, job, worker_id, lease_seconds) as heartbeat:
+        ...
+    heartbeat.lost is set if the lease expired anyway (e.g. the machine was suspended).
+    """
+
+    def __init__(self, queue: WorkQueue, job: LeasedJob, worker_id: str, lease_seconds: float):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job.id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.job.id, self.worker_id, self.lease_seconds):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,202 @@
+"""
+Distributed benchmark runs: a coordinator puts (task, agent, model, row) jobs on a work queue, workers on any
+number of machines lease and run them. Generation and evaluation are separate jobs in separate pools, so
+generation can run on GPU / Ollama nodes and evaluation on Docker nodes.
+
+    # Coordinator, prints the run's timestamp
+    python worker.py enqueue --model llama3 --agent example_ollama_agent --task prompt_to_api --tool create_api_template
+    # GPU node
+    python worker.py work --pool generate
+    # Docker node
+    python worker.py work --pool evaluate
+    # Progress
+    python worker.py status
+
+The queue defaults to QUOME_WORK_QUEUE (sqlite:///benchmark_results/work_queue.sqlite), see utils/work_queue.py.
+The SQLite queue is for workers on one host, see SqliteWorkQueue.
+Run several worker processes on a machine for more concurrency.
+"""
+import argparse
+import os
+import socket
+import time
+import traceback
+from dataclasses import asdict
+from datetime import datetime
+from typing import List, Optional, Iterable
+
+from quome_agentic_benchmarks.registry import AGENTS, TASKS, TOOLS, matrix_cells
+from quome_agentic_benchmarks.tasks.base import generate_task_output, evaluate_task_output
+from quome_agentic_benchmarks.utils.benchmark import get_checkpointer, parse_benchmark_start, EvaluationMetadata, \
+    BENCHMARK_TIMESTAMP_FORMAT
+from quome_agentic_benchmarks.utils.coding import code_input_to_json, code_input_from_json
+from quome_agentic_benchmarks.utils.llm_metrics import LLMCall
+from quome_agentic_benchmarks.utils.scheduler import job_agent_id
+from quome_agentic_benchmarks.utils.work_queue import WorkQueue, LeasedJob, Heartbeat, get_work_queue, \
+    DEFAULT_QUEUE_URL
+
+GENERATE_POOL = "generate"
+EVALUATE_POOL = "evaluate"
+
+
+def enqueue_benchmark(queue: WorkQueue, model_names, tool_names, task_names, agent_names, resume=None,
+                      row_names=None, row_tags=None, max_attempts=3) -> str:
+    """
+    Puts a generate job on the queue for every (task, agent, model, row) the agent supports. Returns the run's
+    timestamp. Enqueueing the same run again (resume) only adds jobs that aren't on the queue yet.
+    """
+    benchmark_start = parse_benchmark_start(resume) if resume else datetime.now()
+    run = benchmark_start.strftime(BENCHMARK_TIMESTAMP_FORMAT)
+    tools = TOOLS.load(tool_names)
+
+    added = 0
+    agent_ids = {}  # (agent, model) -> agent id, the graph is only built for its name
+    for task_name, agent_name, model in matrix_cells(task_names, agent_names, model_names):
+        if (agent_name, model) not in agent_ids:
+            agent_to_test = AGENTS.get(agent_name).load().agent(llm=model, tools=tools)
+            agent_ids[agent_name, model] = job_agent_id(model, agent_to_test) if agent_to_test else None
+        agent_id = agent_ids[agent_name, model]
+        if not agent_id:
+            # The agent turned the model down
+            continue
+        task = TASKS.get(task_name).load()
+        for task_row, _expected in task.dataset.select(row_names, row_tags).rows:
+            payload = {
+                'run': run, 'task': task_name, 'agent': agent_name, 'agent_id': agent_id, 'model': model,
+                'tools': list(tool_names), 'row': task_row['name'],
+            }
+            added += queue.put(GENERATE_POOL, f"{run}/{task.name}/{agent_id}/{task_row['name']}", payload,
+                               max_attempts=max_attempts)
+    print(f"Enqueued {added} jobs for run {run}")
+    return run
+
+
+class Worker:
+    """Leases jobs from the given pools and runs them, one at a time"""
+
+    def __init__(self, queue: WorkQueue, pools: Iterable[str], worker_id: Optional[str] = None,
+                 lease_seconds: float = 300, poll_interval: float = 5):
+        self.queue = queue
+        self.pools = list(pools)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._graphs = {}  # (run, agent, model) -> agent graph, built once per worker
+
+    def _task_and_row(self, payload):
+        task = TASKS.get(payload['task']).load()
+        task_row, expected = next(iter(task.dataset.select(names=[payload['row']]).rows))
+        return task, task_row, expected
+
+    def _agent_graph(self, payload, benchmark_start: datetime):
+        key = (payload['run'], payload['agent'], payload['model'])
+        if key not in self._graphs:
+            self._graphs[key] = AGENTS.get(payload['agent']).load().agent(
+                llm=payload['model'],
+                tools=TOOLS.load(payload['tools']),
+                # A job requeued to this machine continues where it stopped. Checkpoints are in a SQLite file on
+                # this host, a job picked up by another machine starts over.
+                checkpointer=get_checkpointer(benchmark_start)
+            )
+        return self._graphs[key]
+
+    def generate(self, job: LeasedJob):
+        """Runs the agent on the row and queues its evaluation"""
+        payload = job.payload
+        benchmark_start = parse_benchmark_start(payload['run'])
+        task, task_row, _expected = self._task_and_row(payload)
+        eval_metadata, task_output = generate_task_output(
+            payload['agent_id'], self._agent_graph(payload, benchmark_start), task, task_row, benchmark_start,
+            model=payload['model']
+        )
+        # The evaluation may run on another machine, hand over everything it adds to the results.
+        self.queue.put(EVALUATE_POOL, f"{job.id}/evaluate", {
+            **payload,
+            'task_output': code_input_to_json(task_output),
+            'start_time': eval_metadata.start_time.isoformat() if eval_metadata.start_time else None,
+            'end_time': eval_metadata.end_time.isoformat() if eval_metadata.end_time else None,
+            'llm_calls': [asdict(call) for call in eval_metadata.llm_usage.calls],
+            'trace_events': eval_metadata.tracer.events,
+        })
+        return {'generation_seconds': eval_metadata.generation_seconds}
+
+    def evaluate(self, job: LeasedJob):
+        payload = job.payload
+        task, _task_row, expected = self._task_and_row(payload)
+        eval_metadata = EvaluationMetadata(
+            payload['agent_id'], task.name, payload['row'], parse_benchmark_start(payload['run']),
+            start_time=datetime.fromisoformat(payload['start_time']) if payload.get('start_time') else None,
+            end_time=datetime.fromisoformat(payload['end_time']) if payload.get('end_time') else None,
+            model=payload['model'],
+            dataset_version=task.dataset.content_hash,
+        )
+        for call in payload.get('llm_calls', []):
+            eval_metadata.llm_usage.record(LLMCall(**call))
+        eval_metadata.tracer.events.extend(payload.get('trace_events', []))
+        return evaluate_task_output(eval_metadata, task, code_input_from_json(payload['task_output']), expected)
+
+    def run_job(self, job: LeasedJob):
+        print(f"[{self.worker_id}] Running {job.pool} job {job.id} (attempt {job.attempts})")
+        handler = self.generate if job.pool == GENERATE_POOL else self.evaluate
+        with Heartbeat(self.queue, job, self.worker_id, self.lease_seconds) as heartbeat:
+            try:
+                result = handler(job)
+            except Exception:
+                traceback.print_exc()
+                self.queue.fail(job.id, self.worker_id, traceback.format_exc())
+                return
+        if heartbeat.lost:
+            print(f"[{self.worker_id}] Lost the lease on {job.id}, it was requeued")
+            return
+        self.queue.complete(job.id, self.worker_id, result)
+
+    def run(self, max_jobs: Optional[int] = None, exit_when_idle: bool = False):
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            job = self.queue.lease(self.pools, self.worker_id, self.lease_seconds)
+            if job is None:
+                if exit_when_idle:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self.run_job(job)
+            done += 1
+
+
+def _parse_args(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Distributed benchmark runs")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_URL, help="Work queue url, e.g. sqlite:///path/queue.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue every (task, agent, model, row) of a benchmark")
+    enqueue.add_argument("--model", action="append", dest="models", required=True)
+    enqueue.add_argument("--agent", action="append", dest="agents", required=True)
+    enqueue.add_argument("--task", action="append", dest="tasks", required=True)
+    enqueue.add_argument("--tool", action="append", dest="tools", default=[])
+    enqueue.add_argument("--row", action="append", dest="rows", help="Only queue dataset rows with this name")
+    enqueue.add_argument("--tag", action="append", dest="tags", help="Only queue dataset rows with this tag")
+    enqueue.add_argument("--resume", metavar="TIMESTAMP", help="Add missing jobs to an existing run")
+
+    work = commands.add_parser("work", help="Lease and run jobs")
+    work.add_argument("--pool", action="append", dest="pools", choices=[GENERATE_POOL, EVALUATE_POOL],
+                      help="Pools to take jobs from, defaults to both")
+    work.add_argument("--lease-seconds", type=float, default=300)
+    work.add_argument("--exit-when-idle", action="store_true")
+
+    commands.add_parser("status", help="Job counts per pool and state")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    queue = get_work_queue(args.queue)
+    if args.command == "enqueue":
+        enqueue_benchmark(queue, args.models, args.tools, args.tasks, args.agents, resume=args.resume,
+                          row_names=args.rows, row_tags=args.tags)
+    elif args.command == "work":
+        Worker(queue, args.pools or [GENERATE_POOL, EVALUATE_POOL], lease_seconds=args.lease_seconds).run(
+            exit_when_idle=args.exit_when_idle
+        )
+    elif args.command == "status":
+        for pool, counts in sorted(queue.counts().items()):
+            print(f"{pool}: {counts}")
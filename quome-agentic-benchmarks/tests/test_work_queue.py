@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from quome_agentic_benchmarks.utils.work_queue import SqliteWorkQueue, Heartbeat, QUEUED, LEASED, DONE, FAILED
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SqliteWorkQueue(str(tmp_path / "work_queue.sqlite"))
+
+
+def expire_leases():
+    # Leases taken with lease_seconds=0 expire as soon as the clock moves on
+    time.sleep(0.01)
+
+
+def test_only_one_worker_gets_a_job(tmp_path):
+    path = str(tmp_path / "work_queue.sqlite")
+    SqliteWorkQueue(path).put("generate", "row-1", {"row": 1})
+
+    # Every worker with its own queue (own connection), like separate worker processes
+    workers = 8
+    start = threading.Barrier(workers)
+    leased = []
+
+    def worker(i):
+        queue = SqliteWorkQueue(path)
+        start.wait()
+        job = queue.lease(["generate"], f"worker-{i}", lease_seconds=60)
+        if job:
+            leased.append((f"worker-{i}", job))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(leased) == 1
+    worker_id, job = leased[0]
+    assert (job.id, job.payload, job.attempts) == ("row-1", {"row": 1}, 1)
+    assert SqliteWorkQueue(path).lease(["generate"], "late-worker", lease_seconds=60) is None
+
+
+def test_lease_only_takes_jobs_of_the_given_pools(queue):
+    queue.put("evaluate", "row-1", {})
+    assert queue.lease(["generate"], "gpu-worker", lease_seconds=60) is None
+    assert queue.lease(["generate", "evaluate"], "docker-worker", lease_seconds=60).pool == "evaluate"
+
+
+def test_expired_lease_is_requeued_then_fails_after_max_attempts(queue):
+    queue.put("generate", "row-1", {}, max_attempts=2)
+
+    first = queue.lease(["generate"], "worker-a", lease_seconds=0)
+    assert first.attempts == 1
+    expire_leases()
+    assert queue.counts() == {"generate": {QUEUED: 1}}
+
+    second = queue.lease(["generate"], "worker-b", lease_seconds=0)
+    assert (second.id, second.attempts) == ("row-1", 2)
+    expire_leases()
+    assert queue.counts() == {"generate": {FAILED: 1}}
+    assert queue.lease(["generate"], "worker-c", lease_seconds=60) is None
+
+    [result] = queue.results("generate")
+    assert (result['state'], result['attempts'], result['error']) == (FAILED, 2, "Lease expired")
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    queue.put("generate", "row-1", {}, max_attempts=2)
+
+    queue.lease(["generate"], "worker-a", lease_seconds=60)
+    assert queue.fail("row-1", "worker-a", "boom")
+    assert queue.counts() == {"generate": {QUEUED: 1}}
+
+    queue.lease(["generate"], "worker-a", lease_seconds=60)
+    assert queue.fail("row-1", "worker-a", "boom again")
+    [result] = queue.results("generate")
+    assert (result['state'], result['error']) == (FAILED, "boom again")
+
+
+def test_worker_that_lost_its_lease_cannot_heartbeat_or_complete(queue):
+    queue.put("generate", "row-1", {})
+
+    queue.lease(["generate"], "worker-a", lease_seconds=0)
+    expire_leases()
+    assert queue.lease(["generate"], "worker-b", lease_seconds=60).id == "row-1"
+
+    assert not queue.heartbeat("row-1", "worker-a", lease_seconds=60)
+    assert not queue.complete("row-1", "worker-a", {"points": 1})
+    assert not queue.fail("row-1", "worker-a", "boom")
+    assert queue.counts() == {"generate": {LEASED: 1}}
+
+    assert queue.heartbeat("row-1", "worker-b", lease_seconds=60)
+    assert queue.complete("row-1", "worker-b", {"points": 2})
+    [result] = queue.results("generate")
+    assert (result['state'], result['result']) == (DONE, {"points": 2})
+
+    # Done jobs can't be completed again either
+    assert not queue.complete("row-1", "worker-b", {"points": 3})
+
+
+def test_heartbeat_keeps_the_lease_and_notices_when_it_is_lost(queue):
+    queue.put("generate", "row-1", {})
+    job = queue.lease(["generate"], "worker-a", lease_seconds=0.3)
+
+    with Heartbeat(queue, job, "worker-a", lease_seconds=0.3) as heartbeat:
+        time.sleep(0.6)  # Longer than the lease, the heartbeat extends it
+        assert queue.lease(["generate"], "worker-b", lease_seconds=60) is None
+    assert not heartbeat.lost
+
+    time.sleep(0.4)  # No heartbeat anymore, the lease runs out
+    assert queue.lease(["generate"], "worker-b", lease_seconds=60).id == "row-1"
+    with Heartbeat(queue, job, "worker-a", lease_seconds=0.03) as heartbeat:
+        time.sleep(0.1)
+    assert heartbeat.lost
+
+
+def test_putting_a_job_again_does_nothing(queue):
+    assert queue.put("generate", "row-1", {"row": 1}, max_attempts=3)
+    job = queue.lease(["generate"], "worker-a", lease_seconds=60)
+
+    # E.g. the coordinator is restarted and enqueues the run again
+    assert not queue.put("generate", "row-1", {"row": "changed"}, max_attempts=1)
+    assert not queue.put("evaluate", "row-1", {"row": "changed"})
+    assert queue.counts() == {"generate": {LEASED: 1}}
+
+    assert queue.complete(job.id, "worker-a", "ok")
+    assert not queue.put("generate", "row-1", {"row": 1})
+    [result] = queue.results("generate")
+    assert (result['state'], result['payload'], result['attempts']) == (DONE, {"row": 1}, 1)